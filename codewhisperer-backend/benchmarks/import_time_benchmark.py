@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Import-time guard for API worker cold starts.
+
+Imports src.main in fresh interpreters under `python -X importtime`, reports
+the slowest modules and fails when the import exceeds the time budget or when
+a module that should only load on first use shows up at import:
+
+    python benchmarks/import_time_benchmark.py --budget-ms 1500
+    python benchmarks/import_time_benchmark.py --output imports.json
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy dependencies that must be imported lazily, on first use
+DEFERRED_MODULES = ['google.generativeai', 'openai', 'PyPDF2', 'docx', 'openpyxl', 'pandas']
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def measure_once(module: str) -> dict:
+    """
+    Import a module in a fresh interpreter and parse its -X importtime report
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = PROJECT_ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    env.setdefault('DATABASE_URL', 'sqlite://')  # Keep table creation in memory
+
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=PROJECT_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+
+    modules = {}
+    total_us = 0
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        modules[name] = {'self_us': int(self_us), 'cumulative_us': int(cumulative_us)}
+        if name == module and not indent:
+            total_us = int(cumulative_us)
+
+    return {'total_us': total_us, 'modules': modules}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure and guard the import time of the API")
+    parser.add_argument('--module', default='src.main', help="Module to import (default src.main)")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters to sample; the fastest run is kept")
+    parser.add_argument('--budget-ms', type=float, default=1500.0, help="Maximum allowed import time")
+    parser.add_argument('--top', type=int, default=15, help="Slowest modules to list")
+    parser.add_argument('--output', help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    # Warm-up run so bytecode compilation is not counted
+    measure_once(args.module)
+    runs = [measure_once(args.module) for _ in range(max(args.runs, 1))]
+    best = min(runs, key=lambda run: run['total_us'])
+    total_ms = best['total_us'] / 1000
+
+    print(f"import {args.module}: best {total_ms:.1f} ms over {len(runs)} runs "
+          f"(median {sorted(run['total_us'] for run in runs)[len(runs) // 2] / 1000:.1f} ms)")
+    print("\nSlowest modules by cumulative time:")
+    slowest = sorted(best['modules'].items(), key=lambda item: item[1]['cumulative_us'], reverse=True)
+    for name, timing in slowest[:args.top]:
+        print(f"  {timing['cumulative_us'] / 1000:>9.1f} ms  {name}")
+
+    eager = [name for name in DEFERRED_MODULES if name in best['modules']]
+    failures = []
+    if eager:
+        failures.append(f"modules that should load on first use were imported eagerly: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"import took {total_ms:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'module': args.module,
+                'python': sys.version.split()[0],
+                'budget_ms': args.budget_ms,
+                'total_ms': [run['total_us'] / 1000 for run in runs],
+                'eager_deferred_modules': eager,
+                'slowest': [{'module': name, 'cumulative_ms': timing['cumulative_us'] / 1000}
+                            for name, timing in slowest[:args.top]]
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if failures:
+        for failure in failures:
+            print(f"\nFAIL: {failure}")
+        sys.exit(1)
+    print("\nOK: import time within budget")
+
+
+if __name__ == '__main__':
+    main()
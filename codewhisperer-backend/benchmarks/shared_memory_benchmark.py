@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Measure node memory as workers are added, with and without the shared-memory vector matrix.
+
+Starts N worker processes that each open the vector store and run a few
+searches, the way gunicorn workers would, then sums their proportional set
+size (PSS, which splits shared pages between the processes mapping them)
+together with the loader process in shared mode. Linux only:
+
+    python benchmarks/shared_memory_benchmark.py --size 50000 --dim 768 --workers 1 2 4
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+import tempfile
+
+import numpy as np
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.vector_db_benchmark import generate_corpus
+from src.services.vector_db_service import VectorDatabaseService
+from src.services.shared_vector_store_service import SharedVectorDatabaseService, segment_prefix_for
+
+
+def pss_bytes(pid: int) -> int:
+    """
+    Proportional set size of a process
+    """
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def find_loader_pid(storage_path: str) -> int:
+    prefix = segment_prefix_for(storage_path)
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f"/proc/{pid}/cmdline", 'rb') as f:
+                cmdline = f.read().split(b'\0')
+        except OSError:
+            continue
+        if b'src.services.shared_vector_loader' in cmdline and prefix.encode() in cmdline:
+            return int(pid)
+    return None
+
+
+def worker(mode: str, storage_path: str, dimension: int):
+    """
+    Open the store, warm it with searches, report readiness and idle until stdin closes
+    """
+    logging.disable(logging.INFO)
+    if mode == 'shared':
+        store = SharedVectorDatabaseService(storage_path=storage_path, autoload=False)
+        store.idle_timeout = 1  # Let the loader exit right after the run
+        store.load_vectors()
+    else:
+        store = VectorDatabaseService(storage_path=storage_path)
+    queries = np.random.default_rng(1).standard_normal((8, dimension)).tolist()
+    store.search_similar_batch(queries, 10)
+    print('ready', flush=True)
+    sys.stdin.read()
+    store.close()
+
+
+def run(mode: str, workers: int, storage_path: str, dimension: int) -> dict:
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker', mode,
+                          '--storage', storage_path, '--dim', str(dimension)],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.stdout.readline()
+    ready_seconds = time.perf_counter() - start
+
+    worker_bytes = [pss_bytes(process.pid) for process in processes]
+    loader_pid = find_loader_pid(storage_path) if mode == 'shared' else None
+    loader_bytes = pss_bytes(loader_pid) if loader_pid else 0
+
+    for process in processes:
+        process.stdin.close()
+        process.wait()
+    if loader_pid:
+        while os.path.exists(f"/proc/{loader_pid}"):
+            time.sleep(0.2)
+
+    total = sum(worker_bytes) + loader_bytes
+    return {
+        'mode': mode,
+        'workers': workers,
+        'ready_seconds': round(ready_seconds, 2),
+        'loader_mib': round(loader_bytes / 1024 / 1024, 1),
+        'worker_mib': [round(value / 1024 / 1024, 1) for value in worker_bytes],
+        'total_mib': round(total / 1024 / 1024, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark node memory per worker count")
+    parser.add_argument('--size', type=int, default=50000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--modes', nargs='+', default=['private', 'shared'], choices=['private', 'shared'])
+    parser.add_argument('--text-length', type=int, default=500)
+    parser.add_argument('--output', help="Write JSON results to this file")
+    parser.add_argument('--worker', choices=['private', 'shared'], help=argparse.SUPPRESS)
+    parser.add_argument('--storage', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.storage, args.dim)
+        return
+
+    logging.disable(logging.INFO)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        storage_path = os.path.join(workdir, 'vectors.pkl')
+        store = VectorDatabaseService(storage_path=storage_path)
+        store.add_vectors_batch(generate_corpus(args.size, args.dim, seed=0, text_length=args.text_length))
+        del store
+
+        for mode in args.modes:
+            for workers in args.workers:
+                result = run(mode, workers, storage_path, args.dim)
+                results.append(result)
+                print(f"{mode:>8} x{workers}: {result['total_mib']} MiB total "
+                      f"(loader {result['loader_mib']} MiB, workers {result['worker_mib']} MiB), "
+                      f"ready in {result['ready_seconds']}s", flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'size': args.size, 'dim': args.dim, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
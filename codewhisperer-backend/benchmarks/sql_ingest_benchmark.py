@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Compare SQL persistence strategies for ingested documents and chunks.
+
+Writes the same synthetic repository to a fresh SQLite file twice: once with
+the per-object ORM pattern (add each DocumentChunk, flush each Document for
+its id) and default pragmas, and once through DocumentStoreService with the
+tuned WAL configuration. Reports rows/s for both:
+
+    python benchmarks/sql_ingest_benchmark.py --files 200 --chunks-per-file 50
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+
+from flask import Flask
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.user import db
+from src.models.document import Document, DocumentChunk
+from src.services.document_store_service import DocumentStoreService, configure_sqlite_engine
+
+
+def generate_files(files: int, chunks_per_file: int, chunk_chars: int) -> list:
+    """
+    Generate (document row, [(chunk_text, metadata)], vector ids) per synthetic file
+    """
+    body = ('def handler(request):\n    return process(request)\n' * (chunk_chars // 48 + 1))[:chunk_chars]
+    generated = []
+    for f in range(files):
+        file_path = f"src/module_{f}.py"
+        document = {
+            'source_type': 'code',
+            'source_url': f"file://{file_path}",
+            'title': os.path.basename(file_path),
+            'content': body * chunks_per_file,
+            'doc_metadata': json.dumps({'repository': 'bench', 'language': 'python'}),
+            'file_path': file_path,
+            'repository': 'bench',
+            'branch': 'main'
+        }
+        chunks = [(body, {'file_path': file_path, 'chunk_index': c, 'source_type': 'code'})
+                  for c in range(chunks_per_file)]
+        vector_ids = [f"{f}-{c}" for c in range(chunks_per_file)]
+        generated.append((document, chunks, vector_ids))
+    return generated
+
+
+def create_app(database_path: str, tuned: bool) -> Flask:
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{database_path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        if tuned:
+            configure_sqlite_engine(db.engine)
+        db.create_all()
+    return app
+
+
+def write_orm(generated: list):
+    """
+    The per-object ORM pattern the ingest routes used before bulk persistence
+    """
+    for document, chunks, vector_ids in generated:
+        doc = Document(**document)
+        db.session.add(doc)
+        db.session.flush()
+        for i, (chunk_text, metadata) in enumerate(chunks):
+            db.session.add(DocumentChunk(
+                document_id=doc.id,
+                chunk_text=chunk_text,
+                chunk_index=i,
+                embedding_id=vector_ids[i],
+                chunk_metadata=json.dumps(metadata)
+            ))
+    db.session.commit()
+
+
+def write_bulk(generated: list):
+    store = DocumentStoreService(db)
+    store.write_documents([(document, store.build_chunk_rows(chunks, vector_ids))
+                           for document, chunks, vector_ids in generated])
+    db.session.commit()
+
+
+def run(mode: str, generated: list, workdir: str) -> dict:
+    database_path = os.path.join(workdir, f"{mode}.db")
+    app = create_app(database_path, tuned=(mode == 'bulk'))
+    rows = sum(1 + len(chunks) for _, chunks, _ in generated)
+
+    with app.app_context():
+        start = time.perf_counter()
+        (write_bulk if mode == 'bulk' else write_orm)(generated)
+        seconds = time.perf_counter() - start
+        stored = DocumentChunk.query.count()
+        db.session.remove()
+        db.engine.dispose()
+
+    return {'mode': mode, 'rows': rows, 'chunks_stored': stored,
+            'seconds': round(seconds, 3), 'rows_per_second': round(rows / seconds, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQL persistence of ingested chunks")
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--chunks-per-file', type=int, default=50)
+    parser.add_argument('--chunk-chars', type=int, default=800)
+    parser.add_argument('--modes', nargs='+', default=['orm', 'bulk'], choices=['orm', 'bulk'])
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    generated = generate_files(args.files, args.chunks_per_file, args.chunk_chars)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in args.modes:
+            result = run(mode, generated, workdir)
+            results.append(result)
+            print(f"{mode:>5}: {result['rows']} rows in {result['seconds']}s "
+                  f"({result['rows_per_second']} rows/s)", flush=True)
+
+    if len(results) == 2:
+        print(f"\nspeedup: {results[0]['seconds'] / results[1]['seconds']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for VectorDatabaseService on synthetic corpora.
+
+Each (size, dimension) configuration runs in a fresh process so RSS and load
+times are not polluted by earlier runs. Results are written as JSON and can be
+compared against a previous run to catch regressions:
+
+    python benchmarks/vector_db_benchmark.py --sizes 10000 100000 --output bench.json
+    python benchmarks/vector_db_benchmark.py --sizes 10000 --compare bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import platform
+import subprocess
+import tempfile
+import multiprocessing
+from datetime import datetime
+
+import numpy as np
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.vector_db_service import VectorDatabaseService
+from src.services.sharded_vector_db_service import ShardedVectorDatabaseService
+
+SOURCE_TYPES = ['code', 'documentation', 'slack']
+SOURCE_TYPE_WEIGHTS = [0.6, 0.3, 0.1]  # Gives one broad and one selective filter mode
+FILTER_MODES = [None, 'code', 'slack']
+VOCABULARY = ['request', 'handler', 'token', 'user', 'query', 'vector', 'index', 'service',
+              'config', 'deploy', 'error', 'retry', 'cache', 'database', 'session', 'module']
+
+# Metrics where a larger value is better; everything else is a cost
+HIGHER_IS_BETTER = {'insert_vectors_per_second', 'batch_queries_per_second'}
+
+
+def seed_for(name: str) -> int:
+    """
+    Derive a deterministic seed from a name via md5, so corpora are identical across runs
+    """
+    return int(hashlib.md5(name.encode()).hexdigest()[:8], 16)
+
+
+def generate_corpus(size: int, dimension: int, seed: int, text_length: int):
+    """
+    Generate a deterministic synthetic corpus as (text, embedding, metadata) batches
+    """
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((size, dimension), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    source_types = rng.choice(len(SOURCE_TYPES), size=size, p=SOURCE_TYPE_WEIGHTS)
+    words = rng.integers(0, len(VOCABULARY), size=(size, max(text_length // 8, 1)))
+
+    entries = []
+    for i in range(size):
+        text = f"chunk {i}: " + ' '.join(VOCABULARY[w] for w in words[i])
+        metadata = {
+            'source_type': SOURCE_TYPES[source_types[i]],
+            'title': f"Synthetic document {i // 10}",
+            'file_path': f"synthetic/file_{i // 10}.py",
+            'chunk_index': i % 10
+        }
+        entries.append((text[:text_length], embeddings[i].tolist(), metadata))
+    return entries
+
+
+def current_rss_bytes() -> int:
+    """
+    Resident set size of this process
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is KiB on Linux and bytes on macOS; this is the peak, not current
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def latency_summary(samples: list) -> dict:
+    """
+    Summarize latencies in milliseconds
+    """
+    values = np.asarray(samples) * 1000
+    return {
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3)
+    }
+
+
+def storage_size(path: str) -> int:
+    """
+    Bytes on disk for a storage file, or for every file in a shard directory
+    """
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def open_store(storage_path: str, shards: int):
+    if shards > 1:
+        return ShardedVectorDatabaseService(shards, storage_dir=storage_path)
+    return VectorDatabaseService(storage_path=storage_path)
+
+
+def run_configuration(config: dict) -> dict:
+    """
+    Benchmark one (size, dimension) configuration; runs in its own process
+    """
+    logging.disable(logging.INFO)
+    size, dimension = config['size'], config['dimension']
+    seed = seed_for(f"corpus-{size}-{dimension}-{config['seed']}")
+
+    entries = generate_corpus(size, dimension, seed, config['text_length'])
+    query_rng = np.random.default_rng(seed + 1)
+    queries = query_rng.standard_normal((config['queries'], dimension), dtype=np.float32).tolist()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        storage_path = os.path.join(workdir, 'vector_shards' if config['shards'] > 1 else 'vectors.pkl')
+        db = open_store(storage_path, config['shards'])
+
+        # Insert throughput, without persisting each batch
+        start = time.perf_counter()
+        for i in range(0, size, config['batch_size']):
+            db.add_vectors_batch(entries[i:i + config['batch_size']], persist=False)
+        insert_seconds = time.perf_counter() - start
+        del entries
+
+        # Persistence
+        start = time.perf_counter()
+        db.save_vectors()
+        persist_seconds = time.perf_counter() - start
+        file_size = storage_size(storage_path)
+        db.close()
+        del db
+
+        # Load into a fresh service
+        rss_before_load = current_rss_bytes()
+        start = time.perf_counter()
+        db = open_store(storage_path, config['shards'])
+        load_seconds = time.perf_counter() - start
+        rss_after_load = current_rss_bytes()
+
+        # The first search builds the search matrix; report it separately
+        start = time.perf_counter()
+        db.search_similar(queries[0], top_k=config['top_k'])
+        first_search_seconds = time.perf_counter() - start
+
+        search = {}
+        for mode in FILTER_MODES:
+            samples = []
+            for query in queries:
+                start = time.perf_counter()
+                db.search_similar(query, top_k=config['top_k'], source_type_filter=mode)
+                samples.append(time.perf_counter() - start)
+            search[mode or 'none'] = latency_summary(samples)
+
+        start = time.perf_counter()
+        db.search_similar_batch(queries, top_k=config['top_k'])
+        batch_seconds = time.perf_counter() - start
+        db.close()
+
+        return {
+            'size': size,
+            'dimension': dimension,
+            'shards': config['shards'],
+            'insert_seconds': round(insert_seconds, 4),
+            'insert_vectors_per_second': round(size / insert_seconds, 1) if insert_seconds else None,
+            'persist_seconds': round(persist_seconds, 4),
+            'storage_bytes': file_size,
+            'load_seconds': round(load_seconds, 4),
+            'rss_bytes': rss_after_load,
+            'rss_load_delta_bytes': rss_after_load - rss_before_load,
+            'first_search_seconds': round(first_search_seconds, 4),
+            'search': search,
+            'batch_search_seconds': round(batch_seconds, 4),
+            'batch_queries_per_second': round(len(queries) / batch_seconds, 1) if batch_seconds else None
+        }
+
+
+def git_commit() -> str:
+    """
+    Current commit hash, if available
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(result: dict, prefix: str = '') -> dict:
+    """
+    Flatten nested result dicts into dotted metric names
+    """
+    flat = {}
+    for key, value in result.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and key not in ('size', 'dimension', 'shards'):
+            flat[name] = value
+    return flat
+
+
+def compare(results: list, baseline_path: str, threshold: float) -> list:
+    """
+    Compare results against a baseline JSON file and return regressions
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    baseline_by_config = {(r['size'], r['dimension']): r for r in baseline['results']}
+
+    regressions = []
+    for result in results:
+        previous = baseline_by_config.get((result['size'], result['dimension']))
+        if not previous:
+            continue
+
+        current_metrics = flatten(result)
+        previous_metrics = flatten(previous)
+        print(f"\nsize={result['size']} dim={result['dimension']} vs {baseline.get('meta', {}).get('commit')}")
+        for name, value in sorted(current_metrics.items()):
+            old = previous_metrics.get(name)
+            if not old:
+                continue
+            change = (value - old) / old
+            worse = -change if name.split('.')[-1] in HIGHER_IS_BETTER else change
+            marker = '  REGRESSION' if worse > threshold else ''
+            print(f"  {name:40s} {old:>14} -> {value:>14} ({change:+.1%}){marker}")
+            if marker:
+                regressions.append({'size': result['size'], 'dimension': result['dimension'],
+                                    'metric': name, 'baseline': old, 'current': value})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VectorDatabaseService on synthetic corpora")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--dims', type=int, nargs='+', default=[768, 1536])
+    parser.add_argument('--queries', type=int, default=100, help="Search queries per filter mode")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=1000, help="Vectors per add_vectors_batch call")
+    parser.add_argument('--text-length', type=int, default=500, help="Characters of text per vector")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shards', type=int, default=1, help="Shard processes; above 1 benchmarks the sharded store")
+    parser.add_argument('--output', help="Write JSON results to this file")
+    parser.add_argument('--compare', help="Baseline JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Relative slowdown reported as a regression (default 20%%)")
+    args = parser.parse_args()
+
+    configs = [{
+        'size': size,
+        'dimension': dimension,
+        'queries': args.queries,
+        'top_k': args.top_k,
+        'batch_size': args.batch_size,
+        'text_length': args.text_length,
+        'seed': args.seed,
+        'shards': args.shards
+    } for size in args.sizes for dimension in args.dims]
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for config in configs:
+        print(f"Benchmarking size={config['size']} dim={config['dimension']}...", flush=True)
+        with context.Pool(processes=1) as pool:
+            result = pool.apply(run_configuration, (config,))
+        results.append(result)
+        print(json.dumps(result, indent=2), flush=True)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args)
+        },
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
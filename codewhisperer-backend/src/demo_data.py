@@ -706,7 +706,7 @@ def populate_knowledge_base():
             
             if chunks:
                 documents = [(chunk_text, metadata) for chunk_text, metadata in chunks]
-                vector_ids = rag_service.add_documents_batch(documents)
+                vector_ids = rag_service.add_documents_batch(documents, source_text=file_data["content"])
                 print(f"  ✓ Added {file_data['path']} with {len(chunks)} chunks")
             
         except Exception as e:
@@ -726,7 +726,7 @@ def populate_knowledge_base():
             
             if chunks:
                 documents = [(chunk_text, metadata) for chunk_text, metadata in chunks]
-                vector_ids = rag_service.add_documents_batch(documents)
+                vector_ids = rag_service.add_documents_batch(documents, source_text=doc_data["content"])
                 print(f"  ✓ Added '{doc_data['title']}' with {len(chunks)} chunks")
             
         except Exception as e:
@@ -1,13 +1,24 @@
 import os
 import sys
+import shutil
 import logging
-from flask import Flask, jsonify
+import click
+from flask import Flask, jsonify, Response
 from flask_cors import CORS
 from src.models.user import db
 from src.models.document import Document, DocumentChunk, UserQuery
 from src.routes.user import user_bp
 from src.routes.chat import chat_bp
 from src.routes.data import data_bp
+from src.services.metrics_service import metrics
+from src.services.document_store_service import DocumentStoreService, configure_sqlite_engine, upgrade_schema
+from src.services.stats_rollup_service import StatsRollupService
+from src.services.vector_db_service import create_vector_store
+from src.services.vector_replication import ReplicationLog, log_dir_for
+from src.services.text_store_service import TextStore
+from src.services.embedding_migration_service import IndexManifest, create_embedding_service
+from src.services.snapshot_service import SnapshotService
+from src.services.rag_service import get_rag_service
 
 # Add project root to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -51,20 +62,51 @@ db.init_app(app)
 # Ensure Database Tables Exist
 # ----------------------------
 with app.app_context():
+    configure_sqlite_engine(db.engine)
     db.create_all()
+    upgrade_schema(db.engine)
+    StatsRollupService(db).ensure_built()
     logging.info("✅ Database initialized and tables created")
 
+def _frequent_queries(limit: int) -> list:
+    with app.app_context():
+        return StatsRollupService(db).frequent_queries(limit)
+
+@app.before_request
+def start_serving():
+    # Load the index and warm the query caches with frequent questions in the background, once, when the
+    # server takes its first request or probe (see /ready); CLI commands load the index only if they need it
+    get_rag_service().start_warm_up(_frequent_queries)
+
 # ----------------------------
 # Health Check Endpoint
 # ----------------------------
 @app.route('/health')
 def health_check():
+    # Liveness: the process answers even while the index is still loading, see /ready
     return jsonify({
         "status": "healthy",
         "message": "CodeWhisperer API is running",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "ready": get_rag_service().is_ready
     })
 
+@app.route('/ready')
+def readiness_check():
+    # Readiness: 503 until the index is loaded and the query caches are warm, so no traffic is routed here before
+    rag_service = get_rag_service()
+    status = rag_service.get_load_status()
+    if not rag_service.is_ready:
+        return jsonify({"status": "not_ready", "load": status}), 503
+    return jsonify({"status": "ready", "load": status})
+
+# ----------------------------
+# Metrics Endpoint
+# ----------------------------
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 # ----------------------------
 # Root Endpoint
 # ----------------------------
@@ -75,18 +117,274 @@ def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/health",
+            "ready": "/ready",
+            "metrics": "/metrics",
             "chat": "/api/chat",
             "data": "/api/data",
             "user": "/api/user"
         }
     })
 
+# ----------------------------
+# Maintenance Commands
+# ----------------------------
+def _active_index() -> dict:
+    """
+    The {'model', 'storage_path'} of the vector index serving queries, from the manifest or the defaults
+    """
+    active = IndexManifest().read().get('active')
+    if active:
+        return active
+    from src.services.rag_service import create_default_embedding_service, embedding_model_of
+    return {'model': embedding_model_of(create_default_embedding_service()),
+            'storage_path': create_vector_store(autoload=False, shared=False).storage_path}
+
+def _replace_storage(staging_path: str, target_path: str):
+    """
+    Swap in a vector storage written next to the live one, so readers never see a partial file
+    """
+    if os.path.isdir(staging_path):
+        previous_path = f"{target_path}.previous"
+        if os.path.isdir(target_path):
+            os.replace(target_path, previous_path)
+        os.replace(staging_path, target_path)
+        shutil.rmtree(previous_path, ignore_errors=True)
+    else:
+        os.replace(staging_path, target_path)
+
+    log_dir = log_dir_for(target_path)
+    if os.path.isdir(log_dir):
+        # Replicas follow the log, not the file; have them reload it, and keep a restarting
+        # primary from replaying mutations of the replaced file onto the new one
+        sequence = ReplicationLog(log_dir).record_reload()
+        click.echo(f"Recorded the replaced storage in the vector log at sequence {sequence}")
+
+@app.cli.command('rebuild-index')
+@click.option('--batch-size', default=1000, show_default=True, help='Chunks read from SQL per page')
+@click.option('--output', default=None, help='Vector storage to write (defaults to the live store)')
+@click.option('--embed-missing', is_flag=True, help='Re-embed chunks stored without an embedding')
+def rebuild_index_command(batch_size, output, embed_missing):
+    """
+    Rebuild the vector storage from the embeddings stored with each chunk in SQL
+    """
+    active = IndexManifest().read().get('active')
+    target_path = output or (active['storage_path'] if active else create_vector_store(autoload=False, shared=False).storage_path)
+    staging_path = f"{target_path}.rebuild"
+    if os.path.isdir(staging_path):
+        shutil.rmtree(staging_path)
+    vector_db = create_vector_store(storage_path=staging_path, autoload=False, shared=False)
+    vector_db.load_vectors()  # Starts shard processes in sharded mode; the staging store is empty
+
+    embedding_service = None
+    if embed_missing:
+        embedding_service = get_rag_service().embedding_service
+
+    try:
+        stats = DocumentStoreService(db).rebuild_vector_index(vector_db, batch_size, embedding_service,
+                                                              text_store=TextStore())
+        vector_db.save_vectors()
+    finally:
+        vector_db.close()
+
+    _replace_storage(staging_path, target_path)
+    click.echo(f"Restored {stats['restored']} vectors, re-embedded {stats['embedded']}, "
+               f"skipped {stats['skipped']} without an embedding -> {target_path}")
+    if stats['skipped']:
+        click.echo("Run again with --embed-missing to re-embed the skipped chunks")
+
+@app.cli.command('ingest-slack-export')
+@click.argument('archive', type=click.Path(exists=True, dir_okay=False))
+@click.option('--channel', 'channels', multiple=True, help='Only ingest these channels (repeatable)')
+@click.option('--workers', default=None, type=int, help='Parser processes (defaults to SLACK_INGEST_WORKERS or the CPU count)')
+def ingest_slack_export_command(archive, channels, workers):
+    """
+    Ingest a Slack workspace export zip, skipping channel days already ingested unchanged
+    """
+    from src.services.slack_export_service import SlackExportService
+    
+    rag_service = get_rag_service()
+    stats = SlackExportService(rag_service, DocumentStoreService(db), workers=workers).ingest_archive(
+        archive, list(channels) or None
+    )
+    rag_service.vector_db.close()
+    click.echo(f"Ingested {stats['days_ingested']} new and {stats['days_replaced']} changed channel days "
+               f"({stats['messages']} messages, {stats['chunks']} chunks), skipped {stats['days_skipped']} "
+               f"unchanged, {stats['errors']} failed")
+
+@app.cli.command('calibrate-relevance')
+@click.option('--samples', default=200, show_default=True, help='Stored chunks turned into relevant probe queries')
+@click.option('--relevant', 'relevant_file', type=click.Path(exists=True, dir_okay=False),
+              help='File of questions the knowledge base answers, one per line (replaces the sampled probes)')
+@click.option('--irrelevant', 'irrelevant_file', type=click.Path(exists=True, dir_okay=False),
+              help='File of off-topic queries, one per line (defaults to a built-in set)')
+@click.option('--target-recall', default=0.95, show_default=True, help='Share of relevant probes that must pass')
+def calibrate_relevance_command(samples, relevant_file, irrelevant_file, target_recall):
+    """
+    Fit the relevance threshold that gates LLM calls to the stored corpus and embedding model
+    """
+    import re
+    import random
+    from src.services.relevance_gate import OFF_TOPIC_QUERIES
+    
+    # A few scattered words of a stored chunk stand in for a question that chunk answers; verbatim
+    # passages would match far better than real questions do and set the threshold too high
+    relevant = []
+    if relevant_file:
+        with open(relevant_file) as f:
+            relevant = [line.strip() for line in f if line.strip()]
+    else:
+        for (chunk_text,) in db.session.query(DocumentChunk.chunk_text).order_by(db.func.random()).limit(samples):
+            words = re.findall(r'[A-Za-z_]{3,}', chunk_text)
+            if words:
+                relevant.append(' '.join(words[i] for i in sorted(random.sample(range(len(words)), min(len(words), 6)))))
+    irrelevant = []
+    if irrelevant_file:
+        with open(irrelevant_file) as f:
+            irrelevant = [line.strip() for line in f if line.strip()]
+    if not irrelevant_file or not irrelevant:
+        irrelevant = OFF_TOPIC_QUERIES
+    
+    rag_service = get_rag_service()
+    rag_service.wait_until_loaded()
+    try:
+        calibration = rag_service.relevance_gate.calibrate(
+            rag_service.embedding_service, rag_service.vector_db, relevant, irrelevant, target_recall
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        rag_service.vector_db.close()
+    
+    click.echo(f"min_similarity for {rag_service.relevance_gate.model}: {calibration['min_similarity']} "
+               f"(keeps {target_recall:.0%} of {calibration['relevant_queries']} relevant probes, "
+               f"skips {calibration['irrelevant_skip_rate']:.0%} of {calibration['irrelevant_queries']} off-topic ones)")
+    click.echo(f"Top similarity medians: relevant {calibration['relevant_top_median']}, "
+               f"off-topic {calibration['irrelevant_top_median']}; restart workers to apply")
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """
+    Recompute the stats rollups from the query and document tables
+    """
+    stats = StatsRollupService(db).rebuild()
+    click.echo(f"Rebuilt {stats['query_buckets']} query and {stats['document_buckets']} document rollup buckets")
+
+@app.cli.command('reembed')
+@click.argument('model')
+@click.option('--texts-per-minute', default=None, type=int,
+              help='Embedding API budget (defaults to REEMBED_TEXTS_PER_MINUTE; 0 for no limit)')
+@click.option('--swap', is_flag=True, help='Serve queries from the new index once it is complete')
+def reembed_command(model, texts_per_minute, swap):
+    """
+    Re-embed the knowledge base with MODEL into a shadow index, resuming an interrupted run
+    """
+    from src.routes.data import embedding_migration
+    
+    try:
+        embedding_migration.start(app, model, texts_per_minute=texts_per_minute)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    try:
+        while not embedding_migration.wait(10):
+            status = embedding_migration.status
+            click.echo(f"Re-embedded {status['embedded']} of {status['total'] or '?'} entries")
+    except KeyboardInterrupt:
+        embedding_migration.cancel()
+        raise click.ClickException("Cancelled; run again to resume")
+    
+    status = embedding_migration.status
+    if status['state'] != 'ready':
+        raise click.ClickException(f"Re-embedding {status['state']}: {status.get('error', '')}")
+    click.echo(f"Re-embedded {status['embedded']} entries with {model} into {status['storage_path']}")
+    if swap:
+        result = embedding_migration.swap()
+        click.echo(f"Index version {result['version']} now serves queries with {model} "
+                   f"({result['chunks_updated']} chunk embeddings updated); restart workers to apply")
+    else:
+        click.echo("Swap it in with POST /api/data/reembed/swap on a running server, or run again with --swap")
+
+@app.cli.command('reembed-rollback')
+def reembed_rollback_command():
+    """
+    Serve queries from the vector index the last swap replaced
+    """
+    from src.routes.data import embedding_migration
+    
+    try:
+        result = embedding_migration.rollback()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Index version {result['version']} now serves queries with {result['model']}; restart workers to apply")
+
+@app.cli.command('export-snapshot')
+@click.argument('path')
+def export_snapshot_command(path):
+    """
+    Write vectors, texts and document rows to a snapshot bundle at PATH for provisioning other nodes
+    """
+    index = _active_index()
+    vector_db = create_vector_store(storage_path=index['storage_path'], autoload=True, shared=False)
+    try:
+        stats = SnapshotService(db).export(path, vector_db, TextStore(), index['model'],
+                                           IndexManifest().read()['version'])
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        vector_db.close()
+    click.echo(f"Exported {stats['vectors']} vectors in {stats['collections']} collections, "
+               f"{stats['documents']} documents and {stats['chunks']} chunks -> {path}")
+
+@app.cli.command('import-snapshot')
+@click.argument('path', type=click.Path(exists=True, file_okay=False))
+@click.option('--replace', is_flag=True, help='Overwrite a knowledge base that is not empty')
+def import_snapshot_command(path, replace):
+    """
+    Load a bundle written by export-snapshot into this node's vector storage, text store and database
+    """
+    service = SnapshotService(db)
+    try:
+        model = service.read_manifest(path)['index']['model']
+        create_embedding_service(model)  # Queries must be embedded in the snapshot's vector space
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    index = _active_index()
+    staging_path = f"{index['storage_path']}.import"
+    if os.path.isdir(staging_path):
+        shutil.rmtree(staging_path)
+    elif os.path.exists(staging_path):
+        os.remove(staging_path)  # Left by an import that failed
+    vector_db = create_vector_store(storage_path=staging_path, autoload=False, shared=False)
+    vector_db.load_vectors()  # Starts shard processes in sharded mode; the staging store is empty
+    try:
+        stats = service.restore(path, vector_db, TextStore(), replace=replace)
+        vector_db.save_vectors()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        vector_db.close()
+
+    _replace_storage(staging_path, index['storage_path'])
+    if model != index['model']:
+        # The node now serves the snapshot's vector space from the same storage path
+        index_manifest = IndexManifest()
+        manifest = index_manifest.read()
+        manifest.update({'version': manifest['version'] + 1, 'previous': None, 'pending': None,
+                         'active': {'model': model, 'storage_path': index['storage_path']}})
+        index_manifest.write(manifest)
+
+    click.echo(f"Imported {stats['vectors']} vectors in {stats['collections']} collections, "
+               f"{stats['documents']} documents and {stats['chunks']} chunks embedded with {model}; "
+               f"restart workers to serve them")
+
 # ----------------------------
 # Run the Application
 # ----------------------------
 if __name__ == '__main__':
     try:
         logging.info("🚀 Starting Flask server on http://0.0.0.0:5002")
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_serving()  # In the reloader's serving child only; the watching parent never takes requests
         app.run(host='0.0.0.0', port=5002, debug=True)
     except Exception as e:
         logging.exception("❌ Server failed to start")
@@ -1,17 +1,20 @@
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import json
-
-db = SQLAlchemy()
+from src.models.user import db  # Shared with the User model so the app initializes a single instance
 
 class Document(db.Model):
     __tablename__ = 'documents'
+    __table_args__ = (
+        # Newest-first listing, optionally by source type, with keyset pagination on (created_at, id)
+        db.Index('ix_documents_created_at_id', 'created_at', 'id'),
+        db.Index('ix_documents_source_type_created_at_id', 'source_type', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     source_type = db.Column(db.String(50), nullable=False)  # 'code', 'documentation', 'slack'
     source_url = db.Column(db.Text, nullable=False)
     title = db.Column(db.String(500), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    content = db.deferred(db.Column(db.Text, nullable=False))  # Loaded on first access; listings never need it
     doc_metadata = db.Column(db.Text)  # JSON string for flexible metadata
     author = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -41,12 +44,18 @@ class Document(db.Model):
 
 class DocumentChunk(db.Model):
     __tablename__ = 'document_chunks'
+    __table_args__ = (
+        # A document's chunks in order, with keyset pagination on (chunk_index, id)
+        db.Index('ix_document_chunks_document_id_chunk_index', 'document_id', 'chunk_index', 'id'),
+        db.Index('ix_document_chunks_embedding_id', 'embedding_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
     chunk_text = db.Column(db.Text, nullable=False)
     chunk_index = db.Column(db.Integer, nullable=False)
     embedding_id = db.Column(db.String(100))  # Reference to vector database
+    embedding = db.deferred(db.Column(db.LargeBinary))  # float32 bytes, used to rebuild the vector index
     chunk_metadata = db.Column(db.Text)  # JSON string for chunk-specific metadata
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -63,6 +72,10 @@ class DocumentChunk(db.Model):
 
 class UserQuery(db.Model):
     __tablename__ = 'user_queries'
+    __table_args__ = (
+        # A user's history, newest first, with keyset pagination on (created_at, id)
+        db.Index('ix_user_queries_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(255), nullable=False)
@@ -87,3 +100,34 @@ class UserQuery(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+
+# Running query totals per bucket: 'all', 'day:<YYYY-MM-DD>' or 'user:<user_id>'
+class QueryRollup(db.Model):
+    __tablename__ = 'query_rollups'
+    
+    bucket = db.Column(db.String(300), primary_key=True)
+    query_count = db.Column(db.Integer, nullable=False, default=0)
+    processing_time_total = db.Column(db.Float, nullable=False, default=0)
+    processing_time_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_total = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+
+# Running document and chunk totals per bucket: 'all', 'day:<YYYY-MM-DD>' or 'source_type:<type>'
+class DocumentRollup(db.Model):
+    __tablename__ = 'document_rollups'
+    
+    bucket = db.Column(db.String(300), primary_key=True)
+    document_count = db.Column(db.Integer, nullable=False, default=0)
+    chunk_count = db.Column(db.Integer, nullable=False, default=0)
+
+# One ingested channel day of a Slack export; fingerprint is the archive member's CRC-32 and size
+class SlackExportCheckpoint(db.Model):
+    __tablename__ = 'slack_export_checkpoints'
+    
+    channel = db.Column(db.String(255), primary_key=True)
+    day = db.Column(db.String(10), primary_key=True)  # YYYY-MM-DD, the export's file name
+    fingerprint = db.Column(db.String(32), nullable=False)
+    document_id = db.Column(db.Integer)  # None when the day had no messages worth indexing
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    chunk_count = db.Column(db.Integer, nullable=False, default=0)
+    ingested_at = db.Column(db.DateTime, default=datetime.utcnow)
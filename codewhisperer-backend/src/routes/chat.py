@@ -1,13 +1,34 @@
 from flask import Blueprint, request, jsonify, current_app
-from src.services.rag_service import RAGService
-from src.models.document import UserQuery, db
+from src.services.rag_service import get_rag_service
+from src.services.stats_rollup_service import StatsRollupService
+from src.services.keyset_pagination import paginate_newest_first
+from src.models.document import UserQuery, QueryRollup, db
 import logging
 import json
+import math
+import os
 
 logger = logging.getLogger(__name__)
 
 chat_bp = Blueprint('chat', __name__)
-rag_service = RAGService()
+rag_service = get_rag_service()  # Shared by both blueprints
+stats_rollups = StatsRollupService(db)
+replica_wait_seconds = float(os.getenv('VECTOR_REPLICA_WAIT_SECONDS', '2'))  # Read-your-writes wait before giving up
+
+@chat_bp.before_request
+def wait_for_index_sequence():
+    """
+    Read-your-writes: a client that sends the X-Index-Sequence of its last write as X-Min-Index-Sequence
+    is only answered once this node's vector store includes that write
+    """
+    required = request.headers.get('X-Min-Index-Sequence', type=int)
+    if required is None or rag_service.wait_for_index_sequence(required, replica_wait_seconds):
+        return None
+    replication = rag_service.get_replication_status()
+    response = jsonify({'error': 'This replica has not applied the requested write yet',
+                        'required_sequence': required, 'replication': replication})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 @chat_bp.route('/query', methods=['POST'])
 def process_query():
@@ -24,8 +45,8 @@ def process_query():
         user_id = data.get('user_id', 'anonymous')
         source_type_filter = data.get('source_type_filter')
         
-        # Process the query
-        result = rag_service.query(user_query, source_type_filter)
+        # Process the query, over the team's knowledge base if one is given
+        result = rag_service.query(user_query, source_type_filter, tenant=data.get('team'))
         
         # Save query to database
         try:
@@ -38,6 +59,7 @@ def process_query():
                     processing_time=result['processing_time']
                 )
                 db.session.add(query_record)
+                stats_rollups.record_queries([query_record])
                 db.session.commit()
         except Exception as e:
             logger.error(f"Error saving query to database: {str(e)}")
@@ -54,6 +76,80 @@ def process_query():
         logger.error(f"Error processing query: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@chat_bp.route('/query/batch', methods=['POST'])
+def process_query_batch():
+    """
+    Process many queries in one request, e.g. for evaluation suites
+    """
+    try:
+        data = request.get_json()
+
+        if not data or not isinstance(data.get('queries'), list) or not data['queries']:
+            return jsonify({'error': 'A non-empty list of queries is required'}), 400
+
+        queries = data['queries']
+        if not all(isinstance(query, str) and query.strip() for query in queries):
+            return jsonify({'error': 'Every query must be a non-empty string'}), 400
+
+        if len(queries) > rag_service.max_batch_size:
+            return jsonify({'error': f'At most {rag_service.max_batch_size} queries are allowed per batch'}), 400
+
+        top_k = data.get('top_k', 10)
+        max_concurrency = data.get('max_concurrency')
+        for name, value in (('top_k', top_k), ('max_concurrency', max_concurrency)):
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 1):
+                return jsonify({'error': f'{name} must be a positive integer'}), 400
+
+        user_id = data.get('user_id', 'anonymous')
+
+        # Process the batch; top_k is capped so one query cannot return the whole collection
+        batch = rag_service.query_batch(
+            queries,
+            source_type_filter=data.get('source_type_filter'),
+            top_k=min(top_k, rag_service.max_top_k),
+            max_concurrency=max_concurrency,
+            tenant=data.get('team')
+        )
+
+        # Evaluation runs usually should not pollute the query history
+        if data.get('save_history', False):
+            try:
+                query_records = [
+                    UserQuery(
+                        user_id=user_id,
+                        query_text=result['query'],
+                        response_text=result['response'],
+                        sources_used=json.dumps([source['title'] for source in result['sources']]),
+                        processing_time=result['processing_time']
+                    )
+                    for result in batch['results']
+                ]
+                db.session.add_all(query_records)
+                stats_rollups.record_queries(query_records)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error saving batch queries to database: {str(e)}")
+
+        return jsonify({
+            'success': batch['success'],
+            'results': [{
+                'query': result['query'],
+                'success': result['success'],
+                'response': result['response'],
+                'sources': result['sources'],
+                'processing_time': result['processing_time'],
+                'context_used': result['context_used'],
+                'error': result.get('error')
+            } for result in batch['results']],
+            'processing_time': batch['processing_time'],
+            'timings': batch['timings']
+        })
+
+    except Exception as e:
+        logger.error(f"Error processing query batch: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @chat_bp.route('/feedback', methods=['POST'])
 def submit_feedback():
     """
@@ -74,8 +170,10 @@ def submit_feedback():
         if not query_record:
             return jsonify({'error': 'Query not found'}), 404
         
+        previous_rating = query_record.feedback_rating
         query_record.feedback_rating = rating
         query_record.feedback_text = feedback_text
+        stats_rollups.record_feedback(query_record, previous_rating)
         db.session.commit()
         
         return jsonify({'success': True, 'message': 'Feedback submitted successfully'})
@@ -87,21 +185,27 @@ def submit_feedback():
 @chat_bp.route('/history/<user_id>', methods=['GET'])
 def get_user_history(user_id):
     """
-    Get query history for a user
+    Get query history for a user, newest first; pass next_cursor back as cursor for the next page
     """
     try:
         page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
+        per_page = max(request.args.get('per_page', 20, type=int), 1)
+        cursor = request.args.get('cursor')
         
-        queries = UserQuery.query.filter_by(user_id=user_id)\
-                                 .order_by(UserQuery.created_at.desc())\
-                                 .paginate(page=page, per_page=per_page, error_out=False)
+        try:
+            queries, next_cursor = paginate_newest_first(
+                UserQuery.query.filter_by(user_id=user_id), UserQuery, per_page, cursor=cursor, page=page
+            )
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
         
+        total = stats_rollups.get_query_stats(user_id)['total_queries']
         return jsonify({
-            'queries': [query.to_dict() for query in queries.items],
-            'total': queries.total,
-            'pages': queries.pages,
-            'current_page': page
+            'queries': [query.to_dict() for query in queries],
+            'total': total,
+            'pages': math.ceil(total / per_page),
+            'current_page': page,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -111,21 +215,22 @@ def get_user_history(user_id):
 @chat_bp.route('/stats', methods=['GET'])
 def get_chat_stats():
     """
-    Get chat statistics
+    Get chat statistics from the precomputed rollups
     """
     try:
-        total_queries = UserQuery.query.count()
-        avg_rating = db.session.query(db.func.avg(UserQuery.feedback_rating))\
-                              .filter(UserQuery.feedback_rating.isnot(None)).scalar()
-        avg_processing_time = db.session.query(db.func.avg(UserQuery.processing_time)).scalar()
+        days = min(max(request.args.get('days', 30, type=int), 1), 366)
+        query_stats = stats_rollups.get_query_stats()
+        avg_rating = query_stats['average_rating']
+        avg_processing_time = query_stats['average_processing_time']
         
         # Get knowledge base stats
         kb_stats = rag_service.get_knowledge_base_stats()
         
         return jsonify({
-            'total_queries': total_queries,
+            'total_queries': query_stats['total_queries'],
             'average_rating': round(avg_rating, 2) if avg_rating else None,
             'average_processing_time': round(avg_processing_time, 3) if avg_processing_time else None,
+            'queries_per_day': stats_rollups.get_daily(QueryRollup, 'query_count', days),
             'knowledge_base': kb_stats
         })
         
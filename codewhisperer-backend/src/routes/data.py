@@ -1,18 +1,62 @@
-from flask import Blueprint, request, jsonify
-from src.services.rag_service import RAGService
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
+from src.services.rag_service import get_rag_service
 from src.services.data_ingestion_service import DataIngestionService
 from src.services.file_processing_service import FileProcessingService
-from src.models.document import Document, DocumentChunk, db
+from src.services.document_store_service import DocumentStoreService
+from src.services.reconciliation_service import ReconciliationService
+from src.services.slack_export_service import SlackExportService
+from src.services.code_ingest_pipeline import CodeIngestPipeline
+from src.services.embedding_migration_service import EmbeddingMigrationService
+from src.services.keyset_pagination import paginate_newest_first
+from src.services.vector_collections import TENANT_KEY, assign_tenant
+from src.models.document import Document, DocumentRollup, db
+from src.services.metrics_service import metrics
 import logging
 import json
+import math
 import os
+import tempfile
+import zipfile
 
 logger = logging.getLogger(__name__)
 
 data_bp = Blueprint('data', __name__)
-rag_service = RAGService()
+rag_service = get_rag_service()  # Shared by both blueprints
 ingestion_service = DataIngestionService()
 file_processor = FileProcessingService()
+document_store = DocumentStoreService(db)
+reconciliation_service = ReconciliationService(rag_service, document_store)
+slack_export_service = SlackExportService(rag_service, document_store)
+code_ingest_pipeline = CodeIngestPipeline(rag_service, ingestion_service, document_store)
+embedding_migration = EmbeddingMigrationService(rag_service, document_store)
+
+@data_bp.record_once
+def start_reconciliation(state):
+    """
+    Schedule background reconciliation once the blueprint is registered on an app
+    """
+    interval = float(os.getenv('RECONCILE_INTERVAL_SECONDS', '3600'))
+    if interval > 0 and not rag_service.is_read_replica:  # Replicas only change by following the primary
+        reconciliation_service.start(state.app, interval)
+
+@data_bp.before_request
+def reject_writes_on_replica():
+    """
+    A read replica's vector store follows the primary's log, so ingestion and maintenance go to the primary
+    """
+    if request.method != 'GET' and rag_service.is_read_replica:
+        return jsonify({'error': 'This node is a read replica; send writes to the primary'}), 409
+
+@data_bp.after_request
+def add_index_sequence(response):
+    """
+    Tell writers the primary's log sequence after their write, so they can ask replicas to read it
+    """
+    if request.method != 'GET' and response.status_code < 400:
+        sequence = rag_service.get_replication_status().get('sequence')
+        if sequence is not None:
+            response.headers['X-Index-Sequence'] = str(sequence)
+    return response
 
 @data_bp.route('/ingest/code', methods=['POST'])
 def ingest_code():
@@ -25,74 +69,19 @@ def ingest_code():
         if not data or 'files' not in data:
             return jsonify({'error': 'Files data is required'}), 400
         
-        files = data['files']
-        repository = data.get('repository')
-        branch = data.get('branch', 'main')
-        commit_hash = data.get('commit_hash')
-        
-        processed_files = []
-        total_chunks = 0
-        
-        for file_data in files:
-            file_path = file_data.get('path')
-            content = file_data.get('content')
-            
-            if not file_path or not content:
-                continue
-            
-            # Process the code file
-            chunks = ingestion_service.process_code_file(
-                file_path, content, repository, branch, commit_hash
-            )
-            
-            if chunks:
-                # Add to knowledge base
-                documents = [(chunk_text, metadata) for chunk_text, metadata in chunks]
-                vector_ids = rag_service.add_documents_batch(documents)
-                
-                # Save to database
-                doc = Document(
-                    source_type='code',
-                    source_url=f"file://{file_path}",
-                    title=os.path.basename(file_path),
-                    content=content,
-                    doc_doc_metadata=json.dumps({
-                        'repository': repository,
-                        'branch': branch,
-                        'commit_hash': commit_hash,
-                        'language': ingestion_service._detect_language(os.path.splitext(file_path)[1])
-                    }),
-                    file_path=file_path,
-                    repository=repository,
-                    branch=branch,
-                    commit_hash=commit_hash
-                )
-                db.session.add(doc)
-                db.session.flush()
-                
-                # Save chunks
-                for i, (chunk_text, metadata) in enumerate(chunks):
-                    chunk = DocumentChunk(
-                        document_id=doc.id,
-                        chunk_text=chunk_text,
-                        chunk_index=i,
-                        embedding_id=vector_ids[i] if i < len(vector_ids) else None,
-                        chunk_chunk_metadata=json.dumps(metadata)
-                    )
-                    db.session.add(chunk)
-                
-                processed_files.append({
-                    'file_path': file_path,
-                    'chunks_created': len(chunks)
-                })
-                total_chunks += len(chunks)
-        
-        db.session.commit()
+        # Parsed, embedded and committed in batches that span files
+        result = code_ingest_pipeline.ingest(
+            data['files'], data.get('repository'), data.get('branch', 'main'), data.get('commit_hash'),
+            tenant=data.get('team')
+        )
+        processed_files = result['processed_files']
+        total_chunks = result['total_chunks']
         
         return jsonify({
             'success': True,
             'message': f'Processed {len(processed_files)} files with {total_chunks} chunks',
-            'processed_files': processed_files
+            'processed_files': processed_files,
+            'batches': result['batches']
         })
         
     except Exception as e:
@@ -119,44 +108,33 @@ def ingest_documentation():
         
         # Process the documentation
         chunks = ingestion_service.process_documentation(content, title, url, author, doc_type)
+        assign_tenant(chunks, data.get('team'))
         
         if chunks:
             # Add to knowledge base
             documents = [(chunk_text, metadata) for chunk_text, metadata in chunks]
-            vector_ids = rag_service.add_documents_batch(documents)
+            vector_ids = rag_service.add_documents_batch(documents, source_text=content)
             
             # Save to database
-            doc = Document(
-                source_type='documentation',
-                source_url=url or '',
-                title=title,
-                content=content,
-                doc_doc_metadata=json.dumps({
+            document_id = document_store.write_documents([({
+                'source_type': 'documentation',
+                'source_url': url or '',
+                'title': title,
+                'content': content,
+                'doc_metadata': json.dumps({
                     'doc_type': doc_type,
                     'author': author
                 }),
-                author=author
-            )
-            db.session.add(doc)
-            db.session.flush()
+                'author': author
+            }, document_store.build_chunk_rows(chunks, vector_ids, rag_service.get_embeddings(vector_ids)))])[0]
             
-            # Save chunks
-            for i, (chunk_text, metadata) in enumerate(chunks):
-                chunk = DocumentChunk(
-                    document_id=doc.id,
-                    chunk_text=chunk_text,
-                    chunk_index=i,
-                    embedding_id=vector_ids[i] if i < len(vector_ids) else None,
-                    chunk_metadata=json.dumps(metadata)
-                )
-                db.session.add(chunk)
-            
-            db.session.commit()
+            with metrics.timer('ingest_stage_seconds', stage='sql_commit'):
+                db.session.commit()
             
             return jsonify({
                 'success': True,
                 'message': f'Processed documentation with {len(chunks)} chunks',
-                'document_id': doc.id,
+                'document_id': document_id,
                 'chunks_created': len(chunks)
             })
         else:
@@ -183,6 +161,7 @@ def ingest_slack():
         
         # Process the Slack thread
         chunks = ingestion_service.process_slack_thread(messages, channel)
+        assign_tenant(chunks, data.get('team'))
         
         if chunks:
             # Add to knowledge base
@@ -190,36 +169,24 @@ def ingest_slack():
             vector_ids = rag_service.add_documents_batch(documents)
             
             # Save to database
-            doc = Document(
-                source_type='slack',
-                source_url=f"slack://channel/{channel}" if channel else 'slack://unknown',
-                title=f"Slack discussion in #{channel}" if channel else 'Slack conversation',
-                content=json.dumps(messages),
-                doc_metadata=json.dumps({
+            document_id = document_store.write_documents([({
+                'source_type': 'slack',
+                'source_url': f"slack://channel/{channel}" if channel else 'slack://unknown',
+                'title': f"Slack discussion in #{channel}" if channel else 'Slack conversation',
+                'content': json.dumps(messages),
+                'doc_metadata': json.dumps({
                     'channel': channel,
                     'message_count': len(messages)
                 })
-            )
-            db.session.add(doc)
-            db.session.flush()
+            }, document_store.build_chunk_rows(chunks, vector_ids, rag_service.get_embeddings(vector_ids)))])[0]
             
-            # Save chunks
-            for i, (chunk_text, metadata) in enumerate(chunks):
-                chunk = DocumentChunk(
-                    document_id=doc.id,
-                    chunk_text=chunk_text,
-                    chunk_index=i,
-                    embedding_id=vector_ids[i] if i < len(vector_ids) else None,
-                    chunk_metadata=json.dumps(metadata)
-                )
-                db.session.add(chunk)
-            
-            db.session.commit()
+            with metrics.timer('ingest_stage_seconds', stage='sql_commit'):
+                db.session.commit()
             
             return jsonify({
                 'success': True,
                 'message': f'Processed Slack thread with {len(chunks)} chunks',
-                'document_id': doc.id,
+                'document_id': document_id,
                 'chunks_created': len(chunks)
             })
         else:
@@ -230,28 +197,65 @@ def ingest_slack():
         db.session.rollback()
         return jsonify({'error': 'Internal server error'}), 500
 
+@data_bp.route('/ingest/slack/export', methods=['POST'])
+def ingest_slack_export():
+    """
+    Ingest an uploaded Slack workspace export zip; days ingested by earlier uploads are skipped
+    """
+    try:
+        if 'file' not in request.files or not request.files['file'].filename:
+            return jsonify({'error': 'A Slack export zip file is required'}), 400
+        
+        channels = [channel.strip() for channel in request.form.get('channels', '').split(',') if channel.strip()]
+        
+        # Spooled to disk so worker processes can open the archive by path
+        with tempfile.NamedTemporaryFile(suffix='.zip') as archive:
+            request.files['file'].save(archive)
+            archive.flush()
+            try:
+                stats = slack_export_service.ingest_archive(archive.name, channels or None)
+            except zipfile.BadZipFile:
+                return jsonify({'error': 'File is not a zip archive'}), 400
+        
+        return jsonify({
+            'success': stats['errors'] == 0,
+            'message': f"Ingested {stats['days_ingested'] + stats['days_replaced']} channel days "
+                       f"with {stats['chunks']} chunks, skipped {stats['days_skipped']} unchanged days",
+            'stats': stats
+        })
+        
+    except Exception as e:
+        logger.error(f"Error ingesting Slack export: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error'}), 500
+
 @data_bp.route('/documents', methods=['GET'])
 def list_documents():
     """
-    List all documents in the knowledge base
+    List document summaries, newest first; pass next_cursor back as cursor for the next page.
+    Content is never loaded here and metadata only with include_metadata=true.
     """
     try:
         page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
+        per_page = max(request.args.get('per_page', 20, type=int), 1)
         source_type = request.args.get('source_type')
+        cursor = request.args.get('cursor')
+        include_metadata = request.args.get('include_metadata', 'false').lower() == 'true'
         
-        query = Document.query
-        if source_type:
-            query = query.filter_by(source_type=source_type)
+        query = document_store.document_summaries(source_type, include_metadata=include_metadata)
         
-        documents = query.order_by(Document.created_at.desc())\
-                        .paginate(page=page, per_page=per_page, error_out=False)
+        try:
+            documents, next_cursor = paginate_newest_first(query, Document, per_page, cursor=cursor, page=page)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
         
+        total = document_store.rollups.count_documents(source_type)
         return jsonify({
-            'documents': [doc.to_dict() for doc in documents.items],
-            'total': documents.total,
-            'pages': documents.pages,
-            'current_page': page
+            'documents': [document_store.summary_to_dict(row) for row in documents],
+            'total': total,
+            'pages': math.ceil(total / per_page),
+            'current_page': page,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -261,13 +265,21 @@ def list_documents():
 @data_bp.route('/documents/<int:doc_id>', methods=['GET'])
 def get_document(doc_id):
     """
-    Get a specific document with its chunks
+    Get a specific document with the first page of its chunks; fetch the rest from /documents/<id>/chunks
     """
     try:
-        document = Document.query.get_or_404(doc_id)
+        chunk_limit = min(max(request.args.get('chunk_limit', 100, type=int), 1), 1000)
+        include_content = request.args.get('include_content', 'false').lower() == 'true'
+        
+        summary = document_store.document_summaries(include_metadata=True).filter(Document.id == doc_id).first()
+        if summary is None:
+            return jsonify({'error': 'Document not found'}), 404
         
-        doc_data = document.to_dict()
-        doc_data['chunks'] = [chunk.to_dict() for chunk in document.chunks]
+        doc_data = document_store.summary_to_dict(summary)
+        if include_content:
+            doc_data['content'] = db.session.query(Document.content).filter(Document.id == doc_id).scalar()
+        doc_data['chunks'], doc_data['next_chunk_cursor'] = document_store.get_chunk_page(doc_id, chunk_limit)
+        doc_data['chunk_count'] = document_store.count_chunks(doc_id)
         
         return jsonify(doc_data)
         
@@ -275,6 +287,53 @@ def get_document(doc_id):
         logger.error(f"Error getting document: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@data_bp.route('/documents/<int:doc_id>/chunks', methods=['GET'])
+def get_document_chunks(doc_id):
+    """
+    Page through a document's chunks in order; pass next_cursor back as cursor for the next page
+    """
+    try:
+        per_page = min(max(request.args.get('per_page', 100, type=int), 1), 1000)
+        include_text = request.args.get('include_text', 'true').lower() != 'false'
+        
+        try:
+            chunks, next_cursor = document_store.get_chunk_page(
+                doc_id, per_page, cursor=request.args.get('cursor'), include_text=include_text
+            )
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        if not chunks and db.session.get(Document, doc_id) is None:
+            return jsonify({'error': 'Document not found'}), 404
+        
+        return jsonify({'chunks': chunks, 'next_cursor': next_cursor})
+        
+    except Exception as e:
+        logger.error(f"Error getting document chunks: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@data_bp.route('/documents/export', methods=['GET'])
+def export_documents():
+    """
+    Stream documents as newline-delimited JSON, one object per line, oldest first.
+    Content and chunk texts are included only with include_content / include_chunks=true.
+    """
+    source_type = request.args.get('source_type')
+    include_content = request.args.get('include_content', 'false').lower() == 'true'
+    include_chunks = request.args.get('include_chunks', 'false').lower() == 'true'
+    
+    def generate():
+        try:
+            for record in document_store.export_documents(source_type, include_content, include_chunks):
+                yield json.dumps(record) + '\n'
+        except Exception as e:
+            # Headers are already sent; end the stream with an error line the client can detect
+            logger.error(f"Error exporting documents: {str(e)}")
+            yield json.dumps({'error': 'Export failed'}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=documents.ndjson'})
+
 @data_bp.route('/documents/<int:doc_id>', methods=['DELETE'])
 def delete_document(doc_id):
     """
@@ -283,12 +342,14 @@ def delete_document(doc_id):
     try:
         document = Document.query.get_or_404(doc_id)
         
-        # Delete from vector database
-        for chunk in document.chunks:
-            if chunk.embedding_id:
-                rag_service.vector_db.delete_vector(chunk.embedding_id)
+        # Delete from vector database and keyword index
+        embedding_ids = [chunk.embedding_id for chunk in document.chunks if chunk.embedding_id]
+        rag_service.delete_documents(embedding_ids)
         
         # Delete from SQL database (chunks will be deleted by cascade)
+        document_store.rollups.record_documents(
+            [(document.source_type, document.created_at, -1, -len(document.chunks))]
+        )
         db.session.delete(document)
         db.session.commit()
         
@@ -328,21 +389,111 @@ def get_supported_file_types():
         logger.error(f"Error getting supported file types: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@data_bp.route('/reconcile', methods=['POST'])
+def reconcile_vectors():
+    """
+    Run a reconciliation pass between SQL and the vector store now
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        report = reconciliation_service.run(evict_immediately=bool(data.get('evict_immediately', False)))
+        return jsonify({'success': True, 'report': report})
+        
+    except Exception as e:
+        logger.error(f"Error reconciling vector store: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error'}), 500
+
+@data_bp.route('/reconcile', methods=['GET'])
+def get_reconciliation_report():
+    """
+    Get the report of the last reconciliation pass
+    """
+    return jsonify({'report': reconciliation_service.last_report})
+
+@data_bp.route('/reembed', methods=['POST'])
+def start_reembedding():
+    """
+    Start re-embedding the knowledge base with another model into a shadow index
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        if not data.get('model'):
+            return jsonify({'error': 'model is required'}), 400
+        
+        status = embedding_migration.start(
+            current_app._get_current_object(), data['model'],
+            texts_per_minute=data.get('texts_per_minute'),
+            swap_when_done=bool(data.get('swap_when_done', False))
+        )
+        return jsonify({'success': True, 'status': status}), 202
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error starting re-embedding: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@data_bp.route('/reembed', methods=['GET'])
+def get_reembedding_status():
+    """
+    Get the progress of the current migration and the index serving queries
+    """
+    return jsonify({'status': embedding_migration.get_status()})
+
+@data_bp.route('/reembed/cancel', methods=['POST'])
+def cancel_reembedding():
+    """
+    Stop the running migration; starting it again resumes it
+    """
+    embedding_migration.cancel()
+    return jsonify({'success': True, 'status': embedding_migration.get_status()})
+
+@data_bp.route('/reembed/swap', methods=['POST'])
+def swap_reembedded_index():
+    """
+    Serve queries from the finished shadow index
+    """
+    try:
+        return jsonify({'success': True, 'result': embedding_migration.swap()})
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        logger.error(f"Error swapping vector index: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error'}), 500
+
+@data_bp.route('/reembed/rollback', methods=['POST'])
+def rollback_reembedded_index():
+    """
+    Serve queries from the index the last swap replaced
+    """
+    try:
+        return jsonify({'success': True, 'result': embedding_migration.rollback()})
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        logger.error(f"Error rolling back vector index: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error'}), 500
+
+@data_bp.route('/replication', methods=['GET'])
+def get_replication_status():
+    """
+    Get the vector store's replication role, log sequence and, on a replica, its lag
+    """
+    return jsonify({'replication': rag_service.get_replication_status()})
+
 @data_bp.route('/stats', methods=['GET'])
 def get_data_stats():
     """
-    Get statistics about the knowledge base
+    Get statistics about the knowledge base from the precomputed rollups
     """
     try:
-        # Get actual database statistics
-        total_docs = Document.query.count()
-        total_chunks = DocumentChunk.query.count()
-        
-        # Count by source type
-        source_stats = db.session.query(
-            Document.source_type,
-            db.func.count(Document.id)
-        ).group_by(Document.source_type).all()
+        days = min(max(request.args.get('days', 30, type=int), 1), 366)
+        document_stats = document_store.rollups.get_document_stats()
         
         # Get vector database stats
         try:
@@ -356,9 +507,10 @@ def get_data_stats():
             }
         
         return jsonify({
-            'total_documents': total_docs,
-            'total_chunks': total_chunks,
-            'source_types': dict(source_stats),
+            'total_documents': document_stats['total_documents'],
+            'total_chunks': document_stats['total_chunks'],
+            'source_types': document_stats['source_types'],
+            'documents_per_day': document_store.rollups.get_daily(DocumentRollup, 'document_count', days),
             'vector_database': vector_stats,
             'status': 'ready'
         })
@@ -381,24 +533,28 @@ def ingest_document():
         
         text = data['text']
         metadata = data.get('metadata', {})
+        if data.get('team'):
+            metadata[TENANT_KEY] = data['team']
         
         # Add document to the RAG service
         vector_id = rag_service.add_document(text, metadata)
         
-        # Also store in database for tracking
-        document = Document(
-            title=metadata.get('title', 'Untitled Document'),
-            source_type=metadata.get('source_type', 'documentation'),
-            content=text,  # Store full content
-            source_url=metadata.get('source_url', ''),
-            file_path=metadata.get('file_path', ''),
-            repository=metadata.get('repository', ''),
-            author=metadata.get('author', ''),
-            doc_metadata=json.dumps(metadata)
-        )
-        
-        db.session.add(document)
-        db.session.commit()
+        # Also store in database for tracking, with a chunk so the vector can be rebuilt from SQL
+        document_id = document_store.write_documents([({
+            'title': metadata.get('title', 'Untitled Document'),
+            'source_type': metadata.get('source_type', 'documentation'),
+            'content': text,  # Store full content
+            'source_url': metadata.get('source_url', ''),
+            'file_path': metadata.get('file_path', ''),
+            'repository': metadata.get('repository', ''),
+            'author': metadata.get('author', ''),
+            'doc_metadata': json.dumps(metadata)
+        }, document_store.build_chunk_rows(
+            [(text, metadata)], [vector_id], rag_service.get_embeddings([vector_id])
+        ))])[0]
+        
+        with metrics.timer('ingest_stage_seconds', stage='sql_commit'):
+            db.session.commit()
         
         logger.info(f"Successfully ingested document: {metadata.get('title', 'Untitled')}")
         
@@ -406,7 +562,7 @@ def ingest_document():
             'success': True,
             'message': 'Document successfully ingested',
             'vector_id': vector_id,
-            'document_id': document.id
+            'document_id': document_id
         })
         
     except Exception as e:
@@ -461,19 +617,21 @@ def upload_file():
             # Add document to the RAG service
             vector_id = rag_service.add_document(content, file_metadata)
             
-            # Store in database
-            document = Document(
-                title=title,
-                source_type=source_type,
-                content=content,
-                source_url=f"file://{file.filename}",
-                file_path=file.filename,
-                author=author,
-                doc_metadata=json.dumps(file_metadata)
-            )
+            # Store in database, with a chunk so the vector can be rebuilt from SQL
+            document_id = document_store.write_documents([({
+                'title': title,
+                'source_type': source_type,
+                'content': content,
+                'source_url': f"file://{file.filename}",
+                'file_path': file.filename,
+                'author': author,
+                'doc_metadata': json.dumps(file_metadata)
+            }, document_store.build_chunk_rows(
+                [(content, file_metadata)], [vector_id], rag_service.get_embeddings([vector_id])
+            ))])[0]
             
-            db.session.add(document)
-            db.session.commit()
+            with metrics.timer('ingest_stage_seconds', stage='sql_commit'):
+                db.session.commit()
             
             logger.info(f"Successfully uploaded and processed file: {file.filename}")
             
@@ -481,7 +639,7 @@ def upload_file():
                 'success': True,
                 'message': f'File "{file.filename}" successfully uploaded and processed',
                 'vector_id': vector_id,
-                'document_id': document.id,
+                'document_id': document_id,
                 'file_info': {
                     'filename': file.filename,
                     'size': len(content),
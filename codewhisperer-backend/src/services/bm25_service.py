@@ -0,0 +1,165 @@
+import re
+import math
+import heapq
+import logging
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Iterable, Tuple
+from src.services.vector_collections import TENANT_KEY, DEFAULT_TENANT
+
+logger = logging.getLogger(__name__)
+
+class BM25Service:
+    """
+    In-memory inverted index with Okapi BM25 scoring.
+
+    Runs alongside the vector database so exact identifiers and error strings
+    in a question can be matched lexically, which dense embeddings handle poorly.
+    """
+
+    _WORD = re.compile(r'[A-Za-z0-9_]+')
+    _CAMEL = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_terms: Dict[str, List[str]] = {}
+        self.doc_source_types: Dict[str, str] = {}
+        self.doc_tenants: Dict[str, str] = {}
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def tokenize(self, text: str) -> List[str]:
+        """
+        Split text into code-aware terms.
+
+        Identifiers are kept whole and also split on snake_case and camelCase
+        boundaries, so `process_query` matches both `process_query` and `query`.
+        """
+        tokens = []
+        for word in self._WORD.findall(text or ''):
+            lowered = word.lower()
+            parts = [part.lower() for piece in word.split('_') for part in self._CAMEL.findall(piece)]
+            if len(lowered) > 1:
+                tokens.append(lowered)
+            if len(parts) > 1 or (parts and parts[0] != lowered):
+                tokens.extend(part for part in parts if len(part) > 1)
+        return tokens
+
+    def add_document(self, doc_id: str, text: str, metadata: Dict[str, Any] = None):
+        """
+        Index a single document
+        """
+        self.add_documents([(doc_id, text, metadata)])
+
+    def add_documents(self, documents: Iterable[Tuple[str, str, Dict[str, Any]]]):
+        """
+        Index multiple documents incrementally
+        """
+        tokenized = [(doc_id, Counter(self.tokenize(text)), metadata or {})
+                     for doc_id, text, metadata in documents]
+
+        with self._lock:
+            for doc_id, term_counts, metadata in tokenized:
+                if doc_id in self.doc_lengths:
+                    self._remove(doc_id)
+
+                for term, count in term_counts.items():
+                    self.postings.setdefault(term, {})[doc_id] = count
+
+                length = sum(term_counts.values())
+                self.doc_lengths[doc_id] = length
+                self.doc_terms[doc_id] = list(term_counts)
+                self.doc_source_types[doc_id] = metadata.get('source_type', 'unknown')
+                self.doc_tenants[doc_id] = metadata.get(TENANT_KEY) or DEFAULT_TENANT
+                self.total_length += length
+
+    def remove_documents(self, doc_ids: Iterable[str]):
+        """
+        Drop documents from the index
+        """
+        with self._lock:
+            for doc_id in doc_ids:
+                if doc_id in self.doc_lengths:
+                    self._remove(doc_id)
+
+    def clear(self):
+        """
+        Remove every document from the index
+        """
+        with self._lock:
+            self.postings.clear()
+            self.doc_lengths.clear()
+            self.doc_terms.clear()
+            self.doc_source_types.clear()
+            self.doc_tenants.clear()
+            self.total_length = 0
+
+    def search(self, query: str, top_k: int = 10, source_type_filter: str = None,
+               tenant: str = None) -> List[Dict[str, Any]]:
+        """
+        Score documents against the query and return the top_k ids with BM25 scores
+        """
+        try:
+            terms = Counter(self.tokenize(query))
+            if not terms:
+                return []
+
+            with self._lock:
+                total_docs = len(self.doc_lengths)
+                if total_docs == 0:
+                    return []
+                avg_length = self.total_length / total_docs
+
+                scores: Dict[str, float] = {}
+                for term, query_count in terms.items():
+                    postings = self.postings.get(term)
+                    if not postings:
+                        continue
+
+                    df = len(postings)
+                    idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                    for doc_id, tf in postings.items():
+                        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                        scores[doc_id] = scores.get(doc_id, 0.0) + query_count * idf * tf * (self.k1 + 1) / (tf + norm)
+
+                if source_type_filter:
+                    scores = {doc_id: score for doc_id, score in scores.items()
+                              if self.doc_source_types.get(doc_id) == source_type_filter}
+                if tenant:
+                    scores = {doc_id: score for doc_id, score in scores.items()
+                              if self.doc_tenants.get(doc_id) == tenant}
+
+            top = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [{'id': doc_id, 'score': score} for doc_id, score in top]
+
+        except Exception as e:
+            logger.error(f"Error searching keyword index: {str(e)}")
+            return []
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get index statistics
+        """
+        total_docs = len(self.doc_lengths)
+        return {
+            'documents': total_docs,
+            'terms': len(self.postings),
+            'average_document_length': round(self.total_length / total_docs, 1) if total_docs else 0
+        }
+
+    def _remove(self, doc_id: str):
+        """
+        Remove a document's postings; caller must hold the lock
+        """
+        for term in self.doc_terms.pop(doc_id, []):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+        self.doc_source_types.pop(doc_id, None)
+        self.doc_tenants.pop(doc_id, None)
@@ -0,0 +1,141 @@
+import os
+import json
+import queue
+import logging
+import threading
+from typing import List, Dict, Any, Tuple
+from src.services.metrics_service import metrics
+from src.services.vector_collections import assign_tenant
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()  # Queued by the parser after the last file
+
+class CodeIngestPipeline:
+    """
+    Ingest many code files with embedding batches that span files.
+
+    A parser thread chunks files into a bounded queue while the calling
+    thread collects chunks from as many files as fit in one batch, embeds
+    them with a single create_embeddings_batch call (which the provider
+    splits into its maximum request size), writes them to the vector store
+    once and commits their SQL rows once. Parsing the next files overlaps
+    with embedding the current batch.
+    """
+
+    def __init__(self, rag_service, ingestion_service, document_store, batch_chunks: int = None):
+        self.rag_service = rag_service
+        self.ingestion_service = ingestion_service
+        self.document_store = document_store
+        # Chunks per embedding batch and commit; ten provider requests' worth unless configured
+        self.batch_chunks = batch_chunks or int(os.getenv('INGEST_BATCH_CHUNKS', '0')) or \
+            10 * getattr(rag_service.embedding_service, 'batch_size', 100)
+        self.queue_size = 256  # Parsed files buffered ahead of the embedder
+
+    def ingest(self, files: List[Dict[str, Any]], repository: str = None, branch: str = 'main',
+               commit_hash: str = None, tenant: str = None) -> Dict[str, Any]:
+        """
+        Ingest {'path', 'content'} file dicts into tenant's collection and return the processed
+        files, chunk and batch counts
+        """
+        parsed = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        parser = threading.Thread(target=self._parse_files, name='code-ingest-parser', daemon=True,
+                                  args=(files, repository, branch, commit_hash, tenant, parsed, stop))
+        parser.start()
+
+        result = {'processed_files': [], 'total_chunks': 0, 'batches': 0}
+        pending, pending_chunks = [], 0
+        try:
+            while True:
+                item = parsed.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                pending.append(item)
+                pending_chunks += len(item[2])
+                if pending_chunks >= self.batch_chunks:
+                    self._flush(pending, repository, branch, commit_hash, result)
+                    pending, pending_chunks = [], 0
+
+            if pending:
+                self._flush(pending, repository, branch, commit_hash, result)
+            return result
+
+        finally:
+            stop.set()  # Unblocks the parser if a batch failed while it waits on a full queue
+
+    def _parse_files(self, files: List[Dict[str, Any]], repository: str, branch: str, commit_hash: str,
+                     tenant: str, parsed: queue.Queue, stop: threading.Event):
+        """
+        Producer: chunk each file and queue (file_path, content, chunks), then _DONE
+        """
+        try:
+            for file_data in files:
+                file_path = file_data.get('path')
+                content = file_data.get('content')
+                if not file_path or not content:
+                    continue
+
+                with metrics.timer('ingest_stage_seconds', stage='parsing'):
+                    chunks = self.ingestion_service.process_code_file(
+                        file_path, content, repository, branch, commit_hash
+                    )
+                    assign_tenant(chunks, tenant)
+                if chunks and not self._put(parsed, (file_path, content, chunks), stop):
+                    return
+            self._put(parsed, _DONE, stop)
+
+        except Exception as e:
+            logger.error(f"Error parsing code files: {str(e)}")
+            self._put(parsed, e, stop)
+
+    def _put(self, parsed: queue.Queue, item, stop: threading.Event) -> bool:
+        while not stop.is_set():
+            try:
+                parsed.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _flush(self, pending: List[Tuple[str, str, List[Tuple[str, Dict[str, Any]]]]], repository: str,
+               branch: str, commit_hash: str, result: Dict[str, Any]):
+        """
+        Embed, store and commit one batch of parsed files
+        """
+        file_vector_ids = self.rag_service.add_files_batch([(chunks, content) for _, content, chunks in pending])
+        embeddings = self.rag_service.get_embeddings([vector_id for ids in file_vector_ids for vector_id in ids])
+
+        documents = []
+        offset = 0
+        for (file_path, content, chunks), vector_ids in zip(pending, file_vector_ids):
+            documents.append(({
+                'source_type': 'code',
+                'source_url': f"file://{file_path}",
+                'title': os.path.basename(file_path),
+                'content': content,
+                'doc_metadata': json.dumps({
+                    'repository': repository,
+                    'branch': branch,
+                    'commit_hash': commit_hash,
+                    'language': self.ingestion_service._detect_language(os.path.splitext(file_path)[1])
+                }),
+                'file_path': file_path,
+                'repository': repository,
+                'branch': branch,
+                'commit_hash': commit_hash
+            }, self.document_store.build_chunk_rows(chunks, vector_ids, embeddings[offset:offset + len(chunks)])))
+            offset += len(chunks)
+
+        self.document_store.write_documents(documents)
+        with metrics.timer('ingest_stage_seconds', stage='sql_commit'):
+            self.document_store.db.session.commit()
+
+        for file_path, _, chunks in pending:
+            result['processed_files'].append({'file_path': file_path, 'chunks_created': len(chunks)})
+        result['total_chunks'] += len(embeddings)
+        result['batches'] += 1
+        logger.info(f"Ingested batch of {len(pending)} files with {len(embeddings)} chunks")
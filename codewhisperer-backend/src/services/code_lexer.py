@@ -0,0 +1,452 @@
+import re
+import bisect
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class CodeBlockLexer:
+    """
+    Single-pass brace-matching lexer for C-family sources (JavaScript,
+    TypeScript and Java).
+
+    Strings, comments, template literals and regex literals are skipped so
+    that only structural braces are matched, which lets us return the full
+    body of every function, class and method instead of just its signature.
+    """
+
+    JS_LANGUAGES = ('javascript', 'typescript')
+    JAVA_LANGUAGES = ('java',)
+
+    # Only the last part of a statement head is matched against the
+    # declaration patterns; real signatures are far shorter than this.
+    MAX_HEADER_CHARS = 1000
+
+    NON_METHOD_NAMES = {
+        'if', 'for', 'while', 'switch', 'catch', 'function', 'return', 'with',
+        'else', 'do', 'try', 'finally', 'synchronized', 'super', 'this', 'new',
+        'throw', 'typeof', 'await', 'yield', 'case'
+    }
+
+    # Keywords after which a `/` starts a regex literal rather than a division
+    REGEX_PREFIX_KEYWORDS = {
+        'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'yield', 'await',
+        'void', 'delete', 'instanceof', 'new', 'throw'
+    }
+
+    _CODE_SPECIAL = re.compile(r'[{}();"\'`/]')
+    _EXPRESSION_SPECIAL = re.compile(r'[{}"\'`/]')
+    _TEMPLATE_SPECIAL = re.compile(r'\\.|`|\$\{', re.S)
+    _STRINGS = {
+        '"': re.compile(r'"(?:[^"\\\n]|\\.)*"?', re.S),
+        "'": re.compile(r"'(?:[^'\\\n]|\\.)*'?", re.S),
+    }
+    _TEXT_BLOCK = re.compile(r'"""(?:[^\\]|\\.)*?(?:"""|$)', re.S)
+    _REGEX_LITERAL = re.compile(r'/(?![*/])(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/[A-Za-z]*')
+    _TRAILING_WORD = re.compile(r'[\w$]+$')
+
+    _PARAMS = r'\((?:[^()]|\([^()]*\))*\)'
+
+    JS_VAR_FUNCTION = re.compile(
+        r'(?<![\w$.])(?:const|let|var)\s+(?P<name>[\w$]+)\s*(?::[^=]+)?=\s*(?:async\s+)?'
+        r'(?:function\b\s*\*?\s*[\w$]*\s*' + _PARAMS + r'\s*(?::[^{}=]*)?'
+        r'|(?:<[^()]*>\s*)?' + _PARAMS + r'\s*(?::[^{}=]*)?=>|[\w$]+\s*=>)\s*$', re.S)
+    JS_FUNCTION = re.compile(
+        r'(?<![\w$.])function\b\s*\*?\s*(?P<name>[\w$]+)?\s*(?:<[^()]*>)?\s*'
+        + _PARAMS + r'\s*(?::[^{}]*)?\s*$', re.S)
+    JS_CLASS = re.compile(
+        r'(?<![\w$.])(?P<type>class|interface|enum)\s+(?P<name>[\w$]+)[^;]*$', re.S)
+    JS_METHOD = re.compile(
+        r'(?<![\w$.])(?P<name>#?[\w$]+)\s*(?:<[^()]*>)?\s*' + _PARAMS
+        + r'\s*(?::[^{};]*)?\s*$', re.S)
+    JS_FIELD_ARROW = re.compile(
+        r'(?<![\w$.])(?P<name>#?[\w$]+)\s*(?::[^=]+)?=\s*(?:async\s+)?'
+        r'(?:' + _PARAMS + r'\s*(?::[^{}=]*)?|[\w$]+)\s*=>\s*$', re.S)
+    JS_EXPRESSION_ARROW = re.compile(
+        r'(?<![\w$.])(?:const|let|var)\s+(?P<name>[\w$]+)\s*(?::[^=]+)?=\s*(?:async\s+)?'
+        r'(?:' + _PARAMS + r'\s*(?::[^{}=]*)?|[\w$]+)\s*=>', re.S)
+
+    JAVA_TYPE = re.compile(
+        r'(?<![\w$.])(?P<type>class|interface|enum|record)\s+(?P<name>[\w$]+)[^;]*$', re.S)
+    JAVA_METHOD = re.compile(
+        r'(?<![\w$.])(?P<name>[\w$]+)\s*' + _PARAMS
+        + r'\s*(?:throws\s+[\w$.,\s<>]+)?\s*$', re.S)
+
+    CLASS_TYPES = ('class', 'interface', 'enum', 'record')
+    CALLABLE_TYPES = ('function', 'method')
+
+    def supports(self, language: str) -> bool:
+        """
+        Check whether the lexer can extract blocks for a language
+        """
+        return language in self.JS_LANGUAGES or language in self.JAVA_LANGUAGES
+
+    def extract_blocks(self, content: str, language: str) -> List[Dict[str, Any]]:
+        """
+        Extract functions, classes and methods with their full bodies
+        """
+        if not content or not self.supports(language):
+            return []
+
+        try:
+            return self._scan(content, language in self.JS_LANGUAGES)
+        except Exception as e:
+            logger.error(f"Error lexing {language} source: {str(e)}")
+            return []
+
+    def _scan(self, content: str, is_js: bool) -> List[Dict[str, Any]]:
+        """
+        Walk the source once, matching structural braces to declarations
+        """
+        n = len(content)
+        line_offsets = [0] + [m.end() for m in re.finditer('\n', content)]
+
+        blocks = []
+        stack = []            # Open statement-level braces, innermost last
+        header = []           # Code since the last statement boundary, literals blanked
+        header_start = 0
+        paren = 0             # Parenthesis depth within the current statement
+        inline = 0            # Depth of braces opened inside an expression
+        callable_depth = 0    # Number of enclosing functions/methods
+        last_code = ''        # Most recent non-blank code, for regex literal detection
+        last_doc = None       # Span of the most recent /** ... */ comment
+        i = 0
+
+        while i < n:
+            m = self._CODE_SPECIAL.search(content, i)
+            if not m:
+                header.append(content[i:])
+                break
+
+            j = m.start()
+            if j > i:
+                segment = content[i:j]
+                header.append(segment)
+                if not segment.isspace():
+                    last_code = segment
+            c = content[j]
+
+            if c == '/':
+                following = content[j + 1:j + 2]
+                if following == '/':
+                    end = content.find('\n', j)
+                    end = n if end == -1 else end
+                    header.append(' ' * (end - j))
+                    i = end
+                    continue
+                if following == '*':
+                    end = content.find('*/', j + 2)
+                    end = n if end == -1 else end + 2
+                    if content.startswith('/**', j):
+                        last_doc = (j, end)
+                    header.append(' ' * (end - j))
+                    i = end
+                    continue
+                if is_js and self._regex_allowed(last_code):
+                    literal = self._REGEX_LITERAL.match(content, j)
+                    if literal:
+                        header.append(self._blank(literal.group()))
+                        last_code = '0'
+                        i = literal.end()
+                        continue
+                header.append(c)
+                last_code = c
+                i = j + 1
+                continue
+
+            if c in '"\'' or (c == '`' and is_js):
+                end = self._skip_literal(content, j, is_js)
+                header.append(self._blank(content[j:end]))
+                last_code = '0'
+                i = end
+                continue
+
+            i = j + 1
+            last_code = c
+
+            if c == '(':
+                paren += 1
+                header.append(c)
+            elif c == ')':
+                paren = max(paren - 1, 0)
+                header.append(c)
+            elif c == ';':
+                if paren or inline:
+                    header.append(c)
+                    continue
+                if is_js and not callable_depth:
+                    block = self._expression_function(content, ''.join(header), header_start,
+                                                      j + 1, line_offsets, last_doc)
+                    if block:
+                        blocks.append(block)
+                header = []
+                header_start = i
+            elif c == '{':
+                if paren or inline:
+                    inline += 1
+                    header.append(c)
+                    continue
+                frame = self._open_frame(content, ''.join(header), header_start, j,
+                                         stack, is_js, callable_depth, last_doc)
+                stack.append(frame)
+                if frame['type'] in self.CALLABLE_TYPES:
+                    callable_depth += 1
+                header = []
+                header_start = i
+            elif c == '}':
+                if inline:
+                    inline -= 1
+                    header.append(c)
+                    continue
+                if stack:
+                    frame = stack.pop()
+                    if frame['type'] in self.CALLABLE_TYPES:
+                        callable_depth -= 1
+                    self._close_frame(content, frame, i, stack, blocks, line_offsets)
+                header = []
+                header_start = i
+                paren = 0
+
+        # Declarations left open by a truncated file run to the end of the source
+        while stack:
+            frame = stack.pop()
+            self._close_frame(content, frame, n, stack, blocks, line_offsets)
+
+        blocks.sort(key=lambda block: block['line_start'])
+        return blocks
+
+    def _open_frame(self, content: str, header: str, header_start: int, brace: int,
+                    stack: List[Dict[str, Any]], is_js: bool, callable_depth: int,
+                    last_doc: Optional[Tuple[int, int]]) -> Dict[str, Any]:
+        """
+        Classify the statement head in front of an opening brace
+        """
+        frame = {'type': None, 'name': None, 'start': brace, 'open': brace, 'children': []}
+
+        tail = header[-self.MAX_HEADER_CHARS:]
+        tail_start = header_start + len(header) - len(tail)
+        parent = stack[-1] if stack else None
+        in_class = parent is not None and parent['type'] in self.CLASS_TYPES
+
+        match = None
+        block_type = None
+        name = None
+
+        if is_js:
+            if not callable_depth:
+                match = self.JS_VAR_FUNCTION.search(tail) or self.JS_FUNCTION.search(tail)
+                if match:
+                    block_type = 'function'
+                    name = match.group('name') or 'anonymous'
+                else:
+                    match = self.JS_CLASS.search(tail)
+                    if match:
+                        block_type = match.group('type')
+                        name = match.group('name')
+            if not match and in_class:
+                match = self.JS_METHOD.search(tail) or self.JS_FIELD_ARROW.search(tail)
+                if match and match.group('name') not in self.NON_METHOD_NAMES:
+                    block_type = 'method'
+                    name = match.group('name')
+                else:
+                    match = None
+        elif not callable_depth:
+            match = self.JAVA_TYPE.search(tail)
+            if match:
+                block_type = match.group('type')
+                name = match.group('name')
+            elif in_class:
+                match = self.JAVA_METHOD.search(tail)
+                if match and self._is_java_method(tail[:match.start()], match.group('name'), parent):
+                    block_type = 'method'
+                    name = match.group('name')
+                else:
+                    match = None
+
+        if match:
+            name_offset = tail_start + match.start('name') if match.group('name') else tail_start + match.start()
+            frame['type'] = block_type
+            frame['name'] = name
+            frame['start'] = self._declaration_start(content, header_start, name_offset, last_doc)
+
+        return frame
+
+    def _close_frame(self, content: str, frame: Dict[str, Any], end: int,
+                     stack: List[Dict[str, Any]], blocks: List[Dict[str, Any]],
+                     line_offsets: List[int]):
+        """
+        Turn a closed declaration frame into an extracted block
+        """
+        if not frame['type']:
+            return
+
+        if frame['children']:
+            text = self._outline(content, frame, end)
+        else:
+            text = content[frame['start']:end]
+
+        blocks.append({
+            'type': frame['type'],
+            'name': frame['name'],
+            'line_start': bisect.bisect_right(line_offsets, frame['start']),
+            'line_end': bisect.bisect_right(line_offsets, max(end - 1, frame['start'])),
+            'content': text
+        })
+
+        # Register the body with the nearest enclosing type so its outline can elide it
+        for ancestor in reversed(stack):
+            if ancestor['type'] in self.CLASS_TYPES:
+                ancestor['children'].append((frame['open'], end))
+                break
+
+    def _outline(self, content: str, frame: Dict[str, Any], end: int) -> str:
+        """
+        Render a type with the bodies of its extracted members elided
+        """
+        parts = []
+        position = frame['start']
+        for body_open, body_end in sorted(frame['children']):
+            if body_open < position:
+                continue
+            parts.append(content[position:body_open + 1])
+            parts.append(' ... ')
+            position = body_end - 1
+        parts.append(content[position:end])
+        return ''.join(parts)
+
+    def _expression_function(self, content: str, header: str, header_start: int, end: int,
+                             line_offsets: List[int],
+                             last_doc: Optional[Tuple[int, int]]) -> Optional[Dict[str, Any]]:
+        """
+        Extract an arrow function whose body is a single expression
+        """
+        match = self.JS_EXPRESSION_ARROW.search(header[-self.MAX_HEADER_CHARS:])
+        if not match:
+            return None
+
+        tail_start = header_start + len(header) - len(header[-self.MAX_HEADER_CHARS:])
+        start = self._declaration_start(content, header_start, tail_start + match.start('name'), last_doc)
+        return {
+            'type': 'function',
+            'name': match.group('name'),
+            'line_start': bisect.bisect_right(line_offsets, start),
+            'line_end': bisect.bisect_right(line_offsets, end - 1),
+            'content': content[start:end]
+        }
+
+    def _declaration_start(self, content: str, header_start: int, name_offset: int,
+                           last_doc: Optional[Tuple[int, int]]) -> int:
+        """
+        Find where a declaration begins, including annotations and its doc comment
+        """
+        start = content.rfind('\n', header_start, name_offset) + 1 or header_start
+        start = max(start, header_start)
+
+        # Pull in decorator/annotation lines directly above the signature
+        while start > header_start:
+            previous_start = max(content.rfind('\n', header_start, start - 1) + 1, header_start)
+            if not content[previous_start:start].strip().startswith('@'):
+                break
+            start = previous_start
+
+        while start < name_offset and content[start].isspace():
+            start += 1
+
+        if last_doc and last_doc[1] <= start and not content[last_doc[1]:start].strip():
+            start = last_doc[0]
+
+        return start
+
+    def _is_java_method(self, prefix: str, name: str, parent: Dict[str, Any]) -> bool:
+        """
+        Reject anonymous classes, lambdas and enum constants that look like method heads
+        """
+        if name in self.NON_METHOD_NAMES:
+            return False
+        if '=' in prefix or re.search(r'\bnew\b', prefix):
+            return False
+        # Methods need a return type or modifier; constructors are named after their type
+        return bool(re.search(r'[\w$>\]]', prefix)) or name == parent['name']
+
+    def _regex_allowed(self, last_code: str) -> bool:
+        """
+        Decide whether a `/` starts a regex literal based on the preceding code
+        """
+        previous = last_code.rstrip()
+        if not previous:
+            return True
+        if previous[-1] in '(,=:[!&|?{};+-*%<>~^}':
+            return True
+        word = self._TRAILING_WORD.search(previous)
+        return bool(word) and word.group() in self.REGEX_PREFIX_KEYWORDS
+
+    def _skip_literal(self, content: str, start: int, is_js: bool) -> int:
+        """
+        Return the offset just past the string or template literal at `start`
+        """
+        quote = content[start]
+        if quote == '`':
+            return self._skip_template(content, start)
+        if quote == '"' and not is_js and content.startswith('"""', start):
+            return self._TEXT_BLOCK.match(content, start).end()
+        return self._STRINGS[quote].match(content, start).end()
+
+    def _skip_template(self, content: str, start: int) -> int:
+        """
+        Skip a template literal, including nested `${...}` expressions
+        """
+        n = len(content)
+        i = start + 1
+        while i < n:
+            m = self._TEMPLATE_SPECIAL.search(content, i)
+            if not m:
+                return n
+            token = m.group()
+            if token == '`':
+                return m.end()
+            if token == '${':
+                i = self._skip_expression(content, m.end())
+            else:
+                i = m.end()
+        return n
+
+    def _skip_expression(self, content: str, start: int) -> int:
+        """
+        Skip a template expression up to and including its closing brace
+        """
+        n = len(content)
+        depth = 0
+        i = start
+        while i < n:
+            m = self._EXPRESSION_SPECIAL.search(content, i)
+            if not m:
+                return n
+            j = m.start()
+            c = content[j]
+            if c in '"\'`':
+                i = self._skip_literal(content, j, True)
+            elif c == '/' and content[j + 1:j + 2] == '/':
+                end = content.find('\n', j)
+                i = n if end == -1 else end
+            elif c == '/' and content[j + 1:j + 2] == '*':
+                end = content.find('*/', j + 2)
+                i = n if end == -1 else end + 2
+            elif c == '{':
+                depth += 1
+                i = j + 1
+            elif c == '}':
+                if depth == 0:
+                    return j + 1
+                depth -= 1
+                i = j + 1
+            else:
+                i = j + 1
+        return n
+
+    def _blank(self, literal: str) -> str:
+        """
+        Replace the inside of a literal with spaces, keeping offsets stable
+        """
+        if len(literal) < 2:
+            return ' ' * len(literal)
+        return literal[0] + ' ' * (len(literal) - 2) + literal[-1]
@@ -0,0 +1,182 @@
+import re
+import logging
+from typing import List, Dict, Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+class ContextPacker:
+    """
+    Packs retrieved chunks into a prompt context under a token budget.
+
+    Overlapping chunks from the same source are merged, oversized chunks are
+    trimmed to the window that best matches the query, and the set of chunks
+    that maximizes rank-weighted relevance within the budget is selected.
+    """
+
+    # Word pieces of up to 4 characters plus punctuation track BPE token
+    # counts far better than raw characters, especially for code.
+    _TOKEN = re.compile(r'\w{1,4}|[^\w\s]')
+
+    def __init__(self, tokenize: Callable[[str], List[str]] = None,
+                 min_overlap: int = 50, budget_granularity: int = 8):
+        self.tokenize = tokenize or (lambda text: re.findall(r'\w+', (text or '').lower()))
+        self.min_overlap = min_overlap  # Shortest shared span treated as chunk overlap
+        self.budget_granularity = budget_granularity  # Token bucket size for the knapsack
+        self.separator = "\n---\n"
+
+    def estimate_tokens(self, text: str) -> int:
+        """
+        Estimate the number of prompt tokens in a text
+        """
+        return len(self._TOKEN.findall(text or ''))
+
+    def pack(self, items: List[Dict[str, Any]], query: str, max_tokens: int) -> List[Dict[str, Any]]:
+        """
+        Select and trim items to fit the token budget.
+
+        Each item needs 'header', 'text' and 'source_key' and is expected in
+        rank order. Returns the chosen items, still in rank order, with
+        'text' replaced by the packed text.
+        """
+        if not items or max_tokens <= 0:
+            return []
+
+        try:
+            merged = self._merge_overlaps(items)
+            query_terms = set(self.tokenize(query))
+            separator_tokens = self.estimate_tokens(self.separator)
+
+            # No single chunk may take more than half of the budget
+            per_item_cap = max(max_tokens // 2, 1)
+            candidates = []
+            for rank, item in enumerate(merged):
+                header_tokens = self.estimate_tokens(item['header']) + separator_tokens
+                text_budget = min(per_item_cap, max_tokens) - header_tokens
+                if text_budget <= 0:
+                    continue
+                text = self._trim_to_window(item['text'], query_terms, text_budget)
+                if not text.strip():
+                    continue
+                packed = dict(item, text=text)
+                packed['tokens'] = header_tokens + self.estimate_tokens(text)
+                packed['value'] = 1.0 / (rank + 1)
+                candidates.append(packed)
+
+            return self._select(candidates, max_tokens)
+
+        except Exception as e:
+            logger.error(f"Error packing context: {str(e)}")
+            return []
+
+    def render(self, packed: List[Dict[str, Any]]) -> str:
+        """
+        Join packed items into the final context string
+        """
+        return self.separator.join(f"{item['header']}\n{item['text']}\n" for item in packed)
+
+    def _merge_overlaps(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Collapse chunks from the same source that contain or overlap each other
+        """
+        merged: List[Dict[str, Any]] = []
+        for item in items:
+            item = dict(item)
+            absorbed = False
+            for kept in merged:
+                if not item.get('source_key') or kept.get('source_key') != item['source_key']:
+                    continue
+                combined = self._combine(kept['text'], item['text'])
+                if combined is not None:
+                    kept['text'] = combined
+                    absorbed = True
+                    break
+            if not absorbed:
+                merged.append(item)
+        return merged
+
+    def _combine(self, first: str, second: str) -> Optional[str]:
+        """
+        Return the union of two texts if one contains or overlaps the other
+        """
+        if second in first:
+            return first
+        if first in second:
+            return second
+
+        for left, right in ((first, second), (second, first)):
+            probe = right[:self.min_overlap]
+            if len(probe) < self.min_overlap:
+                continue
+            position = left.find(probe)
+            while position != -1:
+                if right.startswith(left[position:]):
+                    return left[:position] + right
+                position = left.find(probe, position + 1)
+        return None
+
+    def _trim_to_window(self, text: str, query_terms: set, max_tokens: int) -> str:
+        """
+        Keep the contiguous run of lines with the most query-term hits that fits max_tokens
+        """
+        if self.estimate_tokens(text) <= max_tokens:
+            return text
+
+        lines = text.split('\n')
+        weights = [self.estimate_tokens(line) + 1 for line in lines]
+        hits = [len(query_terms.intersection(self.tokenize(line))) for line in lines]
+
+        best_start, best_end, best_hits = 0, 0, -1
+        start = 0
+        window_weight = 0
+        window_hits = 0
+        for end in range(len(lines)):
+            window_weight += weights[end]
+            window_hits += hits[end]
+            while window_weight > max_tokens and start <= end:
+                window_weight -= weights[start]
+                window_hits -= hits[start]
+                start += 1
+            if start <= end and window_hits > best_hits:
+                best_start, best_end, best_hits = start, end + 1, window_hits
+
+        if best_hits < 0:
+            # Every single line is over budget; fall back to a hard cut of the first one
+            return self._truncate(lines[0], max_tokens) + "\n..."
+
+        window = '\n'.join(lines[best_start:best_end])
+        if best_start > 0:
+            window = "...\n" + window
+        if best_end < len(lines):
+            window += "\n..."
+        return window
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Cut a text after roughly max_tokens tokens
+        """
+        matches = list(self._TOKEN.finditer(text))
+        if len(matches) <= max_tokens:
+            return text
+        return text[:matches[max_tokens - 1].end()] if max_tokens > 0 else ''
+
+    def _select(self, candidates: List[Dict[str, Any]], max_tokens: int) -> List[Dict[str, Any]]:
+        """
+        Choose the subset with the highest total value that fits the budget (0/1 knapsack)
+        """
+        unit = self.budget_granularity
+        capacity = max_tokens // unit
+        weights = [-(-item['tokens'] // unit) for item in candidates]
+
+        # best[c] = (value, chosen indices) using at most c units
+        best = [(0.0, ())] * (capacity + 1)
+        for index, item in enumerate(candidates):
+            weight = weights[index]
+            if weight > capacity:
+                continue
+            for c in range(capacity, weight - 1, -1):
+                value = best[c - weight][0] + item['value']
+                if value > best[c][0]:
+                    best[c] = (value, best[c - weight][1] + (index,))
+
+        chosen = best[capacity][1]
+        return [candidates[index] for index in sorted(chosen)]
@@ -6,6 +6,9 @@ import logging
 from datetime import datetime
 import requests
 from urllib.parse import urlparse
+from src.services.code_lexer import CodeBlockLexer
+from src.services.context_packer import ContextPacker
+from src.services.metrics_service import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +16,10 @@ class DataIngestionService:
     def __init__(self):
         self.chunk_size = 1000  # Characters per chunk
         self.chunk_overlap = 200  # Overlap between chunks
+        self.code_lexer = CodeBlockLexer()
+        self.slack_chunk_tokens = 512  # Token cap per Slack chunk, well under the embedding input limit
+        self.slack_conversation_gap = 3600  # Seconds of silence that end an unthreaded conversation
+        self.estimate_tokens = ContextPacker().estimate_tokens
         
     def process_code_file(self, file_path: str, content: str, repository: str = None, 
                          branch: str = None, commit_hash: str = None) -> List[Tuple[str, Dict[str, Any]]]:
@@ -24,7 +31,8 @@ class DataIngestionService:
             language = self._detect_language(file_extension)
             
             # Extract functions, classes, and other code structures
-            code_blocks = self._extract_code_blocks(content, language)
+            with metrics.timer('ingest_stage_seconds', stage='extraction'):
+                code_blocks = self._extract_code_blocks(content, language)
             
             chunks = []
             
@@ -48,7 +56,8 @@ class DataIngestionService:
                     chunks.append((block['content'], metadata))
             else:
                 # Fall back to simple text chunking
-                text_chunks = self._chunk_text(content)
+                with metrics.timer('ingest_stage_seconds', stage='chunking'):
+                    text_chunks = self._chunk_text(content)
                 for i, chunk in enumerate(text_chunks):
                     metadata = {
                         'source_type': 'code',
@@ -76,7 +85,8 @@ class DataIngestionService:
         """
         try:
             # Extract sections from documentation
-            sections = self._extract_doc_sections(content, doc_type)
+            with metrics.timer('ingest_stage_seconds', stage='extraction'):
+                sections = self._extract_doc_sections(content, doc_type)
             
             chunks = []
             
@@ -95,7 +105,8 @@ class DataIngestionService:
                     chunks.append((section['content'], metadata))
             else:
                 # Fall back to simple text chunking
-                text_chunks = self._chunk_text(content)
+                with metrics.timer('ingest_stage_seconds', stage='chunking'):
+                    text_chunks = self._chunk_text(content)
                 for i, chunk in enumerate(text_chunks):
                     metadata = {
                         'source_type': 'documentation',
@@ -120,7 +131,8 @@ class DataIngestionService:
         """
         try:
             # Combine related messages into meaningful chunks
-            thread_chunks = self._group_slack_messages(messages)
+            with metrics.timer('ingest_stage_seconds', stage='chunking'):
+                thread_chunks = self._group_slack_messages(messages)
             
             chunks = []
             
@@ -185,7 +197,11 @@ class DataIngestionService:
         language_map = {
             '.py': 'python',
             '.js': 'javascript',
+            '.jsx': 'javascript',
+            '.mjs': 'javascript',
+            '.cjs': 'javascript',
             '.ts': 'typescript',
+            '.tsx': 'typescript',
             '.java': 'java',
             '.cpp': 'cpp',
             '.c': 'c',
@@ -217,14 +233,12 @@ class DataIngestionService:
         Extract functions, classes, and other code structures
         """
         blocks = []
-        lines = content.split('\n')
         
         if language == 'python':
-            blocks.extend(self._extract_python_blocks(lines))
-        elif language in ['javascript', 'typescript']:
-            blocks.extend(self._extract_js_blocks(lines))
-        elif language == 'java':
-            blocks.extend(self._extract_java_blocks(lines))
+            blocks.extend(self._extract_python_blocks(content.split('\n')))
+        elif self.code_lexer.supports(language):
+            # Brace-matched extraction keeps full bodies for JS/TS/Java
+            blocks.extend(self.code_lexer.extract_blocks(content, language))
         # Add more language-specific extractors as needed
         
         return blocks
@@ -287,77 +301,6 @@ class DataIngestionService:
         
         return blocks
     
-    def _extract_js_blocks(self, lines: List[str]) -> List[Dict[str, Any]]:
-        """
-        Extract JavaScript/TypeScript functions and classes
-        """
-        blocks = []
-        # Simplified extraction - can be enhanced
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            
-            # Function declarations
-            if re.search(r'function\s+\w+|const\s+\w+\s*=.*=>|let\s+\w+\s*=.*=>', stripped):
-                func_match = re.search(r'(?:function\s+(\w+)|(?:const|let)\s+(\w+))', stripped)
-                if func_match:
-                    func_name = func_match.group(1) or func_match.group(2)
-                    blocks.append({
-                        'type': 'function',
-                        'name': func_name,
-                        'line_start': i + 1,
-                        'content': line,
-                        'line_end': i + 1
-                    })
-            
-            # Class declarations
-            elif stripped.startswith('class '):
-                class_match = re.search(r'class\s+(\w+)', stripped)
-                if class_match:
-                    blocks.append({
-                        'type': 'class',
-                        'name': class_match.group(1),
-                        'line_start': i + 1,
-                        'content': line,
-                        'line_end': i + 1
-                    })
-        
-        return blocks
-    
-    def _extract_java_blocks(self, lines: List[str]) -> List[Dict[str, Any]]:
-        """
-        Extract Java methods and classes
-        """
-        blocks = []
-        # Simplified extraction - can be enhanced
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            
-            # Method declarations
-            if re.search(r'(public|private|protected).*\s+\w+\s*\(', stripped):
-                method_match = re.search(r'\s+(\w+)\s*\(', stripped)
-                if method_match:
-                    blocks.append({
-                        'type': 'method',
-                        'name': method_match.group(1),
-                        'line_start': i + 1,
-                        'content': line,
-                        'line_end': i + 1
-                    })
-            
-            # Class declarations
-            elif re.search(r'(public|private)?\s*class\s+\w+', stripped):
-                class_match = re.search(r'class\s+(\w+)', stripped)
-                if class_match:
-                    blocks.append({
-                        'type': 'class',
-                        'name': class_match.group(1),
-                        'line_start': i + 1,
-                        'content': line,
-                        'line_end': i + 1
-                    })
-        
-        return blocks
-    
     def _extract_doc_sections(self, content: str, doc_type: str) -> List[Dict[str, Any]]:
         """
         Extract sections from documentation
@@ -392,52 +335,68 @@ class DataIngestionService:
     
     def _group_slack_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        Group related Slack messages into meaningful chunks
+        Group Slack messages into chunks: one per thread, by thread_ts, and one per run of
+        unthreaded messages without a long gap, each split to stay under slack_chunk_tokens
         """
         if not messages:
             return []
         
-        # Simple grouping by time proximity and thread
+        groups: Dict[Any, List[Dict[str, Any]]] = {}  # Insertion order follows each group's first message
+        conversation_key = None
+        last_ts = None
+        for message in sorted(messages, key=self._slack_ts):
+            ts = self._slack_ts(message)
+            if message.get('thread_ts'):
+                key = ('thread', message['thread_ts'])
+            else:
+                if conversation_key is None or ts - last_ts > self.slack_conversation_gap:
+                    conversation_key = ('conversation', message.get('ts'))
+                last_ts = ts
+                key = conversation_key
+            groups.setdefault(key, []).append(message)
+        
         chunks = []
-        current_chunk = {
-            'messages': [],
-            'participants': set(),
-            'start_time': None,
-            'end_time': None,
-            'thread_ts': None
-        }
+        for (kind, key_ts), group in groups.items():
+            for chunk_messages in self._split_by_tokens(group):
+                chunks.append({
+                    'messages': chunk_messages,
+                    'participants': list(dict.fromkeys(message.get('user', 'unknown') for message in chunk_messages)),
+                    'start_time': chunk_messages[0].get('ts'),
+                    'end_time': chunk_messages[-1].get('ts'),
+                    'thread_ts': key_ts if kind == 'thread' else chunk_messages[0].get('ts')
+                })
         
+        return chunks
+    
+    def _split_by_tokens(self, messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """
+        Split consecutive messages into runs whose formatted text fits slack_chunk_tokens
+        """
+        runs = [[]]
+        run_tokens = 0
         for message in messages:
-            # Start new chunk if time gap is too large (> 1 hour)
-            if (current_chunk['messages'] and 
-                current_chunk['end_time'] and 
-                float(message.get('ts', 0)) - float(current_chunk['end_time']) > 3600):
-                
-                current_chunk['participants'] = list(current_chunk['participants'])
-                chunks.append(current_chunk)
-                current_chunk = {
-                    'messages': [],
-                    'participants': set(),
-                    'start_time': None,
-                    'end_time': None,
-                    'thread_ts': None
-                }
-            
-            current_chunk['messages'].append(message)
-            current_chunk['participants'].add(message.get('user', 'unknown'))
-            
-            if not current_chunk['start_time']:
-                current_chunk['start_time'] = message.get('ts')
-            current_chunk['end_time'] = message.get('ts')
+            tokens = self.estimate_tokens(self._format_slack_chunk([message]))
+            if tokens > self.slack_chunk_tokens:
+                # A single oversized message is cut into pieces that each fit on their own
+                pieces = [{**message, 'text': piece} for piece in self._chunk_text(message.get('text', ''))]
+            else:
+                pieces = [message]
             
-            if not current_chunk['thread_ts']:
-                current_chunk['thread_ts'] = message.get('thread_ts', message.get('ts'))
+            for piece in pieces:
+                piece_tokens = tokens if piece is message else self.estimate_tokens(self._format_slack_chunk([piece]))
+                if runs[-1] and run_tokens + piece_tokens > self.slack_chunk_tokens:
+                    runs.append([])
+                    run_tokens = 0
+                runs[-1].append(piece)
+                run_tokens += piece_tokens
         
-        if current_chunk['messages']:
-            current_chunk['participants'] = list(current_chunk['participants'])
-            chunks.append(current_chunk)
-        
-        return chunks
+        return [run for run in runs if run]
+    
+    def _slack_ts(self, message: Dict[str, Any]) -> float:
+        try:
+            return float(message.get('ts', 0))
+        except (TypeError, ValueError):
+            return 0.0
     
     def _format_slack_chunk(self, messages: List[Dict[str, Any]]) -> str:
         """
@@ -0,0 +1,343 @@
+import json
+import logging
+import numpy as np
+from typing import List, Dict, Any, Tuple, Iterator
+from sqlalchemy import event, func, insert, inspect, select, text, update
+from src.models.document import Document, DocumentChunk, UserQuery
+from src.services.stats_rollup_service import StatsRollupService
+from src.services.metrics_service import metrics
+from src.services.text_store_service import externalize_entries
+from src.services.keyset_pagination import paginate_ascending
+
+logger = logging.getLogger(__name__)
+
+# Applied to every new SQLite connection; WAL lets readers run during bulk writes
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',  # Durable at checkpoints, no fsync per commit under WAL
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-65536',  # 64 MiB page cache
+    'PRAGMA busy_timeout=5000'
+]
+
+# Indexes replaced by wider ones, dropped when upgrading an existing database
+SUPERSEDED_INDEXES = {
+    'document_chunks': ['ix_document_chunks_document_id']  # Now a prefix of ix_document_chunks_document_id_chunk_index
+}
+
+# Everything a document listing shows, without the content column or a metadata parse per row
+DOCUMENT_SUMMARY_COLUMNS = (
+    Document.id, Document.source_type, Document.source_url, Document.title, Document.author,
+    Document.created_at, Document.updated_at, Document.file_path, Document.repository,
+    Document.branch, Document.commit_hash
+)
+
+def configure_sqlite_engine(engine):
+    """
+    Tune SQLite connections for bulk ingestion; other databases are left untouched
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+    # Connections opened before the listener was registered would miss the pragmas
+    engine.dispose()
+    logger.info("Configured SQLite connections with WAL journaling")
+
+def upgrade_schema(engine):
+    """
+    Add columns and indexes introduced after a database was created, since create_all() only creates missing tables
+    """
+    inspector = inspect(engine)
+    columns = {column['name'] for column in inspector.get_columns('document_chunks')}
+    if 'embedding' not in columns:
+        blob_type = DocumentChunk.__table__.c.embedding.type.compile(dialect=engine.dialect)
+        with engine.begin() as connection:
+            connection.execute(text(f"ALTER TABLE document_chunks ADD COLUMN embedding {blob_type}"))
+        logger.info("Added embedding column to document_chunks")
+
+    for table in (Document.__table__, DocumentChunk.__table__, UserQuery.__table__):
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+                logger.info(f"Created index {index.name} on {table.name}")
+        for name in SUPERSEDED_INDEXES.get(table.name, []):
+            if name in existing:
+                with engine.begin() as connection:
+                    connection.execute(text(f"DROP INDEX {name}"))
+                logger.info(f"Dropped superseded index {name} on {table.name}")
+
+class DocumentStoreService:
+    """
+    Bulk persistence for ingested documents and their chunks.
+
+    Rows go through SQLAlchemy Core executemany instead of one ORM object
+    per chunk, and documents for many files are written in one transaction.
+    The caller owns the transaction and commits the session afterwards.
+    """
+
+    def __init__(self, db, chunk_batch_size: int = 5000):
+        self.db = db
+        self.chunk_batch_size = chunk_batch_size  # Chunk rows per executemany call
+        self.rollups = StatsRollupService(db)  # Document counts kept in step with every write
+
+    def build_chunk_rows(self, chunks: List[Tuple[str, Dict[str, Any]]], vector_ids: List[str],
+                         embeddings: List[List[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Turn (chunk_text, metadata) pairs, their vector ids and embeddings into document_chunks rows
+        """
+        embeddings = embeddings or []
+        return [{
+            'chunk_text': chunk_text,
+            'chunk_index': i,
+            'embedding_id': vector_ids[i] if i < len(vector_ids) else None,
+            'embedding': self.encode_embedding(embeddings[i]) if i < len(embeddings) else None,
+            'chunk_metadata': json.dumps(metadata)
+        } for i, (chunk_text, metadata) in enumerate(chunks)]
+
+    def encode_embedding(self, embedding: List[float]) -> bytes:
+        """
+        Pack an embedding as float32 bytes, half the size of a float64 array and far below a pickled list
+        """
+        if embedding is None:
+            return None
+        return np.asarray(embedding, dtype=np.float32).tobytes()
+
+    def decode_embedding(self, blob: bytes) -> List[float]:
+        """
+        Unpack float32 bytes written by encode_embedding
+        """
+        return np.frombuffer(blob, dtype=np.float32).tolist()
+
+    def write_documents(self, documents: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]) -> List[int]:
+        """
+        Insert (document row, chunk rows) pairs in the current transaction and return the document ids
+        """
+        if not documents:
+            return []
+
+        try:
+            with metrics.timer('ingest_stage_seconds', stage='sql_write'):
+                document_ids = self._insert_documents([document for document, _ in documents])
+
+                chunk_rows = []
+                for document_id, (_, chunks) in zip(document_ids, documents):
+                    for chunk in chunks:
+                        chunk_rows.append({**chunk, 'document_id': document_id})
+
+                for i in range(0, len(chunk_rows), self.chunk_batch_size):
+                    self.db.session.execute(insert(DocumentChunk), chunk_rows[i:i + self.chunk_batch_size])
+
+                self.rollups.record_documents(
+                    (document.get('source_type'), None, 1, len(chunks)) for document, chunks in documents
+                )
+
+            logger.info(f"Wrote {len(document_ids)} documents with {len(chunk_rows)} chunks")
+            return document_ids
+
+        except Exception as e:
+            logger.error(f"Error writing documents: {str(e)}")
+            raise
+
+    def _insert_documents(self, rows: List[Dict[str, Any]]) -> List[int]:
+        """
+        Insert document rows, fetching their generated ids in one round trip where supported
+        """
+        dialect = self.db.session.get_bind().dialect
+        if dialect.insert_executemany_returning_sort_by_parameter_order:
+            result = self.db.session.execute(
+                insert(Document).returning(Document.id, sort_by_parameter_order=True), rows
+            )
+            return list(result.scalars())
+
+        # Fall back to one statement per document; chunks are still written in bulk
+        return [self.db.session.execute(insert(Document).values(**row)).inserted_primary_key[0] for row in rows]
+
+    def rebuild_vector_index(self, vector_db, batch_size: int = 1000,
+                             embedding_service=None, text_store=None) -> Dict[str, int]:
+        """
+        Restore every chunk's vector into vector_db from SQL, one page of chunks at a time.
+
+        Pages are read by primary key so only batch_size rows are decoded at once.
+        Chunks without a stored embedding are re-embedded when an embedding service
+        is given, and their embeddings are written back; otherwise they are skipped.
+        With a text store, chunk texts go there as spans of their document's
+        content and vector_db keeps only the references. The caller persists
+        vector_db afterwards.
+        """
+        stats = {'restored': 0, 'embedded': 0, 'skipped': 0}
+        last_id = 0
+
+        try:
+            while True:
+                rows = self.db.session.execute(
+                    select(DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.embedding_id,
+                           DocumentChunk.chunk_text, DocumentChunk.chunk_metadata, DocumentChunk.embedding)
+                    .where(DocumentChunk.id > last_id, DocumentChunk.embedding_id.isnot(None))
+                    .order_by(DocumentChunk.id)
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+
+                missing = [row for row in rows if row.embedding is None]
+                new_embeddings = {}
+                if missing and embedding_service is not None:
+                    embeddings = embedding_service.create_embeddings_batch([row.chunk_text for row in missing])
+                    new_embeddings = {row.id: embedding for row, embedding in zip(missing, embeddings)}
+                    self.db.session.execute(update(DocumentChunk), [
+                        {'id': chunk_id, 'embedding': self.encode_embedding(embedding)}
+                        for chunk_id, embedding in new_embeddings.items()
+                    ])
+                    self.db.session.commit()
+
+                entries, vector_ids, document_ids = [], [], []
+                for row in rows:
+                    if row.embedding is not None:
+                        embedding = self.decode_embedding(row.embedding)
+                        stats['restored'] += 1
+                    elif row.id in new_embeddings:
+                        embedding = new_embeddings[row.id]
+                        stats['embedded'] += 1
+                    else:
+                        stats['skipped'] += 1
+                        continue
+                    metadata = json.loads(row.chunk_metadata) if row.chunk_metadata else {}
+                    entries.append((row.chunk_text, embedding, metadata))
+                    vector_ids.append(row.embedding_id)
+                    document_ids.append(row.document_id)
+
+                if entries and text_store is not None:
+                    entries = self._externalize_by_document(text_store, entries, document_ids)
+                if entries:
+                    vector_db.add_vectors_batch(entries, persist=False, vector_ids=vector_ids)
+
+            logger.info(f"Rebuilt vector index from SQL: {stats}")
+            return stats
+
+        except Exception as e:
+            logger.error(f"Error rebuilding vector index: {str(e)}")
+            self.db.session.rollback()
+            raise
+
+    def _externalize_by_document(self, text_store, entries: List[Tuple[str, List[float], Dict[str, Any]]],
+                                 document_ids: List[int]) -> List[Tuple[str, List[float], Dict[str, Any]]]:
+        """
+        Move entry texts into text_store, as spans of the content of the document each came from
+        """
+        contents = dict(self.db.session.execute(
+            select(Document.id, Document.content).where(Document.id.in_(set(document_ids)))
+        ).all())
+
+        positions_by_document: Dict[int, List[int]] = {}
+        for position, document_id in enumerate(document_ids):
+            positions_by_document.setdefault(document_id, []).append(position)
+
+        externalized = [None] * len(entries)
+        for document_id, positions in positions_by_document.items():
+            stored = externalize_entries(text_store, [entries[i] for i in positions], contents.get(document_id))
+            for position, entry in zip(positions, stored):
+                externalized[position] = entry
+        return externalized
+
+    def document_summaries(self, source_type: str = None, include_metadata: bool = False):
+        """
+        Query of document summary rows, DOCUMENT_SUMMARY_COLUMNS plus doc_metadata if asked for
+        """
+        columns = DOCUMENT_SUMMARY_COLUMNS + ((Document.doc_metadata,) if include_metadata else ())
+        query = self.db.session.query(*columns)
+        if source_type:
+            query = query.filter(Document.source_type == source_type)
+        return query
+
+    def summary_to_dict(self, row) -> Dict[str, Any]:
+        """
+        Serialize a summary row the way Document.to_dict() does, without loading the document
+        """
+        summary = dict(row._mapping)
+        for key in ('created_at', 'updated_at'):
+            summary[key] = summary[key].isoformat() if summary[key] else None
+        if 'doc_metadata' in summary:
+            doc_metadata = summary.pop('doc_metadata')
+            summary['metadata'] = json.loads(doc_metadata) if doc_metadata else {}
+        return summary
+
+    def get_chunk_page(self, document_id: int, per_page: int, cursor: str = None,
+                       include_text: bool = True) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        One page of a document's chunks in chunk order, without embeddings, and the cursor of the next page
+        """
+        columns = [DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.chunk_index,
+                   DocumentChunk.embedding_id, DocumentChunk.chunk_metadata, DocumentChunk.created_at]
+        if include_text:
+            columns.append(DocumentChunk.chunk_text)
+
+        rows, next_cursor = paginate_ascending(
+            self.db.session.query(*columns).filter(DocumentChunk.document_id == document_id),
+            (DocumentChunk.chunk_index, DocumentChunk.id), per_page, cursor
+        )
+        chunks = []
+        for row in rows:
+            chunk = dict(row._mapping)
+            chunk_metadata = chunk.pop('chunk_metadata')
+            chunk['metadata'] = json.loads(chunk_metadata) if chunk_metadata else {}
+            chunk['created_at'] = chunk['created_at'].isoformat() if chunk['created_at'] else None
+            chunks.append(chunk)
+        return chunks, next_cursor
+
+    def count_chunks(self, document_id: int) -> int:
+        return self.db.session.scalar(
+            select(func.count(DocumentChunk.id)).where(DocumentChunk.document_id == document_id)
+        )
+
+    def export_documents(self, source_type: str = None, include_content: bool = False,
+                         include_chunks: bool = False, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every document as a dict, oldest first, reading batch_size documents per query.
+
+        Only one batch of rows is held at a time, so exports of any size run
+        in constant memory; content and chunk texts are read only when asked for.
+        """
+        columns = DOCUMENT_SUMMARY_COLUMNS + (Document.doc_metadata,)
+        if include_content:
+            columns += (Document.content,)
+
+        last_id = 0
+        while True:
+            query = select(*columns).where(Document.id > last_id)
+            if source_type:
+                query = query.where(Document.source_type == source_type)
+            rows = self.db.session.execute(query.order_by(Document.id).limit(batch_size)).all()
+            if not rows:
+                return
+            last_id = rows[-1].id
+
+            chunks_by_document: Dict[int, List[Dict[str, Any]]] = {}
+            if include_chunks:
+                chunk_rows = self.db.session.execute(
+                    select(DocumentChunk.document_id, DocumentChunk.chunk_index, DocumentChunk.embedding_id,
+                           DocumentChunk.chunk_text, DocumentChunk.chunk_metadata)
+                    .where(DocumentChunk.document_id.in_([row.id for row in rows]))
+                    .order_by(DocumentChunk.document_id, DocumentChunk.chunk_index, DocumentChunk.id)
+                )
+                for chunk in chunk_rows:
+                    chunks_by_document.setdefault(chunk.document_id, []).append({
+                        'chunk_index': chunk.chunk_index,
+                        'embedding_id': chunk.embedding_id,
+                        'chunk_text': chunk.chunk_text,
+                        'metadata': json.loads(chunk.chunk_metadata) if chunk.chunk_metadata else {}
+                    })
+
+            for row in rows:
+                record = self.summary_to_dict(row)
+                if include_chunks:
+                    record['chunks'] = chunks_by_document.get(row.id, [])
+                yield record
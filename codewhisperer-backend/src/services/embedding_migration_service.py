@@ -0,0 +1,354 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from typing import List, Dict, Any
+from sqlalchemy import select, update
+from src.models.document import DocumentChunk
+from src.services.vector_db_service import VectorEntry, create_vector_store
+from src.services.vector_collections import MODEL_KEY
+from src.services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+def create_embedding_service(model: str):
+    """
+    Embedding service for a model name, as reported by the services' model attribute
+    """
+    if model == 'models/embedding-001':
+        from src.services.gemini_embedding_service import GeminiEmbeddingService
+        return GeminiEmbeddingService()
+    match = re.fullmatch(r'local-ngram-(\d+)', model)
+    if match:
+        from src.services.local_embedding_service import LocalEmbeddingService
+        return LocalEmbeddingService(embedding_dim=int(match.group(1)))
+    raise ValueError(f"Unsupported embedding model: {model}")
+
+
+class IndexManifest:
+    """
+    Versioned record of which vector index serves queries, in database/vector_index.json.
+
+    'active' and 'previous' are {'model', 'storage_path'} specs; 'pending' is
+    the shadow index a migration is filling. Without a manifest the default
+    store serves, with the embedding service chosen from GEMINI_API_KEY.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(os.path.dirname(__file__), '..', 'database', 'vector_index.json')
+
+    def read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'version': 0, 'active': None, 'previous': None, 'pending': None}
+
+    def write(self, manifest: Dict[str, Any]):
+        """
+        Replace the manifest atomically, so a crash leaves the old or the new version
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temporary_path, self.path)
+
+
+class EmbeddingMigrationService:
+    """
+    Re-embeds the corpus with another embedding model without taking search down.
+
+    A background thread reads each entry's text from the active index,
+    embeds it with the new model at no more than texts_per_minute, and
+    writes it under the same vector id into a shadow index stored next to
+    the active one. Queries keep using the active index meanwhile. swap()
+    brings the shadow up to date with writes made during the migration,
+    copies its embeddings to SQL and then switches the service to it in one
+    step, recording a new manifest version. The replaced index stays on disk
+    (and loaded, until the process restarts), so rollback() can switch back
+    the same way. A migration interrupted by a restart resumes where its
+    shadow index was last saved. Other worker processes pick up a swap when
+    they restart.
+    """
+
+    def __init__(self, rag_service, document_store, texts_per_minute: int = None):
+        self.rag_service = rag_service
+        self.document_store = document_store
+        self.db = document_store.db
+        # API budget for re-embedding; 0 means unthrottled, e.g. for the local model
+        self.texts_per_minute = texts_per_minute if texts_per_minute is not None else \
+            int(os.getenv('REEMBED_TEXTS_PER_MINUTE', '1500'))
+        self.batch_size = 100  # Texts per embedding call, within every provider's request limit
+        self.save_interval = 60  # Seconds between saves of the shadow index, bounding work lost to a restart
+        self.manifest = rag_service.index_manifest
+        self.status: Dict[str, Any] = {'state': 'idle'}
+        self._shadow = None  # (spec, embedding service, vector store) of the migration
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()  # Serializes start, swap and rollback
+
+    def start(self, app, model: str, texts_per_minute: int = None, swap_when_done: bool = False) -> Dict[str, Any]:
+        """
+        Start re-embedding into a shadow index for model in a daemon thread
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                raise ValueError(f"A migration to {self.status.get('model')} is already running")
+            if model == self.rag_service.embedding_model:
+                raise ValueError(f"{model} already serves queries")
+            embedding_service = create_embedding_service(model)
+
+            manifest = self.manifest.read()
+            spec = manifest.get('pending')
+            if not spec or spec['model'] != model:
+                spec = {'model': model, 'storage_path': self._shadow_path(model, manifest['version'] + 1)}
+                manifest['pending'] = spec
+                self.manifest.write(manifest)
+
+            budget = self.texts_per_minute if texts_per_minute is None else texts_per_minute
+            self._stop.clear()
+            self.status = {'state': 'running', 'model': model, 'storage_path': spec['storage_path'],
+                           'texts_per_minute': budget, 'total': None, 'embedded': 0,
+                           'started_at': time.time(), 'swap_when_done': swap_when_done}
+            self._thread = threading.Thread(target=self._run, name='embedding-migration', daemon=True,
+                                            args=(app, spec, embedding_service, budget, swap_when_done))
+            self._thread.start()
+            logger.info(f"Started re-embedding into {spec['storage_path']} with {model}")
+            return dict(self.status)
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Block until the migration thread finishes; returns False on timeout
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def cancel(self):
+        """
+        Stop the migration after the current batch; the shadow index is saved and a later start resumes it
+        """
+        self._stop.set()
+        self.wait()
+
+    def get_status(self) -> Dict[str, Any]:
+        manifest = self.manifest.read()
+        status = dict(self.status)
+        status.update({
+            'active_model': self.rag_service.embedding_model,
+            'index_version': manifest['version'],
+            'previous_model': (manifest.get('previous') or {}).get('model')
+        })
+        return status
+
+    def swap(self) -> Dict[str, Any]:
+        """
+        Serve queries from the finished shadow index, e.g. one the reembed command completed
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                raise ValueError("The migration is still running")
+            if self._shadow is None:
+                pending = self.manifest.read().get('pending')
+                if not pending or not pending.get('complete'):
+                    raise ValueError("No finished migration to swap in")
+                self._shadow = (pending, create_embedding_service(pending['model']),
+                                create_vector_store(storage_path=pending['storage_path'], autoload=True, shared=False))
+            spec, embedding_service, shadow = self._shadow
+            result = self._activate(spec, embedding_service, shadow)
+            self._shadow = None
+            self.status = {'state': 'swapped', 'model': spec['model']}
+            return result
+
+    def rollback(self) -> Dict[str, Any]:
+        """
+        Serve queries from the index the last swap replaced again
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                raise ValueError("Cancel the running migration before rolling back")
+            previous = self.manifest.read().get('previous')
+            if not previous:
+                raise ValueError("There is no previous index to roll back to")
+
+            loaded = self.rag_service.previous_index
+            if loaded is not None and loaded[1].storage_path == previous['storage_path']:
+                embedding_service, vector_db = loaded
+            else:
+                embedding_service = create_embedding_service(previous['model'])
+                vector_db = create_vector_store(storage_path=previous['storage_path'], autoload=True, shared=False)
+            result = self._activate(previous, embedding_service, vector_db)
+            self.status = {'state': 'rolled_back', 'model': previous['model']}
+            return result
+
+    def _run(self, app, spec: Dict[str, Any], embedding_service, texts_per_minute: int, swap_when_done: bool):
+        """
+        Fill the shadow index, skipping entries a previous run already embedded
+        """
+        shadow = None
+        try:
+            self.rag_service.wait_until_loaded()
+            shadow = create_vector_store(storage_path=spec['storage_path'], autoload=True, shared=False)
+            source = self.rag_service.vector_db
+            done = set(shadow.get_vector_ids())
+            todo = [vector_id for vector_id in source.get_vector_ids() if vector_id not in done]
+            self.status.update({'total': len(done) + len(todo), 'embedded': len(done)})
+
+            start_time = last_save = time.time()
+            embedded = 0
+            for i in range(0, len(todo), self.batch_size):
+                if self._stop.is_set():
+                    break
+                entries = [source.get_vector(vector_id) for vector_id in todo[i:i + self.batch_size]]
+                embedded += self._reembed([entry for entry in entries if entry is not None],
+                                          embedding_service, shadow, spec['model'])
+                self.status['embedded'] = len(done) + embedded
+
+                if texts_per_minute:
+                    # Stay within the budget on average since the start of the run
+                    delay = start_time + embedded * 60.0 / texts_per_minute - time.time()
+                    if delay > 0:
+                        self._stop.wait(delay)
+                if time.time() - last_save >= self.save_interval:
+                    shadow.save_vectors()
+                    last_save = time.time()
+
+            shadow.save_vectors()
+            if self._stop.is_set():
+                shadow.close()
+                self.status['state'] = 'cancelled'
+                logger.info(f"Cancelled re-embedding with {spec['model']} at {self.status['embedded']} entries")
+                return
+
+            manifest = self.manifest.read()
+            if (manifest.get('pending') or {}).get('storage_path') == spec['storage_path']:
+                manifest['pending'] = spec = {**spec, 'complete': True}
+                self.manifest.write(manifest)
+            self._shadow = (spec, embedding_service, shadow)
+            self.status.update({'state': 'ready', 'finished_at': time.time()})
+            logger.info(f"Re-embedded {self.status['embedded']} entries with {spec['model']} "
+                        f"in {time.time() - start_time:.1f}s")
+            if swap_when_done:
+                with app.app_context():
+                    self.swap()
+
+        except Exception as e:
+            logger.error(f"Error re-embedding with {spec['model']}: {str(e)}")
+            self.status.update({'state': 'failed', 'error': str(e)})
+            if shadow is not None and self._shadow is None:
+                shadow.close()
+
+    def _reembed(self, entries: List[VectorEntry], embedding_service, target, model: str) -> int:
+        """
+        Embed entries' texts with embedding_service and write them to target under their ids
+        """
+        if not entries:
+            return 0
+        text_store = self.rag_service.text_store
+        with metrics.timer('ingest_stage_seconds', stage='reembedding'):
+            embeddings = embedding_service.create_embeddings_batch(
+                [text_store.text_of(entry.text, entry.metadata) for entry in entries]
+            )
+        target.add_vectors_batch(
+            [(entry.text, embedding, {**entry.metadata, MODEL_KEY: model}) for entry, embedding in zip(entries, embeddings)],
+            persist=False, vector_ids=[entry.id for entry in entries]
+        )
+        metrics.increment('embedding_migration_texts_total', len(entries), model=model)
+        return len(entries)
+
+    def _activate(self, spec: Dict[str, Any], embedding_service, vector_db) -> Dict[str, Any]:
+        """
+        Catch vector_db up with the active index, copy its embeddings to SQL and make it the active index.
+
+        Runs with the service's write lock held, so no ingest lands in the old
+        index between the catch-up and the switch.
+        """
+        rag_service = self.rag_service
+        rag_service.wait_until_loaded()  # Comparing with a store still loading would drop most of the index
+        with rag_service.write_lock:
+            active = rag_service.vector_db
+            active_ids = set(active.get_vector_ids())
+            target_ids = set(vector_db.get_vector_ids())
+
+            missing = sorted(active_ids - target_ids)
+            for i in range(0, len(missing), self.batch_size):
+                entries = [active.get_vector(vector_id) for vector_id in missing[i:i + self.batch_size]]
+                self._reembed([entry for entry in entries if entry is not None], embedding_service, vector_db, spec['model'])
+            stale = list(target_ids - active_ids)
+            if stale:
+                vector_db.delete_vectors(stale, persist=False)
+            vector_db.save_vectors()
+
+            updated = self._write_sql_embeddings(vector_db, spec['model'])
+
+            spec = {'model': spec['model'], 'storage_path': spec['storage_path']}
+            manifest = self.manifest.read()
+            replaced = manifest.get('active') or {'model': rag_service.embedding_model, 'storage_path': active.storage_path}
+            manifest.update({'version': manifest['version'] + 1, 'active': spec, 'previous': replaced})
+            if (manifest.get('pending') or {}).get('storage_path') == spec['storage_path']:
+                manifest['pending'] = None
+            self.manifest.write(manifest)
+
+            serving = self._serving_store(spec, vector_db)
+            rag_service.activate_index(embedding_service, serving, manifest['version'])
+
+        result = {'version': manifest['version'], 'model': spec['model'], 'previous_model': replaced['model'],
+                  'caught_up': len(missing), 'removed': len(stale), 'chunks_updated': updated}
+        logger.info(f"Activated vector index {result}")
+        return result
+
+    def _serving_store(self, spec: Dict[str, Any], vector_db):
+        """
+        The store queries should use for spec: vector_db itself unless the deployment serves from shared memory
+        or replicates the serving store
+        """
+        serving = create_vector_store(storage_path=spec['storage_path'], autoload=False, replicated=True)
+        if type(serving) is type(vector_db) and getattr(serving, 'replication', None) is None:
+            return vector_db
+        serving.load_vectors()
+        vector_db.close()
+        return serving
+
+    def _write_sql_embeddings(self, vector_db, model: str) -> int:
+        """
+        Store the index's embeddings and model with every chunk, so rebuilds and reconciliation follow it
+        """
+        updated = 0
+        last_id = 0
+        while True:
+            rows = self.db.session.execute(
+                select(DocumentChunk.id, DocumentChunk.embedding_id, DocumentChunk.chunk_metadata)
+                .where(DocumentChunk.id > last_id, DocumentChunk.embedding_id.isnot(None))
+                .order_by(DocumentChunk.id)
+                .limit(1000)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            updates = []
+            for row in rows:
+                entry = vector_db.get_vector(row.embedding_id)
+                if entry is not None:
+                    metadata = json.loads(row.chunk_metadata) if row.chunk_metadata else {}
+                    metadata[MODEL_KEY] = model
+                    updates.append({'id': row.id, 'embedding': self.document_store.encode_embedding(entry.embedding),
+                                    'chunk_metadata': json.dumps(metadata)})
+            if updates:
+                self.db.session.execute(update(DocumentChunk), updates)
+                updated += len(updates)
+
+        self.db.session.commit()
+        return updated
+
+    def _shadow_path(self, model: str, version: int) -> str:
+        """
+        Storage of a new index, next to the active one and named after its model and version
+        """
+        root, extension = os.path.splitext(os.path.normpath(self.rag_service.vector_db.storage_path))
+        root = re.sub(r'-v\d+-[A-Za-z0-9-]+$', '', root)  # The active index may itself be a migrated one
+        return f"{root}-v{version}-{re.sub(r'[^A-Za-z0-9]+', '-', model).strip('-')}{extension}"
@@ -1,4 +1,3 @@
-import openai
 import numpy as np
 from typing import List, Dict, Any
 import logging
@@ -9,6 +8,9 @@ logger = logging.getLogger(__name__)
 
 class EmbeddingService:
     def __init__(self):
+        # Imported here so the SDK only loads when this service is used
+        import openai
+        
         # Use standard OpenAI API for embeddings
         self.client = openai.OpenAI(
             api_key=os.getenv('OPENAI_API_KEY'),
@@ -5,11 +5,8 @@ import json
 import logging
 from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
-import PyPDF2
-import docx
-import openpyxl
-import pandas as pd
 from pathlib import Path
+from src.services.metrics_service import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -72,7 +69,8 @@ class FileProcessingService:
             process_func = self.supported_extensions[extension]
             
             # Process the file
-            content, file_metadata = process_func(file_content, filename)
+            with metrics.timer('ingest_stage_seconds', stage='extraction'):
+                content, file_metadata = process_func(file_content, filename)
             
             # Merge with provided metadata
             if metadata:
@@ -168,6 +166,8 @@ class FileProcessingService:
     def _process_excel_file(self, file_content: bytes, filename: str) -> Tuple[str, Dict[str, Any]]:
         """Process Excel files (XLSX, XLS)"""
         try:
+            import openpyxl  # Imported on first use to keep startup fast
+            
             # Load Excel file
             excel_file = io.BytesIO(file_content)
             workbook = openpyxl.load_workbook(excel_file, data_only=True)
@@ -219,6 +219,8 @@ class FileProcessingService:
     def _process_pdf_file(self, file_content: bytes, filename: str) -> Tuple[str, Dict[str, Any]]:
         """Process PDF files"""
         try:
+            import PyPDF2  # Imported on first use to keep startup fast
+            
             pdf_file = io.BytesIO(file_content)
             pdf_reader = PyPDF2.PdfReader(pdf_file)
             
@@ -253,6 +255,8 @@ class FileProcessingService:
     def _process_docx_file(self, file_content: bytes, filename: str) -> Tuple[str, Dict[str, Any]]:
         """Process DOCX files"""
         try:
+            import docx  # Imported on first use to keep startup fast
+            
             docx_file = io.BytesIO(file_content)
             doc = docx.Document(docx_file)
             
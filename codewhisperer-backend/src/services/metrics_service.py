@@ -0,0 +1,164 @@
+import math
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Tuple, Iterator
+
+logger = logging.getLogger(__name__)
+
+class MetricsRegistry:
+    """
+    Process-wide latency summaries, counters and gauges.
+
+    Summaries keep a sliding window of recent observations per label set,
+    so p50/p95/p99 reflect current behaviour. Everything is rendered in
+    the Prometheus text exposition format for the /metrics endpoint.
+    """
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, window_size: int = 2048):
+        self.window_size = window_size
+        self._lock = threading.Lock()
+        self._help: Dict[str, str] = {}
+        self._summaries: Dict[str, Dict[Tuple, Dict[str, Any]]] = {}
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._gauges: Dict[str, Dict[Tuple, float]] = {}
+
+    def describe(self, name: str, help_text: str):
+        """
+        Register the HELP text for a metric
+        """
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Record one observation of a summary metric
+        """
+        key = self._label_key(labels)
+        with self._lock:
+            series = self._summaries.setdefault(name, {}).get(key)
+            if series is None:
+                series = {'window': deque(maxlen=self.window_size), 'sum': 0.0, 'count': 0}
+                self._summaries[name][key] = series
+            series['window'].append(value)
+            series['sum'] += value
+            series['count'] += 1
+
+    def increment(self, name: str, amount: float = 1.0, **labels):
+        """
+        Increase a counter
+        """
+        key = self._label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """
+        Set a gauge to its current value
+        """
+        key = self._label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """
+        Time a block of code and record it in a summary
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def get_quantiles(self, name: str, **labels) -> Dict[str, float]:
+        """
+        Get p50/p95/p99 for one summary series
+        """
+        with self._lock:
+            series = self._summaries.get(name, {}).get(self._label_key(labels))
+            values = sorted(series['window']) if series else []
+        return {f"p{int(q * 100)}": self._quantile(values, q) for q in self.QUANTILES}
+
+    def render_prometheus(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            summaries = {name: {key: (sorted(series['window']), series['sum'], series['count'])
+                                for key, series in by_labels.items()}
+                         for name, by_labels in self._summaries.items()}
+            counters = {name: dict(by_labels) for name, by_labels in self._counters.items()}
+            gauges = {name: dict(by_labels) for name, by_labels in self._gauges.items()}
+
+        lines = []
+        for name in sorted(summaries):
+            self._render_header(lines, name, 'summary')
+            for key, (values, total, count) in sorted(summaries[name].items()):
+                for q in self.QUANTILES:
+                    labels = self._format_labels(key + (('quantile', str(q)),))
+                    lines.append(f"{name}{labels} {self._quantile(values, q)}")
+                lines.append(f"{name}_sum{self._format_labels(key)} {total}")
+                lines.append(f"{name}_count{self._format_labels(key)} {count}")
+
+        for name in sorted(counters):
+            self._render_header(lines, name, 'counter')
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{self._format_labels(key)} {value}")
+
+        for name in sorted(gauges):
+            self._render_header(lines, name, 'gauge')
+            for key, value in sorted(gauges[name].items()):
+                lines.append(f"{name}{self._format_labels(key)} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    def _render_header(self, lines: list, name: str, metric_type: str):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    def _quantile(self, values: list, q: float) -> float:
+        """
+        Nearest-rank quantile of a sorted list
+        """
+        if not values:
+            return float('nan')
+        index = min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))
+        return values[index]
+
+    def _label_key(self, labels: Dict[str, Any]) -> Tuple:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def _format_labels(self, key: Tuple) -> str:
+        if not key:
+            return ''
+        escaped = [(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                   for name, value in key]
+        return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+# Shared registry for the whole process
+metrics = MetricsRegistry()
+
+metrics.describe('rag_query_seconds', 'End-to-end RAG query latency in seconds')
+metrics.describe('rag_stage_seconds', 'Latency of each RAG query stage in seconds')
+metrics.describe('ingest_stage_seconds', 'Latency of each ingestion stage in seconds')
+metrics.describe('rag_queries_total', 'RAG queries processed, by outcome')
+metrics.describe('rag_generation_skipped_total', 'Queries answered without an LLM call because no context was relevant enough, by reason')
+metrics.describe('vector_matrix_cache_total', 'Vector search matrix cache lookups, by result')
+metrics.describe('embedding_api_retries_total', 'Embedding API requests retried after a failure')
+metrics.describe('vector_store_vectors', 'Number of vectors held by the vector store')
+metrics.describe('vector_shared_generation', 'Shared-memory vector matrix generation attached by this worker')
+metrics.describe('vector_reconcile_evicted_total', 'Orphaned vectors evicted by reconciliation')
+metrics.describe('vector_reconcile_restored_total', 'Missing vectors restored from SQL by reconciliation')
+metrics.describe('vector_reconcile_reclaimed_bytes_total', 'Estimated memory reclaimed by evicting orphaned vectors')
+metrics.describe('embedding_migration_texts_total', 'Texts re-embedded into a shadow vector index, by model')
+metrics.describe('vector_replica_applied_sequence', 'Last primary log sequence applied by this vector store replica')
+metrics.describe('vector_replica_lag_seconds', 'Seconds since this replica last read to the end of the primary log, while it cannot')
+metrics.describe('query_embedding_cache_total', 'Query embedding cache lookups, by result (hit/miss)')
+metrics.describe('text_store_reclaimed_bytes_total', 'Bytes freed by compacting unreferenced texts out of the text store')
@@ -0,0 +1,112 @@
+import numpy as np
+from typing import List, Dict, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MMRReranker:
+    """
+    Maximal marginal relevance re-ranking of retrieved chunks.
+
+    Trades relevance against redundancy so that the final slots are not filled
+    with near-duplicate, overlapping chunks of the same file.
+    """
+
+    def __init__(self, lambda_param: float = 0.7, max_per_source: int = 3):
+        self.lambda_param = lambda_param  # 1.0 = pure relevance, 0.0 = pure diversity
+        self.max_per_source = max_per_source  # Cap on chunks from one source, 0 disables
+
+    def rerank(self, docs: List[Dict[str, Any]], embeddings: List[Optional[List[float]]],
+               source_keys: List[Optional[str]], top_k: int,
+               lambda_param: float = None) -> List[Dict[str, Any]]:
+        """
+        Select top_k documents by MMR; docs are expected in relevance order
+        """
+        if not docs:
+            return []
+
+        lam = self.lambda_param if lambda_param is None else lambda_param
+
+        try:
+            matrix = self._normalized_matrix(embeddings)
+        except ValueError as e:
+            # Missing or mixed-dimension embeddings: keep relevance order, still cap sources
+            logger.warning(f"Skipping MMR re-rank: {str(e)}")
+            return self._cap_sources(docs, source_keys, top_k)
+
+        n = len(docs)
+        relevance = self._relevance(docs)
+        similarity = matrix @ matrix.T
+
+        # Map each source to a group id so a full source can be blocked in one step
+        groups = np.full(n, -1, dtype=np.int64)
+        group_ids: Dict[str, int] = {}
+        for i, key in enumerate(source_keys):
+            if key:
+                groups[i] = group_ids.setdefault(key, len(group_ids))
+        group_counts = np.zeros(len(group_ids), dtype=np.int64)
+
+        blocked = np.zeros(n, dtype=bool)
+        max_similarity = np.zeros(n, dtype=np.float32)
+        selected = []
+
+        for _ in range(min(top_k, n)):
+            scores = lam * relevance - (1 - lam) * max_similarity
+            scores[blocked] = -np.inf
+            best = int(np.argmax(scores))
+            if not np.isfinite(scores[best]):
+                break
+
+            selected.append(best)
+            blocked[best] = True
+            max_similarity = np.maximum(max_similarity, similarity[best])
+
+            group = groups[best]
+            if group >= 0 and self.max_per_source:
+                group_counts[group] += 1
+                if group_counts[group] >= self.max_per_source:
+                    blocked |= groups == group
+
+        return [docs[i] for i in selected]
+
+    def _normalized_matrix(self, embeddings: List[Optional[List[float]]]) -> np.ndarray:
+        """
+        Stack embeddings into a row-normalized float32 matrix
+        """
+        if any(embedding is None for embedding in embeddings):
+            raise ValueError("missing embeddings")
+        if len({len(embedding) for embedding in embeddings}) > 1:
+            raise ValueError("embedding dimensions differ")
+
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _relevance(self, docs: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Scale retrieval scores to [0, 1]; fused scores take precedence over cosine similarity
+        """
+        key = 'fusion_score' if all('fusion_score' in doc for doc in docs) else 'similarity'
+        scores = np.array([doc.get(key, 0.0) for doc in docs], dtype=np.float32)
+        spread = float(scores.max() - scores.min())
+        if spread == 0:
+            return np.ones_like(scores)
+        return (scores - scores.min()) / spread
+
+    def _cap_sources(self, docs: List[Dict[str, Any]], source_keys: List[Optional[str]],
+                     top_k: int) -> List[Dict[str, Any]]:
+        """
+        Keep relevance order while limiting chunks per source
+        """
+        counts: Dict[str, int] = {}
+        result = []
+        for doc, key in zip(docs, source_keys):
+            if key and self.max_per_source:
+                if counts.get(key, 0) >= self.max_per_source:
+                    continue
+                counts[key] = counts.get(key, 0) + 1
+            result.append(doc)
+            if len(result) >= top_k:
+                break
+        return result
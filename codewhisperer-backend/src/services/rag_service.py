@@ -1,98 +1,612 @@
-import google.generativeai as genai
-from typing import List, Dict, Any, Tuple
+import numpy as np
+from typing import List, Dict, Any, Tuple, Callable
 import logging
+import threading
 import time
 import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from src.services.gemini_embedding_service import GeminiEmbeddingService
-from src.services.vector_db_service import VectorDatabaseService
+from src.services.vector_db_service import create_vector_store
+from src.services.bm25_service import BM25Service
+from src.services.context_packer import ContextPacker
+from src.services.mmr_reranker import MMRReranker
+from src.services.metrics_service import metrics
+from src.services.text_store_service import TextStore, externalize_entries
+from src.services.relevance_gate import RelevanceGate
+from src.services.vector_collections import Collection, DEFAULT_TENANT, MODEL_KEY, collection_of, matches
+from src.services.embedding_migration_service import IndexManifest, create_embedding_service
 
 logger = logging.getLogger(__name__)
 
+def embedding_model_of(embedding_service) -> str:
+    """
+    Name of the vector space an embedding service produces
+    """
+    return getattr(embedding_service, 'model', type(embedding_service).__name__)
+
+def create_default_embedding_service():
+    """
+    The embedding service used while no index manifest names one: Gemini when GEMINI_API_KEY is set
+    """
+    if not os.getenv('GEMINI_API_KEY'):
+        logger.warning("GEMINI_API_KEY not found. Using local embedding service for demo.")
+        from src.services.local_embedding_service import LocalEmbeddingService
+        return LocalEmbeddingService()
+    return GeminiEmbeddingService()
+
 class RAGService:
     def __init__(self):
         # Configure Gemini API
         api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            logger.warning("GEMINI_API_KEY not found. Using mock embedding service for demo.")
-            from src.services.mock_embedding_service import MockEmbeddingService
-            self.embedding_service = MockEmbeddingService()
-            self.use_gemini = False
+        self.use_gemini = bool(api_key)
+        
+        # The embedding model and vector store serving queries, swapped together by re-embedding migrations
+        self.index_manifest = IndexManifest()
+        manifest = self.index_manifest.read()
+        self.index_version = manifest['version']
+        if manifest.get('active'):
+            embedding_service = create_embedding_service(manifest['active']['model'])
+            vector_db = create_vector_store(storage_path=manifest['active']['storage_path'], autoload=False,
+                                           replicated=True)
         else:
-            genai.configure(api_key=api_key)
-            self.embedding_service = GeminiEmbeddingService()
-            self.use_gemini = True
+            embedding_service = create_default_embedding_service()
+            # Sharded, shared-memory backed or replicated, see create_vector_store
+            vector_db = create_vector_store(autoload=False, replicated=True)
+        self._index = (embedding_service, vector_db)
+        self.previous_index = None  # (embedding service, vector store) the last swap replaced, for rollback
+        self.write_lock = threading.RLock()  # Held by writes to the vector store and by index swaps
             
-        self.vector_db = VectorDatabaseService()
         self.model = "gemini-1.5-flash"  # Using Gemini for chat completions
+        self.api_key = api_key
+        self._genai = None  # SDK loaded lazily, see the genai property
+        
+        # Chunk texts live once, compressed, in the text store; vector entries keep only a span into it
+        self.text_store = TextStore()
+        
+        # Lexical index over the same entries, fused with vector search
+        self.use_hybrid_search = os.getenv('HYBRID_SEARCH', 'true').lower() != 'false'
+        self.hybrid_candidates = 30  # Candidates taken from each retriever before fusion
+        self.rrf_k = 60  # Reciprocal rank fusion damping constant
+        self.keyword_index = BM25Service()
+        
+        # Recent query embeddings per model; they never go stale, so repeated questions skip the embedding call
+        self.query_embedding_cache_size = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '2048'))
+        self._query_embeddings: OrderedDict = OrderedDict()
+        self._query_embeddings_lock = threading.Lock()
+        
+        # The vector store is loaded and the keyword index built in the background on first use, or when
+        # serving starts (see start_warm_up); the node reports ready (see /ready) once the caches are warm too
+        self.warmup_queries = int(os.getenv('WARMUP_QUERIES', '100'))  # Frequent past queries to warm with; 0 to skip
+        self.load_status: Dict[str, Any] = {'state': 'idle', 'stage': None, 'started_at': None}
+        self._stores_loaded = threading.Event()
+        self._ready = threading.Event()
+        self._loader = None
+        self._warmer = None
+        self._start_lock = threading.Lock()
+        
+        self.context_packer = ContextPacker(tokenize=self.keyword_index.tokenize)
+        
+        # Bulk question answering
+        self.batch_concurrency = int(os.getenv('BATCH_QUERY_CONCURRENCY', '4'))  # Parallel LLM calls in query_batch
+        self.max_batch_size = 1000  # Queries accepted per query_batch call
+        self.max_top_k = int(os.getenv('MAX_TOP_K', '50'))  # Largest top_k a client may request
+        
+        # Diversity re-ranking between retrieval and context preparation
+        self.mmr_candidate_factor = 3  # Retrieve top_k * factor candidates for MMR to choose from
+        self.reranker = MMRReranker(
+            lambda_param=float(os.getenv('MMR_LAMBDA', '0.7')),
+            max_per_source=int(os.getenv('MAX_CHUNKS_PER_SOURCE', '3'))
+        )
+        
+        # Skip generation when nothing retrieved is relevant enough to answer from
+        self.relevance_gate = RelevanceGate(self.embedding_model)
+        
+    @property
+    def embedding_service(self):
+        return self._index[0]
+    
+    @property
+    def vector_db(self):
+        return self._index[1]
+    
+    @property
+    def embedding_model(self) -> str:
+        """
+        Names the vector space; entries are stored and searched in collections per model, dimension and tenant
+        """
+        return embedding_model_of(self.embedding_service)
+    
+    def activate_index(self, embedding_service, vector_db, version: int):
+        """
+        Serve queries from another embedding model and vector store holding the same entries.
+
+        Both are replaced in one assignment, so a query embeds and searches
+        with the same index; queries already running finish on the old one.
+        """
+        with self.write_lock:
+            self.previous_index = self._index
+            self._index = (embedding_service, vector_db)
+            self.index_version = version
+            self.relevance_gate = RelevanceGate(self.embedding_model)
+        logger.info(f"Serving queries from index version {version} ({self.embedding_model})")
+    
+    @property
+    def genai(self):
+        """
+        The Gemini SDK, imported and configured on first use because it is slow to import
+        """
+        if self._genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            self._genai = genai
+        return self._genai
+    
+    def start_loading(self):
+        """
+        Load the vector store and build the keyword index in a daemon thread, unless that has started
+        """
+        with self._start_lock:
+            if self._loader is None:
+                self.load_status.update({'state': 'loading', 'stage': 'vectors', 'started_at': time.time()})
+                self._loader = threading.Thread(target=self._load_stores, name='rag-store-loader', daemon=True)
+                self._loader.start()
+    
+    def wait_until_loaded(self, timeout: float = None) -> bool:
+        """
+        Block until the vector store and keyword index are loaded, starting the load if needed;
+        returns False on timeout
+        """
+        self.start_loading()
+        return self._stores_loaded.wait(timeout)
+    
+    @property
+    def is_ready(self) -> bool:
+        """
+        Whether the stores are loaded and the caches warmed, so the node can take traffic
+        """
+        return self._ready.is_set() and self.load_status['state'] == 'ready'
+    
+    def get_load_status(self) -> Dict[str, Any]:
+        """
+        Progress of loading and warming up, for readiness probes
+        """
+        status = dict(self.load_status)
+        if status['started_at'] is not None:
+            status['elapsed_seconds'] = round((status.get('ready_at') or time.time()) - status['started_at'], 3)
+        return status
+    
+    def _load_stores(self, keyword_batch_size: int = 10000):
+        """
+        Load persisted vectors and index them for keyword search, reporting progress in load_status
+        """
+        start_time = time.time()
+        try:
+            self.vector_db.load_vectors()
+            self.load_status.update({'stage': 'keyword_index', 'keyword_indexed': 0})
+            
+            batch = []
+            for entry in self.vector_db.iter_entries():
+                batch.append((entry.id, self.text_store.text_of(entry.text, entry.metadata), entry.metadata))
+                if len(batch) >= keyword_batch_size:
+                    self.keyword_index.add_documents(batch)
+                    self.load_status['keyword_indexed'] += len(batch)
+                    batch = []
+            self.keyword_index.add_documents(batch)
+            indexed = self.load_status['keyword_indexed'] + len(batch)
+            self.load_status.update({'stage': 'loaded', 'keyword_indexed': indexed, 'vectors': indexed,
+                                     'loaded_at': time.time()})
+            logger.info(f"Loaded knowledge base stores in {time.time() - start_time:.2f}s")
+            
+            follower = getattr(self.vector_db, 'follower', None)
+            if follower is not None:  # A read replica; apply the primary's writes from here on
+                follower.on_change = self._apply_replicated_changes
+                follower.start()
+        except Exception as e:
+            logger.error(f"Error loading knowledge base stores: {str(e)}")
+            self.load_status.update({'state': 'failed', 'error': str(e)})
+        finally:
+            self._stores_loaded.set()
+    
+    def start_warm_up(self, frequent_queries: Callable[[int], List[str]]):
+        """
+        Load the stores and warm the caches with the warmup_queries most frequent past queries
+        from frequent_queries(limit) in a daemon thread, then report ready; later calls do nothing
+        """
+        def warm():
+            self.wait_until_loaded()
+            if self.load_status['state'] == 'failed':
+                return
+            self.load_status['stage'] = 'warm_up'
+            try:
+                queries = frequent_queries(self.warmup_queries) if self.warmup_queries > 0 else []
+                self.load_status['warmed_queries'] = self.warm_up(queries)
+            except Exception as e:
+                # A cold cache is slower, not wrong; take traffic anyway
+                logger.error(f"Error warming up query caches: {str(e)}")
+            self.load_status.update({'state': 'ready', 'stage': 'ready', 'ready_at': time.time()})
+            self._ready.set()
+            logger.info(f"Ready after {self.get_load_status()['elapsed_seconds']:.2f}s")
         
+        with self._start_lock:
+            if self._warmer is None:
+                self._warmer = threading.Thread(target=warm, name='rag-warm-up', daemon=True)
+                self._warmer.start()
+    
+    def warm_up(self, queries: List[str]) -> int:
+        """
+        Build the vector store's search matrices and cache the embeddings of queries, searching
+        with them once; returns how many queries were warmed
+        """
+        embedding_service, vector_db = self._index
+        warm_matrices = getattr(vector_db, 'warm_up', None)
+        if warm_matrices is not None:
+            warm_matrices()
+        queries = [query for query in dict.fromkeys(queries) if query]
+        if not queries:
+            return 0
+        with metrics.timer('rag_stage_seconds', stage='warm_up'):
+            embeddings = self._embed_queries(embedding_service, queries)
+            vector_db.search_similar_batch(embeddings, top_k=1,
+                                           collection=self.collection_for(None, len(embeddings[0]), embedding_service))
+        return len(queries)
+    
+    def _embed_queries(self, embedding_service, queries: List[str]) -> List[List[float]]:
+        """
+        Embed query texts, reusing the embeddings of texts recently embedded with the same model
+        """
+        model = embedding_model_of(embedding_service)
+        embeddings = [None] * len(queries)
+        with self._query_embeddings_lock:
+            for i, query in enumerate(queries):
+                cached = self._query_embeddings.get((model, query))
+                if cached is not None:
+                    self._query_embeddings.move_to_end((model, query))
+                    embeddings[i] = cached
+        
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        metrics.increment('query_embedding_cache_total', len(queries) - len(missing), result='hit')
+        metrics.increment('query_embedding_cache_total', len(missing), result='miss')
+        if missing:
+            texts = list(dict.fromkeys(queries[i] for i in missing))
+            if len(texts) == 1:
+                created = [embedding_service.create_embedding(texts[0])]
+            else:
+                created = embedding_service.create_embeddings_batch(texts)
+            by_text = dict(zip(texts, created))
+            with self._query_embeddings_lock:
+                for text, embedding in by_text.items():
+                    self._query_embeddings[(model, text)] = embedding
+                while len(self._query_embeddings) > self.query_embedding_cache_size:
+                    self._query_embeddings.popitem(last=False)
+            for i in missing:
+                embeddings[i] = by_text[queries[i]]
+        return embeddings
+    
+    def _apply_replicated_changes(self, upserted: List, deleted: List[str], reset: bool):
+        """
+        Keep the keyword index in step with the entries a replica applied from the primary's log
+        """
+        if reset:
+            self.keyword_index.clear()
+            upserted = self.vector_db.iter_entries()
+        self.keyword_index.add_documents(
+            (entry.id, self.text_store.text_of(entry.text, entry.metadata), entry.metadata) for entry in upserted
+        )
+        self.keyword_index.remove_documents(deleted)
+    
+    @property
+    def is_read_replica(self) -> bool:
+        return getattr(self.vector_db, 'replication', None) == 'replica'
+    
+    def get_replication_status(self) -> Dict[str, Any]:
+        """
+        The vector store's replication role and log position, e.g. a replica's applied sequence and lag
+        """
+        status = getattr(self.vector_db, 'get_replication_status', None)
+        return status() if status else {'role': 'standalone'}
+    
+    def wait_for_index_sequence(self, sequence: int, timeout: float) -> bool:
+        """
+        Block until the primary's write with the given log sequence is searchable here, for read-your-writes
+        """
+        wait = getattr(self.vector_db, 'wait_for_sequence', None)
+        return wait(sequence, timeout) if wait else True
+    
+    def collection_for(self, tenant: str, dimension: int, embedding_service=None) -> Collection:
+        """
+        The collection queries of a tenant search, for embeddings of the current or the given service
+        """
+        return (tenant or DEFAULT_TENANT, embedding_model_of(embedding_service or self.embedding_service), dimension)
+    
     def query(self, user_query: str, source_type_filter: str = None, 
-              max_context_length: int = 4000) -> Dict[str, Any]:
+              max_context_tokens: int = 1000, top_k: int = 10,
+              mmr_lambda: float = None, tenant: str = None) -> Dict[str, Any]:
         """
-        Process a user query using RAG
+        Process a user query using RAG, over the knowledge base of tenant (a team) if given
         """
         start_time = time.time()
         
         try:
+            self.wait_until_loaded()
+            embedding_service, vector_db = self._index
+            
             # Step 1: Create embedding for the user query
-            query_embedding = self.embedding_service.create_embedding(user_query)
+            with metrics.timer('rag_stage_seconds', stage='embedding'):
+                query_embedding = self._embed_queries(embedding_service, [user_query])[0]
             
             # Step 2: Retrieve relevant documents
-            similar_docs = self.vector_db.search_similar(
-                query_embedding, 
-                top_k=10, 
-                source_type_filter=source_type_filter
+            candidates = self._retrieve(
+                user_query, query_embedding, top_k * self.mmr_candidate_factor, source_type_filter,
+                self.collection_for(tenant, len(query_embedding), embedding_service), vector_db
             )
             
-            # Step 3: Check if we have relevant documents
-            if not similar_docs or len(similar_docs) == 0:
-                return {
-                    'response': "Sorry, I do not have access to this information.",
-                    'sources': [],
-                    'processing_time': time.time() - start_time,
-                    'context_used': 0,
-                    'success': True,
-                    'no_relevant_docs': True
-                }
-            
-            # Step 4: Prepare context from retrieved documents
-            context = self._prepare_context(similar_docs, max_context_length)
-            
-            # Step 5: Generate response using LLM
-            response = self._generate_response(user_query, context, similar_docs)
-            
-            # Step 6: Prepare sources information
-            sources = self._prepare_sources(similar_docs[:5])  # Top 5 sources
-            
-            processing_time = time.time() - start_time
-            
-            return {
-                'response': response,
-                'sources': sources,
-                'processing_time': processing_time,
-                'context_used': len(similar_docs),
-                'success': True
-            }
+            result = self._answer(user_query, candidates, start_time, max_context_tokens, top_k, mmr_lambda,
+                                  vector_db)
             
         except Exception as e:
             logger.error(f"Error processing query: {str(e)}")
+            result = self._error_result(e, start_time)
+        
+        self._record_query(result)
+        return result
+    
+    def query_batch(self, queries: List[str], source_type_filter: str = None,
+                    max_context_tokens: int = 1000, top_k: int = 10,
+                    mmr_lambda: float = None, max_concurrency: int = None,
+                    tenant: str = None) -> Dict[str, Any]:
+        """
+        Process many queries at once.
+
+        All queries are embedded in one batched call and scored against the
+        store together; response generation then runs with bounded concurrency.
+        """
+        batch_start = time.time()
+        candidate_k = top_k * self.mmr_candidate_factor
+        
+        self.wait_until_loaded()
+        embedding_service, vector_db = self._index
+        
+        # Step 1: Embed every query in one batched call
+        embedding_start = time.time()
+        query_embeddings = self._embed_queries(embedding_service, queries)
+        embedding_time = time.time() - embedding_start
+        metrics.observe('rag_stage_seconds', embedding_time, stage='batch_embedding')
+        
+        # Step 2: Score all queries against the store as one matrix product
+        retrieval_start = time.time()
+        vector_limit = max(candidate_k, self.hybrid_candidates) if self.use_hybrid_search else candidate_k
+        collection = self.collection_for(tenant, len(query_embeddings[0]), embedding_service)
+        vector_hits = vector_db.search_similar_batch(
+            query_embeddings, top_k=vector_limit, source_type_filter=source_type_filter, collection=collection
+        )
+        retrieval_time = time.time() - retrieval_start
+        metrics.observe('rag_stage_seconds', retrieval_time, stage='batch_vector_search')
+        
+        def answer(index: int) -> Dict[str, Any]:
+            start_time = time.time()
+            try:
+                candidates = self._combine_retrievers(
+                    queries[index], query_embeddings[index], vector_hits[index],
+                    candidate_k, source_type_filter, collection, vector_db
+                )
+                result = self._answer(queries[index], candidates, start_time,
+                                      max_context_tokens, top_k, mmr_lambda, vector_db)
+            except Exception as e:
+                logger.error(f"Error processing batch query {index}: {str(e)}")
+                result = self._error_result(e, start_time)
+            self._record_query(result)
+            result['query'] = queries[index]
+            return result
+        
+        # Step 3: Generate responses with bounded concurrency
+        # A caller may ask for less concurrency than batch_concurrency, never more
+        workers = max(1, min(max_concurrency or self.batch_concurrency, self.batch_concurrency, len(queries)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(answer, range(len(queries))))
+        
+        return {
+            'results': results,
+            'processing_time': time.time() - batch_start,
+            'timings': {
+                'embedding': embedding_time,
+                'retrieval': retrieval_time,
+                'generation': time.time() - batch_start - embedding_time - retrieval_time
+            },
+            'success': all(result['success'] for result in results)
+        }
+    
+    def _answer(self, user_query: str, candidates: List[Dict[str, Any]], start_time: float,
+                max_context_tokens: int, top_k: int, mmr_lambda: float = None,
+                vector_db=None) -> Dict[str, Any]:
+        """
+        Re-rank retrieved candidates, build the context and generate the response; vector_db
+        is the store they were retrieved from, so a concurrent index swap cannot mix in another model
+        """
+        # Step 3: Check if we have relevant documents before paying for re-ranking and generation
+        skip_reason = self.relevance_gate.check(candidates)
+        if skip_reason:
+            metrics.increment('rag_generation_skipped_total', reason=skip_reason)
             return {
-                'response': "❌ **Oops!** I encountered an error while processing your query. Please try again or contact support if the issue persists.",
+                'response': "Sorry, I do not have access to this information.",
                 'sources': [],
                 'processing_time': time.time() - start_time,
                 'context_used': 0,
-                'success': False,
-                'error': str(e)
+                'success': True,
+                'no_relevant_docs': True,
+                'skip_reason': skip_reason
             }
+        
+        with metrics.timer('rag_stage_seconds', stage='rerank'):
+            similar_docs = self._diversify(candidates, top_k, mmr_lambda, vector_db)
+            self.text_store.resolve(similar_docs)  # Only the final hits need their text
+        
+        # Step 4: Prepare context from retrieved documents
+        with metrics.timer('rag_stage_seconds', stage='context'):
+            context = self._prepare_context(similar_docs, max_context_tokens, user_query)
+        
+        # Step 5: Generate response using LLM
+        with metrics.timer('rag_stage_seconds', stage='generation'):
+            response = self._generate_response(user_query, context, similar_docs)
+        
+        # Step 6: Prepare sources information
+        sources = self._prepare_sources(similar_docs[:5])  # Top 5 sources
+        
+        processing_time = time.time() - start_time
+        
+        return {
+            'response': response,
+            'sources': sources,
+            'processing_time': processing_time,
+            'context_used': len(similar_docs),
+            'success': True
+        }
     
-    def _prepare_context(self, similar_docs: List[Dict[str, Any]], max_length: int) -> str:
+    def _record_query(self, result: Dict[str, Any]):
+        """
+        Record end-to-end latency and outcome of a finished query
         """
-        Prepare context string from retrieved documents
+        if not result['success']:
+            status = 'error'
+        elif result.get('no_relevant_docs'):
+            status = 'no_relevant_docs'
+        else:
+            status = 'answered'
+        metrics.observe('rag_query_seconds', result['processing_time'])
+        metrics.increment('rag_queries_total', status=status)
+    
+    def _error_result(self, error: Exception, start_time: float) -> Dict[str, Any]:
         """
-        context_parts = []
-        current_length = 0
+        Build the response returned when a query fails
+        """
+        return {
+            'response': "❌ **Oops!** I encountered an error while processing your query. Please try again or contact support if the issue persists.",
+            'sources': [],
+            'processing_time': time.time() - start_time,
+            'context_used': 0,
+            'success': False,
+            'error': str(error)
+        }
+    
+    def _retrieve(self, user_query: str, query_embedding: List[float], top_k: int,
+                  source_type_filter: str = None, collection: Collection = None,
+                  vector_db=None) -> List[Dict[str, Any]]:
+        """
+        Retrieve documents of a collection with vector search, fused with BM25 when hybrid search is enabled
+        """
+        vector_db = vector_db or self.vector_db
+        vector_limit = max(top_k, self.hybrid_candidates) if self.use_hybrid_search else top_k
+        with metrics.timer('rag_stage_seconds', stage='vector_search'):
+            vector_hits = vector_db.search_similar(
+                query_embedding,
+                top_k=vector_limit,
+                source_type_filter=source_type_filter,
+                collection=collection
+            )
+        
+        return self._combine_retrievers(user_query, query_embedding, vector_hits, top_k, source_type_filter,
+                                        collection, vector_db)
+    
+    def _combine_retrievers(self, user_query: str, query_embedding: List[float],
+                            vector_hits: List[Dict[str, Any]], top_k: int,
+                            source_type_filter: str = None, collection: Collection = None,
+                            vector_db=None) -> List[Dict[str, Any]]:
+        """
+        Fuse vector hits with BM25 hits, or pass them through when hybrid search is off
+        """
+        if not self.use_hybrid_search:
+            return vector_hits[:top_k]
+        
+        with metrics.timer('rag_stage_seconds', stage='keyword_search'):
+            keyword_hits = self.keyword_index.search(
+                user_query,
+                top_k=max(top_k, self.hybrid_candidates),
+                source_type_filter=source_type_filter,
+                tenant=collection[0] if collection else None
+            )
+        
+        with metrics.timer('rag_stage_seconds', stage='fusion'):
+            return self._fuse_results(query_embedding, vector_hits, keyword_hits, top_k, collection, vector_db)
+    
+    def _fuse_results(self, query_embedding: List[float], vector_hits: List[Dict[str, Any]],
+                      keyword_hits: List[Dict[str, Any]], top_k: int,
+                      collection: Collection = None, vector_db=None) -> List[Dict[str, Any]]:
+        """
+        Combine vector and keyword rankings with reciprocal rank fusion
+        """
+        fused_scores: Dict[str, float] = {}
+        for hits in (vector_hits, keyword_hits):
+            for rank, hit in enumerate(hits):
+                fused_scores[hit['id']] = fused_scores.get(hit['id'], 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        
+        vector_db = vector_db or self.vector_db
+        docs_by_id = {doc['id']: doc for doc in vector_hits}
+        bm25_scores = {hit['id']: hit['score'] for hit in keyword_hits}
+        
+        results = []
+        for doc_id in sorted(fused_scores, key=fused_scores.get, reverse=True):
+            doc = docs_by_id.get(doc_id)
+            if doc is None:
+                # Keyword-only hit: load it from the vector store and score it for display
+                entry = vector_db.get_vector(doc_id)
+                if entry is None:
+                    # Deleted from the vector store since it was indexed
+                    continue
+                entry_collection = collection_of(entry.embedding, entry.metadata)
+                if entry_collection[2] != len(query_embedding) or not matches(collection, entry_collection):
+                    # Embedded by another model; its similarity to this query means nothing
+                    continue
+                doc = {
+                    'id': doc_id,
+                    'similarity': vector_db._cosine_similarity(
+                        np.array(query_embedding), np.array(entry.embedding)
+                    ),
+                    'text': entry.text,
+                    'metadata': entry.metadata
+                }
+            
+            doc['bm25_score'] = bm25_scores.get(doc_id, 0.0)
+            doc['fusion_score'] = fused_scores[doc_id]
+            results.append(doc)
+            if len(results) >= top_k:
+                break
+        
+        return results
+    
+    def _diversify(self, candidates: List[Dict[str, Any]], top_k: int,
+                   mmr_lambda: float = None, vector_db=None) -> List[Dict[str, Any]]:
+        """
+        Re-rank retrieved candidates with MMR and a per-source cap
+        """
+        if len(candidates) <= 1:
+            return candidates[:top_k]
+        
+        vector_db = vector_db or self.vector_db
+        embeddings = []
+        for doc in candidates:
+            entry = vector_db.get_vector(doc['id'])
+            embeddings.append(entry.embedding if entry is not None else None)
+        source_keys = [self._source_key(doc['metadata']) for doc in candidates]
+        
+        return self.reranker.rerank(candidates, embeddings, source_keys, top_k, mmr_lambda)
+    
+    def _source_key(self, metadata: Dict[str, Any]) -> str:
+        """
+        Identify the file or page a chunk came from
+        """
+        source = metadata.get('file_path') or metadata.get('source_url')
+        if not source:
+            return None
+        return f"{metadata.get('repository') or ''}:{source}"
+    
+    def _prepare_context(self, similar_docs: List[Dict[str, Any]], max_tokens: int,
+                         user_query: str = '') -> str:
+        """
+        Prepare context string from retrieved documents within a token budget
+        """
+        items = []
         
         for i, doc in enumerate(similar_docs):
-            doc_text = doc['text']
             metadata = doc['metadata']
             
             # Format the document with metadata
@@ -108,16 +622,15 @@ class RAGService:
             if metadata.get('author'):
                 source_info += f" | Author: {metadata['author']}"
             
-            formatted_doc = f"{source_info}\n{doc_text}\n"
-            
-            # Check if adding this document would exceed max length
-            if current_length + len(formatted_doc) > max_length:
-                break
-            
-            context_parts.append(formatted_doc)
-            current_length += len(formatted_doc)
+            # Chunks of the same file can overlap and are merged by the packer
+            items.append({
+                'header': source_info,
+                'text': doc['text'],
+                'source_key': self._source_key(metadata)
+            })
         
-        return "\n---\n".join(context_parts)
+        packed = self.context_packer.pack(items, user_query, max_tokens)
+        return self.context_packer.render(packed)
     
     def _generate_response(self, user_query: str, context: str, similar_docs: List[Dict[str, Any]]) -> str:
         """
@@ -155,7 +668,7 @@ Please provide a comprehensive answer that helps the developer understand the to
         try:
             if self.use_gemini:
                 # Use Gemini for response generation
-                model = genai.GenerativeModel(self.model)
+                model = self.genai.GenerativeModel(self.model)
                 
                 # Combine system and user prompts for Gemini
                 full_prompt = f"{system_prompt.format(context=context)}\n\n{user_prompt}"
@@ -231,51 +744,138 @@ To get full AI-powered responses with citations, please configure your Gemini AP
         
         return sources
     
-    def add_document(self, text: str, metadata: Dict[str, Any]) -> str:
+    def add_document(self, text: str, metadata: Dict[str, Any], source_text: str = None) -> str:
         """
-        Add a document to the knowledge base
+        Add a document to the knowledge base; source_text is the file it was cut from, if any.
+        metadata is stamped with the embedding model, which with its tenant names the collection.
         """
-        try:
-            # Create embedding for the document
-            embedding = self.embedding_service.create_embedding(text)
-            
-            # Add to vector database
-            vector_id = self.vector_db.add_vector(text, embedding, metadata)
-            
-            logger.info(f"Added document to knowledge base: {vector_id}")
-            return vector_id
-            
-        except Exception as e:
-            logger.error(f"Error adding document: {str(e)}")
-            raise
+        return self.add_files_batch([([(text, metadata)], source_text)])[0][0]
     
-    def add_documents_batch(self, documents: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+    def add_documents_batch(self, documents: List[Tuple[str, Dict[str, Any]]], source_text: str = None) -> List[str]:
+        """
+        Add multiple documents to the knowledge base; chunks found in source_text are stored as spans of it
         """
-        Add multiple documents to the knowledge base
+        return self.add_files_batch([(documents, source_text)])[0]
+    
+    def add_files_batch(self, files: List[Tuple[List[Tuple[str, Dict[str, Any]]], str]]) -> List[List[str]]:
+        """
+        Add the (documents, source_text) pairs of many files with one embedding call and one vector store write.
+
+        Returns the vector ids of each file's documents, in the order given. Each
+        document's metadata is stamped with the embedding model, so the chunk rows
+        written from it afterwards keep the collection too.
         """
         try:
-            # Create embeddings for all documents
-            texts = [doc[0] for doc in documents]
-            embeddings = self.embedding_service.create_embeddings_batch(texts)
+            documents = [document for file_documents, _ in files for document in file_documents]
+            texts = [text for text, _ in documents]
             
-            # Prepare entries for vector database
-            entries = []
-            for i, (text, metadata) in enumerate(documents):
-                entries.append((text, embeddings[i], metadata))
+            # Create embeddings for every file's documents at once
+            self.wait_until_loaded()
+            index = self._index
+            with metrics.timer('ingest_stage_seconds', stage='embedding'):
+                embeddings = index[0].create_embeddings_batch(texts)
             
-            # Add to vector database
-            vector_ids = self.vector_db.add_vectors_batch(entries)
+            with self.write_lock:
+                if self._index is not index:
+                    # An index swap happened while embedding; embed again for the index now serving
+                    index = self._index
+                    embeddings = index[0].create_embeddings_batch(texts)
+                embedding_service, vector_db = index
+                for _, metadata in documents:
+                    metadata[MODEL_KEY] = embedding_model_of(embedding_service)
+                
+                # Prepare entries for vector database, each file's texts stored as spans of its source
+                entries = []
+                offset = 0
+                with metrics.timer('ingest_stage_seconds', stage='text_write'):
+                    for file_documents, source_text in files:
+                        file_embeddings = embeddings[offset:offset + len(file_documents)]
+                        entries.extend(externalize_entries(self.text_store, [
+                            (text, embedding, metadata)
+                            for (text, metadata), embedding in zip(file_documents, file_embeddings)
+                        ], source_text))
+                        offset += len(file_documents)
+                
+                # Add to vector database
+                with metrics.timer('ingest_stage_seconds', stage='vector_write'):
+                    vector_ids = vector_db.add_vectors_batch(entries)
+                    self.keyword_index.add_documents(
+                        (vector_id, text, metadata) for vector_id, (text, metadata) in zip(vector_ids, documents)
+                    )
+            
+            logger.info(f"Added {len(vector_ids)} documents from {len(files)} files to knowledge base")
             
-            logger.info(f"Added {len(vector_ids)} documents to knowledge base")
-            return vector_ids
+            file_vector_ids = []
+            offset = 0
+            for file_documents, _ in files:
+                file_vector_ids.append(vector_ids[offset:offset + len(file_documents)])
+                offset += len(file_documents)
+            return file_vector_ids
             
         except Exception as e:
             logger.error(f"Error adding documents batch: {str(e)}")
             raise
     
+    def delete_documents(self, vector_ids: List[str]) -> int:
+        """
+        Remove vectors from the knowledge base with one vector store write
+        """
+        self.wait_until_loaded()
+        with self.write_lock:
+            deleted = self.vector_db.delete_vectors(vector_ids)
+            self.keyword_index.remove_documents(vector_ids)
+        return deleted
+    
+    def restore_documents(self, entries: List[Tuple[str, List[float], Dict[str, Any]]],
+                          vector_ids: List[str]) -> List[str]:
+        """
+        Re-add (text, embedding, metadata) entries under their existing vector ids
+        """
+        self.wait_until_loaded()
+        with self.write_lock:
+            vector_ids = self.vector_db.add_vectors_batch(externalize_entries(self.text_store, entries),
+                                                          vector_ids=vector_ids)
+            self.keyword_index.add_documents(
+                (vector_id, text, metadata) for vector_id, (text, _, metadata) in zip(vector_ids, entries)
+            )
+        return vector_ids
+    
+    def get_embeddings(self, vector_ids: List[str]) -> List[List[float]]:
+        """
+        Get the stored embeddings for vector ids, None for unknown ids
+        """
+        self.wait_until_loaded()
+        entries = [self.vector_db.get_vector(vector_id) for vector_id in vector_ids]
+        return [entry.embedding if entry else None for entry in entries]
+    
     def get_knowledge_base_stats(self) -> Dict[str, Any]:
         """
         Get statistics about the knowledge base
         """
-        return self.vector_db.get_stats()
+        self.wait_until_loaded()
+        stats = self.vector_db.get_stats()
+        stats['keyword_index'] = self.keyword_index.get_stats()
+        stats['text_store'] = self.text_store.get_stats()
+        stats['relevance_gate'] = self.relevance_gate.get_stats()
+        stats['embedding_model'] = self.embedding_model
+        stats['index_version'] = self.index_version
+        stats['replication'] = self.get_replication_status()
+        stats['load'] = self.get_load_status()
+        stats['query_embedding_cache'] = {'entries': len(self._query_embeddings),
+                                          'capacity': self.query_embedding_cache_size}
+        return stats
+
+
+_shared_service = None
+_shared_service_lock = threading.Lock()
 
+def get_rag_service() -> RAGService:
+    """
+    Get the process-wide RAGService, creating it on first use
+    """
+    global _shared_service
+    if _shared_service is None:
+        with _shared_service_lock:
+            if _shared_service is None:
+                _shared_service = RAGService()
+    return _shared_service
@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Set, Tuple
+from sqlalchemy import select, insert, update
+from src.models.document import Document, DocumentChunk
+from src.services.metrics_service import metrics
+from src.services.text_store_service import TEXT_REF_KEY, strip_text_ref
+
+logger = logging.getLogger(__name__)
+
+class ReconciliationService:
+    """
+    Keeps the vector store and the document_chunks table consistent.
+
+    Each pass compares the ids in the vector store with the embedding_id of
+    every chunk and repairs what drifted:
+      - orphaned vectors (no chunk points at them) are adopted by a document
+        with the same content and no chunks, or evicted. An orphan is only
+        evicted once a second pass still finds it, so vectors of an ingest
+        that has not committed its SQL rows yet are left alone
+      - chunks whose vector is missing are restored from their stored embedding
+      - chunks without a stored embedding get it backfilled from the vector store
+      - texts in the text store no vector refers to any more are dropped by
+        compacting the store, once two passes found them unreferenced and
+        they make up text_compaction_ratio of its size. SQL keeps chunk texts
+        itself, so only vector entries refer into the text store
+
+    Texts are only compacted by a process whose vector store holds every
+    vector on the node: the replication primary, or a worker of the
+    shared-memory store. Workers that each load their own in-process or
+    sharded store share the text store directory but not their vectors, so
+    one would drop texts only the others refer to; set TEXT_COMPACTION=true
+    where a single worker serves, or false to never compact.
+    """
+
+    def __init__(self, rag_service, document_store, batch_size: int = 1000):
+        self.rag_service = rag_service
+        self.document_store = document_store
+        self.db = document_store.db
+        self.batch_size = batch_size  # Chunk rows fetched or written per statement
+        self.last_report: Dict[str, Any] = None
+        self._suspected_orphans: Set[str] = set()
+        self._suspected_blobs: Set[str] = set()  # Unreferenced text blobs seen by the last pass
+        self.text_compaction_ratio = 0.2  # Share of the text store that must be garbage before it is rewritten
+        self.text_compaction = os.getenv('TEXT_COMPACTION', 'auto').lower()  # auto, true or false, see above
+        self._lock = threading.Lock()  # One pass at a time
+        self._thread = None
+
+    def start(self, app, interval_seconds: float):
+        """
+        Run a pass every interval_seconds in a daemon thread
+        """
+        if self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval_seconds)
+                with app.app_context():
+                    try:
+                        self.run()
+                    except Exception as e:
+                        logger.error(f"Error in background reconciliation: {str(e)}")
+                        self.db.session.rollback()
+
+        self._thread = threading.Thread(target=loop, name='vector-reconciliation', daemon=True)
+        self._thread.start()
+        logger.info(f"Vector store reconciliation scheduled every {interval_seconds:.0f}s")
+
+    def run(self, evict_immediately: bool = False) -> Dict[str, Any]:
+        """
+        Run one reconciliation pass inside an app context and return a report
+        """
+        with self._lock:
+            start_time = time.time()
+            self.rag_service.wait_until_loaded()
+            vector_db = self.rag_service.vector_db
+
+            # Snapshot the store before reading SQL so vectors added during the pass are not judged
+            vector_ids = set(vector_db.get_vector_ids())
+            chunk_vector_ids = self._load_chunk_vector_ids()
+
+            orphans = vector_ids - chunk_vector_ids
+            adopted = self._adopt_orphans(orphans)
+            orphans -= adopted
+
+            to_evict = orphans if evict_immediately else orphans & self._suspected_orphans
+            reclaimed_bytes = 0
+            for vector_id in to_evict:
+                entry = vector_db.get_vector(vector_id)
+                if entry is not None:
+                    reclaimed_bytes += vector_db.estimate_entry_bytes(entry)
+            evicted = self.rag_service.delete_documents(list(to_evict)) if to_evict else 0
+            self._suspected_orphans = orphans - to_evict
+
+            restored, unrecoverable = self._restore_missing_vectors(chunk_vector_ids - vector_ids)
+            backfilled = self._backfill_embeddings()
+            blobs_removed, text_reclaimed_bytes = self._compact_text_store(evict_immediately)
+
+            report = {
+                'vectors_checked': len(vector_ids),
+                'chunks_checked': len(chunk_vector_ids),
+                'orphans_found': len(orphans) + len(adopted),
+                'orphans_adopted': len(adopted),
+                'orphans_evicted': evicted,
+                'orphans_pending': len(self._suspected_orphans),
+                'vectors_restored': restored,
+                'vectors_unrecoverable': unrecoverable,
+                'embeddings_backfilled': backfilled,
+                'reclaimed_bytes': reclaimed_bytes,
+                'text_compaction_enabled': self._sees_every_vector(),
+                'text_blobs_removed': blobs_removed,
+                'text_blobs_pending': len(self._suspected_blobs),
+                'text_reclaimed_bytes': text_reclaimed_bytes,
+                'processing_time': time.time() - start_time
+            }
+
+            metrics.increment('vector_reconcile_evicted_total', evicted)
+            metrics.increment('vector_reconcile_restored_total', restored)
+            metrics.increment('vector_reconcile_reclaimed_bytes_total', reclaimed_bytes)
+            metrics.increment('text_store_reclaimed_bytes_total', text_reclaimed_bytes)
+            self.last_report = report
+            logger.info(f"Reconciled vector store: {report}")
+            return report
+
+    def _load_chunk_vector_ids(self) -> Set[str]:
+        """
+        Stream the embedding_id of every chunk
+        """
+        result = self.db.session.execute(
+            select(DocumentChunk.embedding_id)
+            .where(DocumentChunk.embedding_id.isnot(None))
+            .execution_options(yield_per=self.batch_size)
+        )
+        return set(result.scalars())
+
+    def _adopt_orphans(self, orphans: Set[str]) -> Set[str]:
+        """
+        Link orphans to chunkless documents with identical content, as written by older single-document ingests
+        """
+        if not orphans:
+            return set()
+
+        vector_db = self.rag_service.vector_db
+        text_store = self.rag_service.text_store
+        by_content = {}
+        for vector_id in orphans:
+            entry = vector_db.get_vector(vector_id)
+            if entry is not None:
+                by_content.setdefault(self._content_key(text_store.text_of(entry.text, entry.metadata)), vector_id)
+
+        rows = []
+        adopted_documents = []
+        documents = self.db.session.execute(
+            select(Document.id, Document.content, Document.source_type, Document.created_at)
+            .where(~Document.chunks.any())
+            .execution_options(yield_per=self.batch_size)
+        )
+        for document_id, content, source_type, created_at in documents:
+            vector_id = by_content.pop(self._content_key(content or ''), None)
+            if vector_id is None:
+                continue
+            adopted_documents.append((source_type, created_at, 0, 1))
+            entry = vector_db.get_vector(vector_id)
+            rows.append({
+                'document_id': document_id,
+                'chunk_text': text_store.text_of(entry.text, entry.metadata),
+                'chunk_index': 0,
+                'embedding_id': vector_id,
+                'embedding': self.document_store.encode_embedding(entry.embedding),
+                'chunk_metadata': json.dumps(strip_text_ref(entry.metadata))
+            })
+
+        for i in range(0, len(rows), self.batch_size):
+            self.db.session.execute(insert(DocumentChunk), rows[i:i + self.batch_size])
+        self.document_store.rollups.record_documents(adopted_documents)
+        self.db.session.commit()
+        return {row['embedding_id'] for row in rows}
+
+    def _restore_missing_vectors(self, missing: Set[str]) -> Tuple[int, int]:
+        """
+        Re-add vectors that chunks point at but the store lost, from their stored embeddings
+        """
+        if not missing:
+            return 0, 0
+
+        restored = 0
+        missing = list(missing)
+        for i in range(0, len(missing), self.batch_size):
+            rows = self.db.session.execute(
+                select(DocumentChunk.embedding_id, DocumentChunk.chunk_text,
+                       DocumentChunk.chunk_metadata, DocumentChunk.embedding)
+                .where(DocumentChunk.embedding_id.in_(missing[i:i + self.batch_size]),
+                       DocumentChunk.embedding.isnot(None))
+            ).all()
+            if rows:
+                entries = [(row.chunk_text, self.document_store.decode_embedding(row.embedding),
+                            json.loads(row.chunk_metadata) if row.chunk_metadata else {}) for row in rows]
+                self.rag_service.restore_documents(entries, [row.embedding_id for row in rows])
+                restored += len(rows)
+
+        return restored, len(missing) - restored
+
+    def _backfill_embeddings(self) -> int:
+        """
+        Store embeddings for chunks written before embeddings were kept in SQL
+        """
+        vector_db = self.rag_service.vector_db
+        backfilled = 0
+        last_id = 0
+
+        while True:
+            rows = self.db.session.execute(
+                select(DocumentChunk.id, DocumentChunk.embedding_id)
+                .where(DocumentChunk.id > last_id, DocumentChunk.embedding.is_(None),
+                       DocumentChunk.embedding_id.isnot(None))
+                .order_by(DocumentChunk.id)
+                .limit(self.batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            updates = []
+            for row in rows:
+                entry = vector_db.get_vector(row.embedding_id)
+                if entry is not None:
+                    updates.append({'id': row.id, 'embedding': self.document_store.encode_embedding(entry.embedding)})
+            if updates:
+                self.db.session.execute(update(DocumentChunk), updates)
+                self.db.session.commit()
+                backfilled += len(updates)
+
+        return backfilled
+
+    def _compact_text_store(self, evict_immediately: bool) -> Tuple[int, int]:
+        """
+        Drop text blobs no vector entry refers to; returns the blobs removed and the bytes freed
+        """
+        if not self._sees_every_vector():
+            return 0, 0
+        rag_service = self.rag_service
+        text_store = rag_service.text_store
+        # Held from the scan to the rewrite, so no ingest refers to a blob the scan found unreferenced
+        with rag_service.write_lock:
+            unreferenced = text_store.blob_ids() - self._referenced_blobs()
+            candidates = unreferenced if evict_immediately else unreferenced & self._suspected_blobs
+            garbage_bytes = text_store.blob_sizes(candidates)
+            stored_bytes = text_store.get_stats()['stored_bytes']
+            if not candidates or (not evict_immediately and garbage_bytes < self.text_compaction_ratio * stored_bytes):
+                self._suspected_blobs = unreferenced
+                return 0, 0
+            result = text_store.compact(candidates)
+            self._suspected_blobs = unreferenced - candidates
+        return result['blobs_removed'], result['reclaimed_bytes']
+
+    def _sees_every_vector(self) -> bool:
+        """
+        Whether the serving vector store holds every vector referring into the text store
+        """
+        if self.text_compaction in ('true', 'false'):
+            return self.text_compaction == 'true'
+        from src.services.shared_vector_store_service import SharedVectorDatabaseService
+        vector_db = self.rag_service.vector_db
+        return getattr(vector_db, 'replication', None) == 'primary' or isinstance(vector_db, SharedVectorDatabaseService)
+
+    def _referenced_blobs(self) -> Set[str]:
+        """
+        Text blobs the serving vector store, or the one a rollback would return to, refers to
+        """
+        stores = [self.rag_service.vector_db]
+        if self.rag_service.previous_index is not None:
+            stores.append(self.rag_service.previous_index[1])
+        referenced = set()
+        for store in stores:
+            for entry in store.iter_entries():
+                ref = (entry.metadata or {}).get(TEXT_REF_KEY)
+                if ref:
+                    referenced.add(ref[0])
+        return referenced
+
+    def _content_key(self, text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8', 'replace')).hexdigest()
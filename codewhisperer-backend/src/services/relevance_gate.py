@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import logging
+import numpy as np
+from typing import List, Dict, Any, Optional
+from src.services.vector_collections import DEFAULT_TENANT
+
+logger = logging.getLogger(__name__)
+
+# Starting points per embedding model until `flask calibrate-relevance` has been run on the real corpus
+DEFAULT_THRESHOLDS = {
+    'models/embedding-001': {'min_similarity': 0.55},
+    'local-ngram-1536': {'min_similarity': 0.2}
+}
+
+# Questions no engineering knowledge base answers, the default irrelevant set for calibration
+OFF_TOPIC_QUERIES = [
+    "What is the weather going to be like tomorrow?",
+    "Give me a recipe for banana bread",
+    "Who won the football world cup in 2014?",
+    "What is the capital of Australia?",
+    "Recommend a good science fiction novel",
+    "How do I train for a marathon?",
+    "What are the symptoms of the flu?",
+    "Tell me a joke about cats",
+    "How many calories are in an avocado?",
+    "What is the best time of year to visit Japan?",
+    "Translate good morning into Italian",
+    "How do I grow tomatoes on a balcony?",
+    "Who painted the Mona Lisa?",
+    "What is the plot of Hamlet?",
+    "How far away is the moon?",
+    "Which wine goes well with salmon?",
+    "How do I remove a coffee stain from a shirt?",
+    "What should I name my new puppy?",
+    "When did the Roman empire fall?",
+    "What are some good stretches for back pain?"
+]
+
+class RelevanceGate:
+    """
+    Decides whether retrieved candidates are relevant enough to be worth an LLM call.
+
+    A query passes when its best candidate similarity reaches the embedding
+    model's min_similarity and, if a min_margin is set, the best similarity
+    stands out from the median of the candidates by at least that much; a
+    flat score distribution means nothing in particular matched. Thresholds
+    come from RELEVANCE_MIN_SIMILARITY / RELEVANCE_MIN_MARGIN, else from the
+    calibration file written by calibrate(), else from DEFAULT_THRESHOLDS.
+    """
+
+    def __init__(self, model: str, calibration_path: str = None):
+        self.model = model
+        self.calibration_path = calibration_path or os.path.join(
+            os.path.dirname(__file__), '..', 'database', 'relevance_thresholds.json'
+        )
+        self.enabled = os.getenv('RELEVANCE_GATE', 'true').lower() != 'false'
+        self.min_similarity: Optional[float] = None
+        self.min_margin: Optional[float] = None
+        self.source = 'none'
+        self.reload()
+
+    def reload(self):
+        """
+        Resolve the thresholds for the model again, e.g. after a calibration
+        """
+        thresholds, self.source = {}, 'none'
+        if self.model in DEFAULT_THRESHOLDS:
+            thresholds, self.source = dict(DEFAULT_THRESHOLDS[self.model]), 'default'
+
+        calibrated = self._read_calibrations().get(self.model)
+        if calibrated:
+            thresholds.update({key: calibrated[key] for key in ('min_similarity', 'min_margin') if key in calibrated})
+            self.source = 'calibrated'
+
+        for key, variable in (('min_similarity', 'RELEVANCE_MIN_SIMILARITY'), ('min_margin', 'RELEVANCE_MIN_MARGIN')):
+            if os.getenv(variable):
+                thresholds[key] = float(os.getenv(variable))
+                self.source = 'environment'
+
+        self.min_similarity = thresholds.get('min_similarity')
+        self.min_margin = thresholds.get('min_margin')
+
+    def check(self, candidates: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        None when candidates may be answered from, otherwise the reason to skip generation
+        """
+        if not candidates:
+            return 'no_candidates'
+        if not self.enabled:
+            return None
+
+        similarities = [doc['similarity'] for doc in candidates if doc.get('similarity') is not None]
+        if not similarities:
+            return None
+        top = max(similarities)
+        if self.min_similarity is not None and top < self.min_similarity:
+            return 'below_threshold'
+        if self.min_margin is not None and len(similarities) > 2 and top - float(np.median(similarities)) < self.min_margin:
+            return 'low_margin'
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'model': self.model,
+            'min_similarity': self.min_similarity,
+            'min_margin': self.min_margin,
+            'source': self.source
+        }
+
+    def calibrate(self, embedding_service, vector_db, relevant_queries: List[str], irrelevant_queries: List[str],
+                  target_recall: float = 0.95, top_k: int = 30) -> Dict[str, Any]:
+        """
+        Fit min_similarity to the corpus and save it for this model.
+
+        relevant_queries should have answers in the store and irrelevant_queries
+        should not. The threshold keeps target_recall of the relevant queries;
+        the share of irrelevant queries it would skip is reported with it.
+        """
+        def score(queries: List[str]):
+            """
+            Top similarity and top-minus-median margin of each query that retrieved anything
+            """
+            tops, margins = [], []
+            if queries:
+                embeddings = embedding_service.create_embeddings_batch(queries)
+                collection = (DEFAULT_TENANT, self.model, len(embeddings[0]))
+                for query_hits in vector_db.search_similar_batch(embeddings, top_k=top_k, collection=collection):
+                    similarities = [hit['similarity'] for hit in query_hits]
+                    if similarities:
+                        tops.append(max(similarities))
+                        margins.append(max(similarities) - float(np.median(similarities)))
+            return np.array(tops), np.array(margins)
+
+        relevant_top, relevant_margin = score(relevant_queries)
+        irrelevant_top, irrelevant_margin = score(irrelevant_queries)
+        if not len(relevant_top):
+            raise ValueError("No relevant query retrieved anything; is the vector store empty?")
+
+        min_similarity = float(np.quantile(relevant_top, 1 - target_recall))
+        calibration = {
+            'min_similarity': round(min_similarity, 4),
+            'target_recall': target_recall,
+            'relevant_queries': len(relevant_top),
+            'irrelevant_queries': len(irrelevant_top),
+            'irrelevant_skip_rate': round(float(np.mean(irrelevant_top < min_similarity)), 4) if len(irrelevant_top) else None,
+            'relevant_top_median': round(float(np.median(relevant_top)), 4),
+            'irrelevant_top_median': round(float(np.median(irrelevant_top)), 4) if len(irrelevant_top) else None,
+            'relevant_margin_p05': round(float(np.quantile(relevant_margin, 0.05)), 4),
+            'irrelevant_margin_median': round(float(np.median(irrelevant_margin)), 4) if len(irrelevant_margin) else None,
+            'calibrated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        }
+
+        calibrations = self._read_calibrations()
+        previous_margin = (calibrations.get(self.model) or {}).get('min_margin')
+        if previous_margin is not None:
+            calibration['min_margin'] = previous_margin  # Margins are set by hand; keep one that was
+        calibrations[self.model] = calibration
+        os.makedirs(os.path.dirname(self.calibration_path), exist_ok=True)
+        temporary_path = f"{self.calibration_path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump(calibrations, f, indent=2)
+        os.replace(temporary_path, self.calibration_path)
+
+        self.reload()
+        logger.info(f"Calibrated relevance threshold for {self.model}: {calibration}")
+        return calibration
+
+    def _read_calibrations(self) -> Dict[str, Any]:
+        try:
+            with open(self.calibration_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading relevance calibration {self.calibration_path}: {str(e)}")
+            return {}
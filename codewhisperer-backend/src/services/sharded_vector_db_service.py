@@ -0,0 +1,433 @@
+import os
+import sys
+import json
+import uuid
+import heapq
+import atexit
+import pickle
+import shutil
+import hashlib
+import logging
+import secrets
+import tempfile
+import threading
+import subprocess
+import time
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client
+from typing import List, Dict, Any, Tuple, Iterator
+from src.services.vector_db_service import VectorDatabaseService, VectorEntry
+from src.services.vector_collections import Collection, check_dimension
+from src.services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def shard_for(vector_id: str, shard_count: int) -> int:
+    """
+    Jump consistent hash of a vector id; growing from n to n + 1 shards moves only 1/(n + 1) of the ids
+    """
+    key = int.from_bytes(hashlib.md5(vector_id.encode()).digest()[:8], 'little')
+    bucket, jump = -1, 0
+    while jump < shard_count:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+class ShardedVectorDatabaseService:
+    """
+    Vector store hash-partitioned across local shard processes.
+
+    Each shard is a VectorDatabaseService in its own process (see
+    vector_shard_server), reached over a Unix socket. Searches are fanned
+    out to every shard in parallel and the per-shard top-k lists are merged
+    with a heap, so a scan uses one core per shard. Ids are placed with jump
+    consistent hashing; when the shard count changes, only the ids that now
+    belong elsewhere are moved. The public methods mirror VectorDatabaseService.
+    """
+
+    def __init__(self, shard_count: int, storage_dir: str = None, autoload: bool = True,
+                 legacy_storage_path: str = None):
+        database_dir = os.path.join(os.path.dirname(__file__), '..', 'database')
+        self.shard_count = shard_count
+        self.storage_path = storage_dir or os.path.join(database_dir, 'vector_shards')
+        # An unsharded vectors.pkl found here is imported on first load
+        self.legacy_storage_path = legacy_storage_path or (
+            None if storage_dir else os.path.join(database_dir, 'vectors.pkl')
+        )
+        self.connect_timeout = 120  # Seconds a shard may take to load its vectors
+        self.rebalance_batch_size = 5000  # Entries moved per shard request while rebalancing
+        self._shards: List[Dict[str, Any]] = []
+        self._executor = None
+        self._socket_dir = None
+        self._authkey = secrets.token_bytes(32)
+        self._start_lock = threading.Lock()
+        atexit.register(self.close)
+        if autoload:
+            self.load_vectors()
+
+    def add_vector(self, text: str, embedding: List[float], metadata: Dict[str, Any] = None) -> str:
+        """
+        Add a vector to the database
+        """
+        return self.add_vectors_batch([(text, embedding, metadata)])[0]
+
+    def add_vectors_batch(self, entries: List[Tuple[str, List[float], Dict[str, Any]]],
+                          persist: bool = True, vector_ids: List[str] = None) -> List[str]:
+        """
+        Add multiple vectors, routing each to its shard; shards are written in parallel
+        """
+        try:
+            vector_ids = list(vector_ids) if vector_ids else [str(uuid.uuid4()) for _ in entries]
+            batches: Dict[int, Tuple[list, list]] = {}
+            for vector_id, entry in zip(vector_ids, entries):
+                shard_entries, shard_ids = batches.setdefault(shard_for(vector_id, self.shard_count), ([], []))
+                shard_entries.append(entry)
+                shard_ids.append(vector_id)
+
+            self._call_each({
+                index: ('add_vectors_batch', (shard_entries,), {'persist': persist, 'vector_ids': shard_ids})
+                for index, (shard_entries, shard_ids) in batches.items()
+            })
+            self._publish_size()
+            return vector_ids
+
+        except Exception as e:
+            logger.error(f"Error adding vectors batch to shards: {str(e)}")
+            raise
+
+    def search_similar(self, query_embedding: List[float], top_k: int = 5,
+                       source_type_filter: str = None, collection: Collection = None) -> List[Dict[str, Any]]:
+        """
+        Search for similar vectors
+        """
+        try:
+            return self.search_similar_batch([query_embedding], top_k, source_type_filter, collection)[0]
+
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error searching similar vectors: {str(e)}")
+            return []
+
+    def search_similar_batch(self, query_embeddings: List[List[float]], top_k: int = 5,
+                             source_type_filter: str = None,
+                             collection: Collection = None) -> List[List[Dict[str, Any]]]:
+        """
+        Fan the queries out to every shard and merge the per-shard top-k lists
+        """
+        if not query_embeddings:
+            return []
+
+        check_dimension(collection, len(query_embeddings[0]))  # Before fanning out, so it surfaces as ValueError
+        per_shard = self._call_all('search_similar_batch', query_embeddings, top_k, source_type_filter, collection)
+        return [
+            heapq.nlargest(top_k, chain.from_iterable(hits[i] for hits in per_shard),
+                           key=lambda hit: hit['similarity'])
+            for i in range(len(query_embeddings))
+        ]
+
+    def warm_up(self) -> int:
+        """
+        Build the search matrices of every shard in parallel
+        """
+        return sum(self._call_all('warm_up'))
+
+    def get_vector(self, vector_id: str) -> VectorEntry:
+        """
+        Get a specific vector by ID
+        """
+        return self._call(shard_for(vector_id, self.shard_count), 'get_vector', vector_id)
+
+    def get_vector_ids(self) -> List[str]:
+        """
+        Get the ids of all stored vectors
+        """
+        return list(chain.from_iterable(self._call_all('get_vector_ids')))
+
+    def iter_entries(self, page_size: int = 1000) -> Iterator[VectorEntry]:
+        """
+        Iterate over all stored entries, fetching one page at a time from each shard
+        """
+        for index in range(len(self._shards)):
+            vector_ids = self._call(index, 'get_vector_ids')
+            for i in range(0, len(vector_ids), page_size):
+                yield from self._call(index, 'get_vectors', vector_ids[i:i + page_size])
+
+    def delete_vector(self, vector_id: str) -> bool:
+        """
+        Delete a vector from the database
+        """
+        try:
+            return self.delete_vectors([vector_id]) > 0
+
+        except Exception as e:
+            logger.error(f"Error deleting vector: {str(e)}")
+            return False
+
+    def delete_vectors(self, vector_ids: List[str], persist: bool = True) -> int:
+        """
+        Delete many vectors; each affected shard persists once
+        """
+        try:
+            batches: Dict[int, List[str]] = {}
+            for vector_id in vector_ids:
+                batches.setdefault(shard_for(vector_id, self.shard_count), []).append(vector_id)
+
+            deleted = self._call_each({
+                index: ('delete_vectors', (shard_ids,), {'persist': persist})
+                for index, shard_ids in batches.items()
+            })
+            self._publish_size()
+            return sum(deleted.values())
+
+        except Exception as e:
+            logger.error(f"Error deleting vectors from shards: {str(e)}")
+            raise
+
+    def clear_database(self):
+        """
+        Clear all vectors from every shard
+        """
+        self._call_all('clear_database')
+        self._publish_size()
+        logger.info("Cleared sharded vector database")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get database statistics, aggregated over shards
+        """
+        try:
+            shard_stats = self._call_all('get_stats')
+            source_types: Dict[str, int] = {}
+            collections: Dict[str, int] = {}
+            for stats in shard_stats:
+                for source_type, count in stats.get('source_types', {}).items():
+                    source_types[source_type] = source_types.get(source_type, 0) + count
+                for name, count in stats.get('collections', {}).items():
+                    collections[name] = collections.get(name, 0) + count
+
+            return {
+                'total_vectors': sum(stats.get('total_vectors', 0) for stats in shard_stats),
+                'source_types': source_types,
+                'collections': dict(sorted(collections.items())),
+                'storage_path': self.storage_path,
+                'shards': [{'shard': index, 'total_vectors': stats.get('total_vectors', 0)}
+                           for index, stats in enumerate(shard_stats)]
+            }
+
+        except Exception as e:
+            logger.error(f"Error getting stats: {str(e)}")
+            return {}
+
+    def save_vectors(self):
+        """
+        Save every shard to disk
+        """
+        self._call_all('save_vectors')
+        self._write_manifest()
+
+    def load_vectors(self):
+        """
+        Start the shard processes, which load their vectors in parallel, and rebalance if the shard count changed
+        """
+        with self._start_lock:
+            manifest = self._read_manifest()
+            stored_count = manifest.get('shard_count') if manifest else None
+
+            start_time = time.time()
+            self._start_shards(max(self.shard_count, stored_count or 0))
+            logger.info(f"Started {len(self._shards)} vector shards in {time.time() - start_time:.2f}s")
+
+            if stored_count is None and self.legacy_storage_path and os.path.exists(self.legacy_storage_path):
+                self._import_legacy_storage()
+            elif stored_count is not None and stored_count != self.shard_count:
+                self._rebalance(self.shard_count)
+            self._write_manifest()
+            self._publish_size()
+
+    def rebalance(self, shard_count: int) -> int:
+        """
+        Change the number of shards, moving only the ids whose shard changes; returns how many moved
+        """
+        with self._start_lock:
+            self._start_shards(max(shard_count, len(self._shards)))
+            moved = self._rebalance(shard_count)
+            self._write_manifest()
+            return moved
+
+    def close(self):
+        """
+        Stop the shard processes
+        """
+        for shard in self._shards:
+            try:
+                shard['connection'].close()
+            except OSError:
+                pass
+        for shard in self._shards:
+            try:
+                shard['process'].wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                shard['process'].kill()
+        self._shards = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._socket_dir:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+            self._socket_dir = None
+
+    estimate_entry_bytes = staticmethod(VectorDatabaseService.estimate_entry_bytes)
+    _cosine_similarity = staticmethod(VectorDatabaseService._cosine_similarity)
+
+    def _rebalance(self, shard_count: int) -> int:
+        """
+        Move misplaced entries to their shard under shard_count shards, then retire surplus shards
+        """
+        start_time = time.time()
+        moved = 0
+        previous_count = self.shard_count
+        self.shard_count = shard_count  # New writes go to their final shard right away
+
+        for index in range(len(self._shards)):
+            while True:
+                entries = self._call(index, 'extract_misplaced', index, shard_count, self.rebalance_batch_size)
+                if not entries:
+                    break
+                self.add_vectors_batch(
+                    [(text, embedding, metadata) for _, text, embedding, metadata in entries],
+                    persist=False,
+                    vector_ids=[vector_id for vector_id, _, _, _ in entries]
+                )
+                moved += len(entries)
+
+        # Destinations and sources are saved before the manifest records the new count
+        for index in range(len(self._shards)):
+            self._call(index, 'save_vectors')
+        surplus = self._shards[shard_count:]
+        self._shards = self._shards[:shard_count]
+        for index, shard in enumerate(surplus, start=shard_count):
+            shard['connection'].close()
+            shard['process'].wait(timeout=10)
+            if os.path.exists(self._shard_path(index)):
+                os.remove(self._shard_path(index))
+
+        logger.info(f"Rebalanced vector shards from {previous_count} to {shard_count}: "
+                    f"moved {moved} vectors in {time.time() - start_time:.2f}s")
+        return moved
+
+    def _import_legacy_storage(self):
+        """
+        Distribute an unsharded vectors.pkl over the shards
+        """
+        with open(self.legacy_storage_path, 'rb') as f:
+            vectors = pickle.load(f)
+        entries = list(vectors.values())
+        del vectors
+        for i in range(0, len(entries), self.rebalance_batch_size):
+            batch = entries[i:i + self.rebalance_batch_size]
+            self.add_vectors_batch([(entry.text, entry.embedding, entry.metadata) for entry in batch],
+                                   persist=False, vector_ids=[entry.id for entry in batch])
+        self._call_all('save_vectors')
+        logger.info(f"Imported {len(entries)} vectors from {self.legacy_storage_path} into {self.shard_count} shards")
+
+    def _start_shards(self, count: int):
+        """
+        Launch shard processes up to count and connect to them
+        """
+        if len(self._shards) >= count:
+            return
+        os.makedirs(self.storage_path, exist_ok=True)
+        if self._socket_dir is None:
+            self._socket_dir = tempfile.mkdtemp(prefix='vector-shards-')
+
+        env = dict(os.environ, VECTOR_SHARD_AUTHKEY=self._authkey.hex())
+        launched = []
+        for index in range(len(self._shards), count):
+            socket_path = os.path.join(self._socket_dir, f"shard-{index}.sock")
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'src.services.vector_shard_server',
+                 '--socket', socket_path, '--storage', self._shard_path(index)],
+                cwd=PROJECT_ROOT,
+                env=env
+            )
+            launched.append((process, socket_path))
+
+        # Shards load their pickles concurrently; connecting waits for each to finish
+        for process, socket_path in launched:
+            self._shards.append({
+                'process': process,
+                'connection': self._connect(process, socket_path),
+                'lock': threading.Lock(),
+                'size': 0
+            })
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=len(self._shards), thread_name_prefix='vector-shard')
+
+    def _connect(self, process: subprocess.Popen, socket_path: str):
+        deadline = time.time() + self.connect_timeout
+        while time.time() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Vector shard process exited with code {process.returncode}")
+            if os.path.exists(socket_path):
+                try:
+                    return Client(socket_path, family='AF_UNIX', authkey=self._authkey)
+                except (FileNotFoundError, ConnectionRefusedError):
+                    pass
+            time.sleep(0.05)
+        process.kill()
+        raise RuntimeError(f"Timed out connecting to vector shard at {socket_path}")
+
+    def _call(self, index: int, method: str, *args, **kwargs) -> Any:
+        """
+        Send one request to a shard and wait for its answer
+        """
+        shard = self._shards[index]
+        with shard['lock']:
+            shard['connection'].send((method, args, kwargs))
+            status, result, size = shard['connection'].recv()
+        shard['size'] = size
+        if status != 'ok':
+            raise RuntimeError(f"Vector shard {index} failed {method}: {result}")
+        return result
+
+    def _call_all(self, method: str, *args, **kwargs) -> List[Any]:
+        """
+        Send the same request to every shard in parallel
+        """
+        return list(self._executor.map(lambda index: self._call(index, method, *args, **kwargs),
+                                       range(len(self._shards))))
+
+    def _call_each(self, requests: Dict[int, Tuple[str, tuple, dict]]) -> Dict[int, Any]:
+        """
+        Send a different request to each listed shard in parallel
+        """
+        futures = {index: self._executor.submit(self._call, index, method, *args, **kwargs)
+                   for index, (method, args, kwargs) in requests.items()}
+        return {index: future.result() for index, future in futures.items()}
+
+    def _publish_size(self):
+        metrics.set_gauge('vector_store_vectors', sum(shard['size'] for shard in self._shards))
+
+    def _shard_path(self, index: int) -> str:
+        return os.path.join(self.storage_path, f"shard-{index}.pkl")
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        manifest_path = os.path.join(self.storage_path, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    def _write_manifest(self):
+        os.makedirs(self.storage_path, exist_ok=True)
+        manifest_path = os.path.join(self.storage_path, 'manifest.json')
+        with open(f"{manifest_path}.tmp", 'w') as f:
+            json.dump({'shard_count': self.shard_count}, f)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
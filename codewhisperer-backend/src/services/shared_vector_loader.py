@@ -0,0 +1,123 @@
+"""
+Loader process for SharedVectorDatabaseService.
+
+Owns the VectorDatabaseService of one storage file, publishes it into shared
+memory and applies the writes every worker forwards to it, republishing
+after each one. Launched with `python -m src.services.shared_vector_loader`
+by the first worker; it exits once no worker has been connected for
+--idle-timeout seconds.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from multiprocessing.connection import Listener, Client
+from typing import Any
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.services.vector_shard_server import ShardServer
+from src.services.shared_vector_store_service import SharedMatrixPublisher
+
+logger = logging.getLogger(__name__)
+
+class LoaderServer(ShardServer):
+    """
+    Serves many workers at once and republishes the store after every write
+    """
+
+    # Store methods after which workers must see a new generation
+    MUTATING_METHODS = {'add_vectors_batch', 'delete_vectors', 'clear_database'}
+
+    def __init__(self, storage_path: str, publisher: SharedMatrixPublisher, idle_timeout: float):
+        super().__init__(storage_path)
+        self.publisher = publisher
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()  # One request at a time against the store
+        self._clients = 0
+        self._idle_since = time.time()
+
+    def handle(self, method: str, args: tuple, kwargs: dict) -> Any:
+        if method == 'segment_name_prefix':
+            return self.publisher.name_prefix
+        result = super().handle(method, args, kwargs)
+        if method in self.MUTATING_METHODS:
+            self.publisher.publish(self.store)
+        return result
+
+    def serve_forever(self, listener: Listener):
+        threading.Thread(target=self._exit_when_idle, args=(listener,), daemon=True).start()
+        while True:
+            try:
+                connection = listener.accept()
+            except OSError:
+                continue  # Failed handshake
+            with self._lock:
+                self._clients += 1
+            threading.Thread(target=self._serve_client, args=(connection,), daemon=True).start()
+
+    def _serve_client(self, connection):
+        while True:
+            try:
+                method, args, kwargs = connection.recv()
+            except (EOFError, OSError):
+                break  # Worker went away
+            with self._lock:
+                try:
+                    response = ('ok', self.handle(method, args, kwargs), self.publisher.generation)
+                except Exception as e:
+                    logger.error(f"Error handling loader request {method}: {str(e)}")
+                    response = ('error', str(e), self.publisher.generation)
+            connection.send(response)
+        connection.close()
+        with self._lock:
+            self._clients -= 1
+            self._idle_since = time.time()
+
+    def _exit_when_idle(self, listener: Listener):
+        while True:
+            time.sleep(1)
+            with self._lock:
+                if self._clients == 0 and time.time() - self._idle_since > self.idle_timeout:
+                    listener.close()
+                    self.publisher.close()
+                    logger.warning("No workers connected; shared vector loader exiting")
+                    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared-memory vector store loader")
+    parser.add_argument('--socket', required=True, help="Unix socket path to listen on")
+    parser.add_argument('--storage', required=True, help="Pickle file holding the vectors")
+    parser.add_argument('--segment-prefix', required=True, help="Name prefix of the shared memory segments")
+    parser.add_argument('--idle-timeout', type=float, default=300, help="Seconds to outlive the last worker")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s | %(levelname)s | vector-loader | %(message)s')
+    authkey = bytes.fromhex(os.environ['VECTOR_LOADER_AUTHKEY'])
+
+    if os.path.exists(args.socket):
+        try:
+            Client(args.socket, family='AF_UNIX', authkey=authkey).close()
+            logger.warning(f"A loader is already serving {args.socket}")
+            return
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(args.socket)  # Left behind by a loader that crashed
+
+    publisher = SharedMatrixPublisher(args.segment_prefix)
+    try:
+        # Publish before listening so the first worker to connect can attach right away
+        server = LoaderServer(args.storage, publisher, args.idle_timeout)
+        publisher.publish(server.store)
+        with Listener(args.socket, family='AF_UNIX', authkey=authkey) as listener:
+            server.serve_forever(listener)
+    finally:
+        publisher.close()
+
+
+if __name__ == '__main__':
+    main()
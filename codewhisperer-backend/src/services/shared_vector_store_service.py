@@ -0,0 +1,617 @@
+import os
+import sys
+import json
+import uuid
+import atexit
+import fcntl
+import hashlib
+import logging
+import secrets
+import tempfile
+import threading
+import subprocess
+import time
+import numpy as np
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Dict, Any, Tuple, Iterator
+from src.services.vector_db_service import VectorDatabaseService, VectorEntry, top_k_rows
+from src.services.vector_collections import Collection, collection_of, collection_name, matching_collections, merge_hits
+from src.services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ARRAY_ALIGNMENT = 64  # Byte alignment of every array inside a segment
+
+def segment_prefix_for(storage_path: str) -> str:
+    """
+    Name prefix of the shared memory segments published for one vector storage file
+    """
+    digest = hashlib.sha1(os.path.abspath(storage_path).encode()).hexdigest()[:12]
+    return f"cw-vectors-{digest}"
+
+def attach_segment(name: str) -> SharedMemory:
+    """
+    Attach to an existing segment without handing it to this process's resource tracker,
+    which would otherwise unlink it for every process when this one exits
+    """
+    shm = SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+def create_segment(name: str, size: int) -> SharedMemory:
+    """
+    Create a segment, replacing one left behind by a loader that crashed
+    """
+    try:
+        return SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        stale = SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+        return SharedMemory(name=name, create=True, size=size)
+
+def write_segment(name: str, generation: int, store: VectorDatabaseService) -> SharedMemory:
+    """
+    Publish every entry of store into a new segment.
+
+    Rows are grouped by collection. Each group holds its normalized float32
+    matrix and the row norms, so search needs no preprocessing and
+    get_vector can still return the original embedding. Texts and metadata
+    are packed as UTF-8 with offset arrays and decoded only for hits.
+    """
+    groups: Dict[Collection, List[VectorEntry]] = {}
+    for entry in store.vectors.values():
+        groups.setdefault(collection_of(entry.embedding, entry.metadata), []).append(entry)
+    entries = [entry for collection in sorted(groups) for entry in groups[collection]]
+
+    ids = [entry.id.encode('utf-8') for entry in entries]
+    texts = [entry.text.encode('utf-8') for entry in entries]
+    metadata = [json.dumps(entry.metadata, default=str).encode('utf-8') for entry in entries]
+    source_types = sorted({entry.metadata.get('source_type') for entry in entries} - {None})
+    source_codes = {source_type: code for code, source_type in enumerate(source_types)}
+    id_dtype = f"S{max([len(vector_id) for vector_id in ids] + [1])}"
+
+    layout = {
+        'ids': (id_dtype, (len(ids),)),
+        'sorted_ids': (id_dtype, (len(ids),)),
+        'sorted_rows': ('int64', (len(ids),)),
+        'text_offsets': ('int64', (len(texts) + 1,)),
+        'text_data': ('uint8', (sum(map(len, texts)),)),
+        'metadata_offsets': ('int64', (len(metadata) + 1,)),
+        'metadata_data': ('uint8', (sum(map(len, metadata)),)),
+        'source_codes': ('int32', (len(entries),))
+    }
+    header_groups = []
+    start = 0
+    for index, collection in enumerate(sorted(groups)):
+        count = len(groups[collection])
+        layout[f"matrix_{index}"] = ('float32', (count, collection[2]))
+        layout[f"norms_{index}"] = ('float32', (count,))
+        header_groups.append([*collection, start, count])
+        start += count
+
+    # The header is sized before offsets are known, so reserve room for the largest offsets
+    def build_header(offset: int) -> bytes:
+        arrays = {}
+        for array_name, (dtype, shape) in layout.items():
+            offset = -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+            arrays[array_name] = {'dtype': dtype, 'shape': list(shape), 'offset': offset}
+            offset += int(np.dtype(dtype).itemsize * np.prod(shape))
+        return json.dumps({
+            'generation': generation,
+            'source_types': source_types,
+            'groups': header_groups,
+            'arrays': arrays,
+            'size': offset
+        }).encode('utf-8')
+
+    header = build_header(8 + 4096)
+    header = build_header(8 + len(header) + 64)
+    spec = json.loads(header)
+
+    shm = create_segment(name, max(spec['size'], 1))
+    shm.buf[:8] = len(header).to_bytes(8, 'little')
+    shm.buf[8:8 + len(header)] = header
+    arrays = {array_name: np.ndarray(tuple(array['shape']), dtype=array['dtype'], buffer=shm.buf,
+                                     offset=array['offset'])
+              for array_name, array in spec['arrays'].items()}
+
+    arrays['ids'][:] = ids
+    order = np.argsort(arrays['ids'], kind='stable')
+    arrays['sorted_ids'][:] = arrays['ids'][order]
+    arrays['sorted_rows'][:] = order
+    for column, values in (('text', texts), ('metadata', metadata)):
+        offsets = arrays[f"{column}_offsets"]
+        offsets[0] = 0
+        np.cumsum([len(value) for value in values], out=offsets[1:])
+        arrays[f"{column}_data"][:] = np.frombuffer(b''.join(values), dtype=np.uint8)
+    arrays['source_codes'][:] = [source_codes.get(entry.metadata.get('source_type'), -1) for entry in entries]
+
+    for index, (_, _, _, start, count) in enumerate(header_groups):
+        if count:
+            matrix = np.asarray([entry.embedding for entry in entries[start:start + count]], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1)
+            arrays[f"norms_{index}"][:] = norms
+            norms[norms == 0] = 1.0
+            np.divide(matrix, norms[:, None], out=arrays[f"matrix_{index}"])
+
+    del arrays  # Views must be gone before the segment can be closed
+    return shm
+
+
+class SharedMatrixSegment:
+    """
+    Read-only view of one published generation.
+
+    Readers keep a reference for as long as they use its arrays; the mapping
+    is released when the last reference goes away, so a newer generation can
+    be swapped in while older searches finish.
+    """
+
+    def __init__(self, name: str, shm: SharedMemory):
+        self.name = name
+        self._shm = shm
+        header_size = int.from_bytes(shm.buf[:8], 'little')
+        header = json.loads(bytes(shm.buf[8:8 + header_size]))
+        self.generation = header['generation']
+        self.source_types = header['source_types']
+        # Collection -> (array index, first row, row count)
+        self.groups = {(tenant, model, dimension): (index, start, count)
+                       for index, (tenant, model, dimension, start, count) in enumerate(header['groups'])}
+        self.arrays = {}
+        for array_name, array in header['arrays'].items():
+            view = np.ndarray(tuple(array['shape']), dtype=array['dtype'], buffer=shm.buf, offset=array['offset'])
+            view.flags.writeable = False
+            self.arrays[array_name] = view
+
+    def __len__(self) -> int:
+        return len(self.arrays['ids'])
+
+    def __del__(self):
+        self.arrays = {}
+        try:
+            self._shm.close()
+        except (BufferError, OSError):
+            pass  # A view is still exported; the mapping goes when it does
+
+    def row_of(self, vector_id: str) -> int:
+        key = vector_id.encode('utf-8')
+        sorted_ids = self.arrays['sorted_ids']
+        position = int(np.searchsorted(sorted_ids, key))
+        if position < len(sorted_ids) and sorted_ids[position] == key:
+            return int(self.arrays['sorted_rows'][position])
+        return None
+
+    def vector_id(self, row: int) -> str:
+        return self.arrays['ids'][row].decode('utf-8')
+
+    def text(self, row: int) -> str:
+        return self._decode('text', row)
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        return json.loads(self._decode('metadata', row))
+
+    def embedding(self, row: int) -> List[float]:
+        for index, start, count in self.groups.values():
+            if start <= row < start + count:
+                position = row - start
+                return (self.arrays[f"matrix_{index}"][position] * self.arrays[f"norms_{index}"][position]).tolist()
+        return []
+
+    def entry(self, row: int) -> VectorEntry:
+        return VectorEntry(id=self.vector_id(row), embedding=self.embedding(row),
+                           metadata=self.metadata(row), text=self.text(row))
+
+    def _decode(self, column: str, row: int) -> str:
+        offsets = self.arrays[f"{column}_offsets"]
+        return self.arrays[f"{column}_data"][offsets[row]:offsets[row + 1]].tobytes().decode('utf-8')
+
+
+class SharedMatrixPublisher:
+    """
+    Publishes generations of a store into shared memory for SharedVectorDatabaseService readers.
+
+    A small control segment holds the current generation number. Each publish
+    writes a complete new segment, bumps the counter and unlinks the previous
+    segment; readers that still map it keep their copy until they move on.
+    Segment names carry a random instance tag, so a relaunched loader never
+    reuses a name a reader already attached to.
+    """
+
+    def __init__(self, segment_prefix: str):
+        self.name_prefix = f"{segment_prefix}-{secrets.token_hex(4)}"
+        self.generation = 0
+        self._segment = None
+        self._control = create_segment(f"{self.name_prefix}-control", 8)
+        self._counter = np.ndarray((1,), dtype=np.int64, buffer=self._control.buf)
+        self._counter[0] = self.generation
+
+    def publish(self, store: VectorDatabaseService) -> int:
+        """
+        Write the store into a new generation and point readers at it
+        """
+        start_time = time.time()
+        generation = self.generation + 1
+        segment = write_segment(f"{self.name_prefix}-{generation}", generation, store)
+        self._counter[0] = generation
+
+        if self._segment is not None:
+            self._segment.close()
+            self._segment.unlink()
+        self._segment = segment
+        self.generation = generation
+        logger.info(f"Published generation {generation} with {len(store.vectors)} vectors "
+                    f"({segment.size / 1024 / 1024:.1f} MiB) in {time.time() - start_time:.2f}s")
+        return generation
+
+    def close(self):
+        """
+        Unlink the published segments
+        """
+        if self._segment is not None:
+            self._segment.close()
+            self._segment.unlink()
+            self._segment = None
+        if self._control is not None:
+            del self._counter
+            self._control.close()
+            self._control.unlink()
+            self._control = None
+
+
+class SharedVectorDatabaseService:
+    """
+    Vector store read from a shared-memory matrix, for multi-worker deployments.
+
+    One loader process per storage file (see shared_vector_loader) owns the
+    vectors and publishes them into shared memory; every worker attaches
+    read-only, so the matrix, ids, texts and metadata exist once per node no
+    matter how many workers run. Searches compare the shared generation
+    counter first and attach to a newer segment when ingestion published one.
+    Writes are forwarded to the loader, which republishes before answering, so
+    a worker always reads its own writes. The first worker to start launches
+    the loader; it exits once no worker has been connected for idle_timeout
+    seconds. The public methods mirror VectorDatabaseService.
+    """
+
+    def __init__(self, storage_path: str = None, autoload: bool = True):
+        self.storage_path = storage_path or os.path.join(os.path.dirname(__file__), '..', 'database', 'vectors.pkl')
+        self.segment_prefix = segment_prefix_for(self.storage_path)
+        self.socket_path = os.path.join(tempfile.gettempdir(), f"{self.segment_prefix}.sock")
+        self.connect_timeout = 120  # Seconds the loader may take to load and publish the vectors
+        self.idle_timeout = 300  # Seconds the loader outlives its last worker, covering worker restarts
+        self.query_block_size = 256  # Queries scored per matrix product in batch search
+        self._connection = None
+        self._control = None  # (control segment, generation counter view, segment name prefix)
+        self._segment: SharedMatrixSegment = None
+        self._call_lock = threading.Lock()
+        self._attach_lock = threading.Lock()
+        atexit.register(self.close)
+        if autoload:
+            self.load_vectors()
+
+    def add_vector(self, text: str, embedding: List[float], metadata: Dict[str, Any] = None) -> str:
+        """
+        Add a vector to the database
+        """
+        return self.add_vectors_batch([(text, embedding, metadata)])[0]
+
+    def add_vectors_batch(self, entries: List[Tuple[str, List[float], Dict[str, Any]]],
+                          persist: bool = True, vector_ids: List[str] = None) -> List[str]:
+        """
+        Add multiple vectors through the loader, which publishes one new generation for the batch
+        """
+        try:
+            vector_ids = list(vector_ids) if vector_ids else [str(uuid.uuid4()) for _ in entries]
+            return self._call('add_vectors_batch', entries, persist=persist, vector_ids=vector_ids)
+
+        except Exception as e:
+            logger.error(f"Error adding vectors batch to shared store: {str(e)}")
+            raise
+
+    def search_similar(self, query_embedding: List[float], top_k: int = 5,
+                       source_type_filter: str = None, collection: Collection = None) -> List[Dict[str, Any]]:
+        """
+        Search for similar vectors
+        """
+        try:
+            return self.search_similar_batch([query_embedding], top_k, source_type_filter, collection)[0]
+
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error searching similar vectors: {str(e)}")
+            return []
+
+    def search_similar_batch(self, query_embeddings: List[List[float]], top_k: int = 5,
+                             source_type_filter: str = None,
+                             collection: Collection = None) -> List[List[Dict[str, Any]]]:
+        """
+        Search the shared matrices of the matching collections in the current generation
+        """
+        if not query_embeddings:
+            return []
+
+        segment = self._current_segment()
+        queries = self._normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+        searched = matching_collections(collection, queries.shape[1], segment.groups)
+        return merge_hits([self._search_group(segment, segment.groups[searched_collection], queries, top_k,
+                                              source_type_filter)
+                           for searched_collection in searched], len(query_embeddings), top_k)
+
+    def _search_group(self, segment: SharedMatrixSegment, group: Tuple[int, int, int], queries: np.ndarray,
+                      top_k: int, source_type_filter: str = None) -> List[List[Dict[str, Any]]]:
+        """
+        Search the matrix of one collection group with normalized queries
+        """
+        index, start, count = group
+        matrix = segment.arrays[f"matrix_{index}"]
+
+        candidates = np.arange(count)
+        if source_type_filter and count:
+            if source_type_filter not in segment.source_types:
+                return [[] for _ in queries]
+            code = segment.source_types.index(source_type_filter)
+            candidates = np.nonzero(segment.arrays['source_codes'][start:start + count] == code)[0]
+            matrix = matrix[candidates]
+
+        k = min(top_k, len(candidates))
+        if k == 0:
+            return [[] for _ in queries]
+
+        results = []
+        for columns, similarities in top_k_rows(queries, matrix, k, self.query_block_size):
+            hits = []
+            for column, similarity in zip(columns, similarities):
+                row = start + int(candidates[column])
+                hits.append({
+                    'id': segment.vector_id(row),
+                    'similarity': float(similarity),
+                    'text': segment.text(row),
+                    'metadata': segment.metadata(row)
+                })
+            results.append(hits)
+
+        return results
+
+    def get_vector(self, vector_id: str) -> VectorEntry:
+        """
+        Get a specific vector by ID
+        """
+        segment = self._current_segment()
+        row = segment.row_of(vector_id)
+        return segment.entry(row) if row is not None else None
+
+    def get_vector_ids(self) -> List[str]:
+        """
+        Get the ids of all stored vectors
+        """
+        return [vector_id.decode('utf-8') for vector_id in self._current_segment().arrays['ids']]
+
+    def iter_entries(self) -> Iterator[VectorEntry]:
+        """
+        Iterate over all entries of the current generation, decoding one at a time
+        """
+        segment = self._current_segment()
+        for row in range(len(segment)):
+            yield segment.entry(row)
+
+    def delete_vector(self, vector_id: str) -> bool:
+        """
+        Delete a vector from the database
+        """
+        try:
+            return self.delete_vectors([vector_id]) > 0
+
+        except Exception as e:
+            logger.error(f"Error deleting vector: {str(e)}")
+            return False
+
+    def delete_vectors(self, vector_ids: List[str], persist: bool = True) -> int:
+        """
+        Delete many vectors through the loader; returns how many existed
+        """
+        try:
+            return self._call('delete_vectors', list(vector_ids), persist=persist)
+
+        except Exception as e:
+            logger.error(f"Error deleting vectors from shared store: {str(e)}")
+            raise
+
+    def clear_database(self):
+        """
+        Clear all vectors from the database
+        """
+        self._call('clear_database')
+        logger.info("Cleared shared vector database")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get database statistics from the current generation
+        """
+        try:
+            segment = self._current_segment()
+            codes = segment.arrays['source_codes']
+            counts = np.bincount(codes[codes >= 0], minlength=len(segment.source_types))
+            source_types = {source_type: int(count) for source_type, count in zip(segment.source_types, counts) if count}
+            unknown = int(np.count_nonzero(codes < 0))
+            if unknown:
+                source_types['unknown'] = unknown
+
+            return {
+                'total_vectors': len(segment),
+                'source_types': source_types,
+                'collections': {collection_name(collection): count
+                                for collection, (_, _, count) in sorted(segment.groups.items()) if count},
+                'storage_path': self.storage_path,
+                'shared_generation': segment.generation
+            }
+
+        except Exception as e:
+            logger.error(f"Error getting stats: {str(e)}")
+            return {}
+
+    def save_vectors(self):
+        """
+        Have the loader save the vectors to disk
+        """
+        self._call('save_vectors')
+
+    def load_vectors(self):
+        """
+        Connect to the loader for this storage file, launching it if no worker has yet, and attach
+        """
+        start_time = time.time()
+        with self._call_lock:
+            self._connect_loader()
+        segment = self._current_segment()
+        logger.info(f"Attached shared vector matrix generation {segment.generation} "
+                    f"({len(segment)} vectors) in {time.time() - start_time:.2f}s")
+
+    def close(self):
+        """
+        Disconnect from the loader and release the attached segments
+        """
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except OSError:
+                pass
+            self._connection = None
+        self._segment = None
+        self._release_control()
+
+    estimate_entry_bytes = staticmethod(VectorDatabaseService.estimate_entry_bytes)
+    _cosine_similarity = staticmethod(VectorDatabaseService._cosine_similarity)
+    _normalize_rows = staticmethod(VectorDatabaseService._normalize_rows)
+
+    def _current_segment(self) -> SharedMatrixSegment:
+        """
+        Get the segment of the latest generation, attaching to it if it changed since the last call
+        """
+        segment = self._segment
+        _, counter, name_prefix = self._control
+        if segment is not None and segment.name == f"{name_prefix}-{int(counter[0])}":
+            return segment
+
+        with self._attach_lock:
+            for _ in range(10):
+                _, counter, name_prefix = self._control
+                name = f"{name_prefix}-{int(counter[0])}"
+                if self._segment is not None and self._segment.name == name:
+                    break
+                try:
+                    self._segment = SharedMatrixSegment(name, attach_segment(name))
+                    break
+                except FileNotFoundError:
+                    continue  # Superseded while attaching; read the counter again
+            else:
+                raise RuntimeError("Could not attach to the shared vector matrix")
+
+        metrics.set_gauge('vector_store_vectors', len(self._segment))
+        metrics.set_gauge('vector_shared_generation', self._segment.generation)
+        return self._segment
+
+    def _call(self, method: str, *args, **kwargs) -> Any:
+        """
+        Send one request to the loader, reconnecting once if it went away
+        """
+        with self._call_lock:
+            for attempt in range(2):
+                try:
+                    if self._connection is None:
+                        self._connect_loader()
+                    self._connection.send((method, args, kwargs))
+                    status, result, generation = self._connection.recv()
+                    break
+                except (EOFError, OSError):
+                    self._connection = None
+                    if attempt:
+                        raise
+        if status != 'ok':
+            raise RuntimeError(f"Vector loader failed {method}: {result}")
+        self._current_segment()  # The loader published before answering
+        return result
+
+    def _connect_loader(self):
+        """
+        Connect to the running loader or launch one; the lock file keeps workers from launching two
+        """
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        with open(f"{self.socket_path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            authkey = self._read_authkey()
+            try:
+                self._connection = Client(self.socket_path, family='AF_UNIX', authkey=authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                self._connection = self._launch_loader(authkey)
+
+        name_prefix = self._call_unlocked('segment_name_prefix')
+        if self._control is None or self._control[2] != name_prefix:
+            # First connection, or a relaunched loader publishing under a new instance tag
+            previous = self._control
+            control = attach_segment(f"{name_prefix}-control")
+            self._control = (control, np.ndarray((1,), dtype=np.int64, buffer=control.buf), name_prefix)
+            if previous is not None:
+                self._release_control(previous)
+
+    def _release_control(self, control: tuple = None):
+        control = control or self._control
+        if control is None:
+            return
+        if control is self._control:
+            self._control = None
+        try:
+            control[0].close()
+        except (BufferError, OSError):
+            pass  # The counter view is still referenced; the mapping goes with it
+
+    def _call_unlocked(self, method: str, *args, **kwargs) -> Any:
+        self._connection.send((method, args, kwargs))
+        status, result, _ = self._connection.recv()
+        if status != 'ok':
+            raise RuntimeError(f"Vector loader failed {method}: {result}")
+        return result
+
+    def _launch_loader(self, authkey: bytes):
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'src.services.shared_vector_loader',
+             '--socket', self.socket_path, '--storage', os.path.abspath(self.storage_path),
+             '--segment-prefix', self.segment_prefix, '--idle-timeout', str(self.idle_timeout)],
+            cwd=PROJECT_ROOT,
+            env=dict(os.environ, VECTOR_LOADER_AUTHKEY=authkey.hex()),
+            start_new_session=True  # Outlives the worker that launched it
+        )
+        logger.info(f"Launched shared vector loader (pid {process.pid}) for {self.storage_path}")
+
+        # The loader listens once the first generation is published
+        deadline = time.time() + self.connect_timeout
+        while time.time() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Shared vector loader exited with code {process.returncode}")
+            if os.path.exists(self.socket_path):
+                try:
+                    return Client(self.socket_path, family='AF_UNIX', authkey=authkey)
+                except (FileNotFoundError, ConnectionRefusedError):
+                    pass
+            time.sleep(0.05)
+        process.kill()
+        raise RuntimeError(f"Timed out connecting to shared vector loader at {self.socket_path}")
+
+    def _read_authkey(self) -> bytes:
+        """
+        Read the key workers and loader share, creating it readable by this user only
+        """
+        key_path = f"{self.socket_path}.key"
+        try:
+            descriptor = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(descriptor, 'w') as f:
+                f.write(secrets.token_hex(32))
+        except FileExistsError:
+            pass
+        with open(key_path) as f:
+            return bytes.fromhex(f.read().strip())
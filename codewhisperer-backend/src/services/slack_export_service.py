@@ -0,0 +1,245 @@
+import os
+import re
+import json
+import time
+import logging
+import zipfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterator
+from sqlalchemy import select, delete, func
+from src.models.document import Document, DocumentChunk, SlackExportCheckpoint
+from src.services.data_ingestion_service import DataIngestionService
+from src.services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+# <channel>/<YYYY-MM-DD>.json, the layout of Slack's workspace export
+DAY_FILE = re.compile(r'^(?:.*/)?([^/]+)/(\d{4}-\d{2}-\d{2})\.json$')
+
+# Housekeeping events that carry no conversation
+SKIPPED_SUBTYPES = {'channel_join', 'channel_leave', 'channel_purpose', 'channel_topic', 'bot_add', 'bot_remove'}
+
+_worker_ingestion = None
+
+def parse_export_day(archive_path: str, member: str, channel: str, day: str,
+                     user_names: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Read one channel day from an export archive and turn it into Slack chunks.
+
+    Runs in the worker processes, so it only takes and returns plain data;
+    each call opens the archive itself instead of receiving the file's bytes.
+    """
+    global _worker_ingestion
+    if _worker_ingestion is None:
+        _worker_ingestion = DataIngestionService()
+
+    with zipfile.ZipFile(archive_path) as archive:
+        raw = archive.read(member).decode('utf-8')
+
+    messages = []
+    for message in json.loads(raw):
+        if message.get('type') != 'message' or message.get('subtype') in SKIPPED_SUBTYPES:
+            continue
+        if not (message.get('text') or '').strip():
+            continue
+        user = message.get('user')
+        messages.append({
+            'user': user_names.get(user) or message.get('user_name') or user or 'unknown',
+            'text': message['text'],
+            'ts': message.get('ts'),
+            'thread_ts': message.get('thread_ts')
+        })
+
+    chunks = _worker_ingestion.process_slack_thread(messages, channel)
+    for _, metadata in chunks:
+        metadata['day'] = day
+    return {'channel': channel, 'day': day, 'content': raw, 'message_count': len(messages), 'chunks': chunks}
+
+
+class SlackExportService:
+    """
+    Ingest Slack workspace export archives (a zip of <channel>/<YYYY-MM-DD>.json files).
+
+    Archive members are read one day at a time and parsed and grouped in a
+    pool of worker processes, with a bounded number of days in flight, so
+    archives of any size stream through in constant memory. Each day is
+    embedded, written and checkpointed in its own transaction; a re-run
+    skips days whose archive member is unchanged, replaces days that grew,
+    and only reads the days it ingests.
+    """
+
+    def __init__(self, rag_service, document_store, workers: int = None):
+        self.rag_service = rag_service
+        self.document_store = document_store
+        self.db = document_store.db
+        self.workers = workers or int(os.getenv('SLACK_INGEST_WORKERS', str(os.cpu_count() or 1)))
+        self.max_pending_days = 2  # Days queued per worker ahead of the one being written
+
+    def ingest_archive(self, archive_path: str, channels: List[str] = None) -> Dict[str, Any]:
+        """
+        Ingest every new or changed channel day of an export archive and return counts
+        """
+        start_time = time.time()
+        stats = {'days_ingested': 0, 'days_replaced': 0, 'days_skipped': 0,
+                 'messages': 0, 'chunks': 0, 'errors': 0}
+
+        with zipfile.ZipFile(archive_path) as archive:
+            user_names = self._read_user_names(archive)
+            days = list(self._pending_days(archive, channels, stats))
+
+        if self.workers > 1 and len(days) > 1:
+            # Spawned, not forked: the app process runs background threads
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+                self._run(days, stats, lambda day: pool.submit(
+                    parse_export_day, archive_path, day['member'], day['channel'], day['day'], user_names
+                ), self.workers * self.max_pending_days)
+        else:
+            self._run(days, stats, lambda day: _Completed(
+                parse_export_day, archive_path, day['member'], day['channel'], day['day'], user_names
+            ), 1)
+
+        stats['processing_time'] = time.time() - start_time
+        logger.info(f"Ingested Slack export {archive_path}: {stats}")
+        return stats
+
+    def _run(self, days: List[Dict[str, Any]], stats: Dict[str, Any], submit, window: int):
+        """
+        Keep up to window days parsing while writing finished ones in archive order
+        """
+        pending = deque()
+        days = iter(days)
+        for day in days:
+            pending.append((day, submit(day)))
+            if len(pending) >= window:
+                break
+
+        while pending:
+            day, future = pending.popleft()
+            try:
+                with metrics.timer('ingest_stage_seconds', stage='slack_parse'):
+                    parsed = future.result()
+                self._write_day(day, parsed, stats)
+            except Exception as e:
+                self.db.session.rollback()
+                stats['errors'] += 1
+                logger.error(f"Error ingesting Slack day {day['channel']}/{day['day']}: {str(e)}")
+
+            next_day = next(days, None)
+            if next_day is not None:
+                pending.append((next_day, submit(next_day)))
+
+    def _pending_days(self, archive: zipfile.ZipFile, channels: List[str],
+                      stats: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Channel days in the archive that have no checkpoint or whose member changed
+        """
+        checkpoints = {
+            (checkpoint.channel, checkpoint.day): checkpoint
+            for checkpoint in self.db.session.execute(select(SlackExportCheckpoint)).scalars()
+        }
+        wanted = set(channels) if channels else None
+
+        members = []
+        for info in archive.infolist():
+            match = DAY_FILE.match(info.filename)
+            if match and not info.is_dir() and (wanted is None or match.group(1) in wanted):
+                members.append((match.group(1), match.group(2), info))
+
+        for channel, day, info in sorted(members, key=lambda member: member[:2]):
+            fingerprint = f"{info.CRC:08x}:{info.file_size}"
+            checkpoint = checkpoints.get((channel, day))
+            if checkpoint is not None and checkpoint.fingerprint == fingerprint:
+                stats['days_skipped'] += 1
+                continue
+            yield {'channel': channel, 'day': day, 'member': info.filename, 'fingerprint': fingerprint,
+                   'previous_document_id': checkpoint.document_id if checkpoint else None,
+                   'replacing': checkpoint is not None}
+
+    def _write_day(self, day: Dict[str, Any], parsed: Dict[str, Any], stats: Dict[str, Any]):
+        """
+        Embed and store one parsed day, replacing the document of an earlier version of it, and checkpoint it
+        """
+        if day['previous_document_id'] is not None:
+            self._remove_document(day['previous_document_id'])
+
+        chunks = parsed['chunks']
+        document_id = None
+        if chunks:
+            vector_ids = self.rag_service.add_documents_batch(chunks)
+            channel = day['channel']
+            document_id = self.document_store.write_documents([({
+                'source_type': 'slack',
+                'source_url': f"slack://channel/{channel}/day/{day['day']}",
+                'title': f"Slack discussion in #{channel} on {day['day']}",
+                'content': parsed['content'],
+                'doc_metadata': json.dumps({
+                    'channel': channel,
+                    'day': day['day'],
+                    'message_count': parsed['message_count']
+                })
+            }, self.document_store.build_chunk_rows(chunks, vector_ids,
+                                                    self.rag_service.get_embeddings(vector_ids)))])[0]
+
+        self.db.session.merge(SlackExportCheckpoint(
+            channel=day['channel'], day=day['day'], fingerprint=day['fingerprint'], document_id=document_id,
+            message_count=parsed['message_count'], chunk_count=len(chunks)
+        ))
+        with metrics.timer('ingest_stage_seconds', stage='sql_commit'):
+            self.db.session.commit()
+
+        stats['days_replaced' if day['replacing'] else 'days_ingested'] += 1
+        stats['messages'] += parsed['message_count']
+        stats['chunks'] += len(chunks)
+
+    def _remove_document(self, document_id: int):
+        """
+        Delete a previously ingested day's document, chunks and vectors
+        """
+        document = self.db.session.execute(
+            select(Document.source_type, Document.created_at).where(Document.id == document_id)
+        ).first()
+        if document is None:
+            return  # Deleted through the API since
+        embedding_ids = list(self.db.session.execute(
+            select(DocumentChunk.embedding_id)
+            .where(DocumentChunk.document_id == document_id, DocumentChunk.embedding_id.isnot(None))
+        ).scalars())
+        self.rag_service.delete_documents(embedding_ids)
+
+        chunk_count = self.db.session.scalar(
+            select(func.count(DocumentChunk.id)).where(DocumentChunk.document_id == document_id)
+        )
+        self.document_store.rollups.record_documents(
+            [(document.source_type, document.created_at, -1, -chunk_count)]
+        )
+        self.db.session.execute(delete(DocumentChunk).where(DocumentChunk.document_id == document_id))
+        self.db.session.execute(delete(Document).where(Document.id == document_id))
+
+    def _read_user_names(self, archive: zipfile.ZipFile) -> Dict[str, str]:
+        """
+        Map user ids to display names from the export's users.json, if it has one
+        """
+        member = next((name for name in archive.namelist() if name.rsplit('/', 1)[-1] == 'users.json'), None)
+        if member is None:
+            return {}
+        names = {}
+        for user in json.loads(archive.read(member)):
+            profile = user.get('profile') or {}
+            names[user.get('id')] = profile.get('display_name') or profile.get('real_name') or user.get('name')
+        return names
+
+
+class _Completed:
+    """
+    Future-like result of running a parse inline, for single-worker ingestion
+    """
+
+    def __init__(self, function, *args):
+        self._function = function
+        self._args = args
+
+    def result(self) -> Any:
+        return self._function(*self._args)
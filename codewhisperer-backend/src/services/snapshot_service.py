@@ -0,0 +1,403 @@
+import os
+import json
+import shutil
+import logging
+import numpy as np
+from datetime import datetime
+from typing import List, Dict, Any, Tuple, Iterator
+from sqlalchemy import delete, insert, select, text, tuple_
+from sqlalchemy import Boolean, DateTime, Float, Integer, LargeBinary
+from src.models.document import Document, DocumentChunk, SlackExportCheckpoint
+from src.services.stats_rollup_service import StatsRollupService
+from src.services.vector_collections import Collection, collection_of
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 'codewhisperer-snapshot'
+SNAPSHOT_VERSION = 1  # Raised when a change would make older readers misread a bundle
+
+# Tables a snapshot carries, parents first; query history and stats rollups stay with their node
+SNAPSHOT_TABLES = (Document, DocumentChunk, SlackExportCheckpoint)
+
+# Numpy dtypes of fixed-width column kinds; 'utf8' and 'binary' columns are stored as offsets and bytes
+FIXED_KINDS = {'int64': '<i8', 'float64': '<f8', 'bool': '|b1', 'datetime': '<M8[us]'}
+
+def column_kind(column) -> str:
+    """
+    How a SQLAlchemy column is stored in a snapshot
+    """
+    if isinstance(column.type, Boolean):
+        return 'bool'
+    if isinstance(column.type, Integer):
+        return 'int64'
+    if isinstance(column.type, Float):
+        return 'float64'
+    if isinstance(column.type, DateTime):
+        return 'datetime'
+    if isinstance(column.type, LargeBinary):
+        return 'binary'
+    return 'utf8'
+
+
+class NpyWriter:
+    """
+    Appends rows to an .npy file whose length is not known up front.
+
+    The header is written for zero rows and rewritten with the final count
+    on close; numpy pads headers so the count fits in place.
+    """
+
+    def __init__(self, path: str, dtype: str, row_shape: Tuple[int, ...] = ()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.rows = 0
+        self._file = open(path, 'wb')
+        self._header_size = self._write_header()
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self._file.write(values.tobytes())
+        self.rows += len(values)
+
+    def close(self):
+        self._file.seek(0)
+        if self._write_header() != self._header_size:
+            raise ValueError(f"Header of {self.path} changed size")
+        self._file.close()
+
+    def _write_header(self) -> int:
+        np.lib.format.write_array_header_1_0(self._file, {
+            'descr': np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order': False,
+            'shape': (self.rows, *self.row_shape)
+        })
+        return self._file.tell()
+
+
+class ColumnWriter:
+    """
+    Writes one column of a snapshot table as .npy files in directory.
+
+    Fixed-width kinds go to <name>.npy; utf8 and binary values are
+    concatenated into <name>.data.npy with each row's end offset in
+    <name>.offsets.npy. <name>.valid.npy marks the rows that are not NULL.
+    """
+
+    def __init__(self, directory: str, name: str, kind: str):
+        self.kind = kind
+        prefix = os.path.join(directory, name)
+        self._valid = NpyWriter(f"{prefix}.valid.npy", '|b1')
+        if kind in FIXED_KINDS:
+            self._values = NpyWriter(f"{prefix}.npy", FIXED_KINDS[kind])
+        else:
+            self._values = NpyWriter(f"{prefix}.data.npy", '|u1')
+            self._offsets = NpyWriter(f"{prefix}.offsets.npy", '<i8')
+            self._end = 0
+
+    def append(self, values: List[Any]):
+        self._valid.append([value is not None for value in values])
+        if self.kind == 'datetime':
+            self._values.append([np.datetime64(value, 'us') if value is not None else np.datetime64('NaT')
+                                 for value in values])
+        elif self.kind in FIXED_KINDS:
+            self._values.append([value if value is not None else 0 for value in values])
+        else:
+            encoded = [value.encode('utf-8') if isinstance(value, str) else bytes(value or b'') for value in values]
+            ends = self._end + np.cumsum([len(value) for value in encoded], dtype=np.int64)
+            self._values.append(np.frombuffer(b''.join(encoded), dtype=np.uint8))
+            self._offsets.append(ends)
+            self._end = int(ends[-1]) if len(ends) else self._end
+
+    def close(self):
+        self._valid.close()
+        self._values.close()
+        if self.kind not in FIXED_KINDS:
+            self._offsets.close()
+
+
+class ColumnReader:
+    """
+    Reads a column written by ColumnWriter, memory-mapping its files instead of loading them
+    """
+
+    def __init__(self, directory: str, name: str, kind: str):
+        self.kind = kind
+        prefix = os.path.join(directory, name)
+        self.valid = np.load(f"{prefix}.valid.npy", mmap_mode='r')
+        if kind in FIXED_KINDS:
+            self.values = np.load(f"{prefix}.npy", mmap_mode='r')
+        else:
+            self.values = np.load(f"{prefix}.data.npy", mmap_mode='r')
+            self.offsets = np.load(f"{prefix}.offsets.npy", mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+    def read(self, start: int, stop: int) -> List[Any]:
+        """
+        Python values of rows [start, stop), None for NULL
+        """
+        valid = self.valid[start:stop]
+        if self.kind == 'datetime':
+            values = self.values[start:stop].astype(object)
+        elif self.kind in FIXED_KINDS:
+            values = self.values[start:stop].tolist()
+        else:
+            begin = int(self.offsets[start - 1]) if start else 0
+            ends = self.offsets[start:stop] - begin
+            block = self.values[begin:begin + (int(ends[-1]) if len(ends) else 0)].tobytes()
+            starts = np.concatenate(([0], ends[:-1]))
+            values = [block[a:b] for a, b in zip(starts.tolist(), ends.tolist())]
+            if self.kind == 'utf8':
+                values = [value.decode('utf-8') for value in values]
+        return [value if is_valid else None for value, is_valid in zip(values, valid.tolist())]
+
+
+class SnapshotService:
+    """
+    Exports the knowledge base to a versioned columnar bundle and imports it on another node.
+
+    A bundle is a directory: snapshot.json describes it, vectors/<n>/ holds
+    one collection's embeddings as a float32 (rows, dimension) .npy next to
+    its ids, texts and metadata, sql/<table>/ holds every column of the
+    document tables, and text_store/ is a copy of the compressed text
+    store. Every array is a plain .npy file, so imports and other tools
+    memory-map them instead of parsing, and nothing depends on the Python
+    class path of VectorEntry the way the pickled vector storage does.
+
+    Importing is not zero-copy: the entries are added to a vector store,
+    which saves them in its own storage file, and nodes load that file when
+    they start, not the bundle. The stores cannot attach a bundle's matrices
+    directly yet.
+    """
+
+    def __init__(self, db, batch_size: int = 5000):
+        self.db = db
+        self.batch_size = batch_size  # Rows read, written and inserted per step
+
+    def export(self, path: str, vector_db, text_store, model: str, index_version: int) -> Dict[str, Any]:
+        """
+        Write a bundle of the vector store, text store and document tables to path.
+
+        Stores and tables are read one after another, so export while nothing
+        is being ingested for an exact copy; reconciliation repairs the drift
+        an ingest in between leaves.
+        """
+        if os.path.exists(path):
+            raise ValueError(f"{path} already exists")
+        staging_path = f"{path}.partial"
+        shutil.rmtree(staging_path, ignore_errors=True)
+        os.makedirs(staging_path)
+
+        try:
+            manifest = {
+                'format': SNAPSHOT_FORMAT,
+                'version': SNAPSHOT_VERSION,
+                'created_at': datetime.utcnow().isoformat(),
+                'index': {'model': model, 'version': index_version},
+                # The text store is copied first, so every text reference in the vectors resolves
+                'text_store': {'blobs': text_store.copy_to(os.path.join(staging_path, 'text_store'))},
+                'vectors': self._export_vectors(staging_path, vector_db),
+                'tables': {}
+            }
+            for model_class in SNAPSHOT_TABLES:
+                table = model_class.__table__
+                manifest['tables'][table.name] = self._export_table(staging_path, table)
+            self.db.session.rollback()
+
+            with open(os.path.join(staging_path, 'snapshot.json'), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(staging_path, path)
+
+        except Exception as e:
+            logger.error(f"Error exporting snapshot to {path}: {str(e)}")
+            self.db.session.rollback()
+            shutil.rmtree(staging_path, ignore_errors=True)
+            raise
+
+        stats = self._summarize(manifest)
+        logger.info(f"Exported snapshot to {path}: {stats}")
+        return stats
+
+    def read_manifest(self, path: str) -> Dict[str, Any]:
+        """
+        The bundle's snapshot.json; raises ValueError for anything this version cannot import
+        """
+        try:
+            with open(os.path.join(path, 'snapshot.json')) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"{path} is not a snapshot bundle")
+        if manifest.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"{path} is not a snapshot bundle")
+        if manifest.get('version', 0) > SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot format version {manifest['version']} is newer than the "
+                             f"supported version {SNAPSHOT_VERSION}")
+        return manifest
+
+    def restore(self, path: str, vector_db, text_store, replace: bool = False) -> Dict[str, Any]:
+        """
+        Load a bundle into an empty vector_db, the text store and the document tables.
+
+        The document tables must be empty unless replace is set, in which case
+        their rows are deleted in the same transaction that inserts the bundle's.
+        Rows keep their ids, so chunks still point at their vectors. The caller
+        persists vector_db and makes it the node's vector storage.
+        """
+        manifest = self.read_manifest(path)
+        if not replace and self.db.session.scalar(select(Document.id).limit(1)) is not None:
+            raise ValueError("The knowledge base is not empty; import with replace to overwrite it")
+
+        try:
+            text_store.import_blocks(os.path.join(path, 'text_store'))
+            for group in manifest['vectors']:
+                self._import_vectors(os.path.join(path, group['path']), vector_db)
+
+            if replace:
+                for model_class in reversed(SNAPSHOT_TABLES):
+                    self.db.session.execute(delete(model_class))
+            for model_class in SNAPSHOT_TABLES:
+                table = model_class.__table__
+                self._import_table(os.path.join(path, 'sql', table.name), table, manifest['tables'][table.name])
+            self._reset_sequences()
+            self.db.session.commit()
+            StatsRollupService(self.db).rebuild()
+
+        except Exception as e:
+            logger.error(f"Error importing snapshot from {path}: {str(e)}")
+            self.db.session.rollback()
+            raise
+
+        stats = self._summarize(manifest)
+        logger.info(f"Imported snapshot from {path}: {stats}")
+        return stats
+
+    def _export_vectors(self, directory: str, vector_db) -> List[Dict[str, Any]]:
+        """
+        Write the entries of each collection to vectors/<n>/ and describe the groups
+        """
+        groups: Dict[Collection, Dict[str, Any]] = {}
+        pending: Dict[Collection, list] = {}
+        for entry in vector_db.iter_entries():
+            collection = collection_of(entry.embedding, entry.metadata)
+            if collection not in groups:
+                group_dir = os.path.join(directory, 'vectors', str(len(groups)))
+                os.makedirs(group_dir)
+                groups[collection] = {
+                    'path': os.path.relpath(group_dir, directory),
+                    'embeddings': NpyWriter(os.path.join(group_dir, 'embeddings.npy'), '<f4', (collection[2],)),
+                    'columns': {name: ColumnWriter(group_dir, name, 'utf8') for name in ('id', 'text', 'metadata')}
+                }
+                pending[collection] = []
+            pending[collection].append(entry)
+            if len(pending[collection]) >= self.batch_size:
+                self._write_vectors(groups[collection], pending[collection])
+                pending[collection] = []
+
+        described = []
+        for collection, group in groups.items():
+            self._write_vectors(group, pending[collection])
+            group['embeddings'].close()
+            for writer in group['columns'].values():
+                writer.close()
+            tenant, model, dimension = collection
+            described.append({'path': group['path'], 'tenant': tenant, 'model': model,
+                              'dimension': dimension, 'rows': group['embeddings'].rows})
+        return described
+
+    def _write_vectors(self, group: Dict[str, Any], entries: list):
+        if not entries:
+            return
+        group['embeddings'].append([entry.embedding for entry in entries])
+        columns = group['columns']
+        columns['id'].append([entry.id for entry in entries])
+        columns['text'].append([entry.text for entry in entries])
+        columns['metadata'].append([json.dumps(entry.metadata) for entry in entries])
+
+    def _import_vectors(self, directory: str, vector_db):
+        """
+        Add the entries of vectors/<n>/ to vector_db a batch at a time.
+
+        Each batch is copied out of the mapped matrix once and its rows are
+        handed over as float32 arrays; as Python float lists they would take
+        eight times the memory and make the store's pickle slow to load.
+        """
+        embeddings = np.load(os.path.join(directory, 'embeddings.npy'), mmap_mode='r')
+        columns = {name: ColumnReader(directory, name, 'utf8') for name in ('id', 'text', 'metadata')}
+        for start in range(0, len(embeddings), self.batch_size):
+            stop = min(start + self.batch_size, len(embeddings))
+            texts = columns['text'].read(start, stop)
+            metadatas = [json.loads(value) for value in columns['metadata'].read(start, stop)]
+            rows = np.array(embeddings[start:stop], dtype=np.float32)
+            vector_db.add_vectors_batch(list(zip(texts, rows, metadatas)),
+                                        persist=False, vector_ids=columns['id'].read(start, stop))
+
+    def _export_table(self, directory: str, table) -> Dict[str, Any]:
+        """
+        Write every column of table to sql/<table>/, reading it in primary key order
+        """
+        table_dir = os.path.join(directory, 'sql', table.name)
+        os.makedirs(table_dir)
+        columns = [{'name': column.name, 'kind': column_kind(column)} for column in table.columns]
+        writers = [ColumnWriter(table_dir, column['name'], column['kind']) for column in columns]
+
+        rows = 0
+        for batch in self._iter_rows(table):
+            for writer, values in zip(writers, zip(*batch)):
+                writer.append(list(values))
+            rows += len(batch)
+        for writer in writers:
+            writer.close()
+        return {'rows': rows, 'columns': columns}
+
+    def _iter_rows(self, table) -> Iterator[list]:
+        """
+        Pages of table's rows by primary key, so no page is skipped or read twice
+        """
+        key = list(table.primary_key.columns)
+        key_expression = key[0] if len(key) == 1 else tuple_(*key)
+        last = None
+        while True:
+            statement = select(table).order_by(*key).limit(self.batch_size)
+            if last is not None:
+                statement = statement.where(key_expression > (last[0] if len(key) == 1 else tuple_(*last)))
+            rows = self.db.session.execute(statement).all()
+            if not rows:
+                return
+            yield rows
+            last = [getattr(rows[-1], column.name) for column in key]
+
+    def _import_table(self, directory: str, table, spec: Dict[str, Any]):
+        """
+        Insert the rows of sql/<table>/, keeping their primary keys; columns this schema lacks are ignored
+        """
+        columns = [column for column in spec['columns'] if column['name'] in table.columns]
+        readers = [ColumnReader(directory, column['name'], column['kind']) for column in columns]
+        names = [column['name'] for column in columns]
+        for start in range(0, spec['rows'], self.batch_size):
+            stop = min(start + self.batch_size, spec['rows'])
+            values = [reader.read(start, stop) for reader in readers]
+            self.db.session.execute(insert(table), [dict(zip(names, row)) for row in zip(*values)])
+
+    def _reset_sequences(self):
+        """
+        Move PostgreSQL id sequences past the imported ids; SQLite continues from the largest id by itself
+        """
+        if self.db.session.get_bind().dialect.name != 'postgresql':
+            return
+        for model_class in (Document, DocumentChunk):
+            table = model_class.__table__.name
+            self.db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+            ))
+
+    def _summarize(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'model': manifest['index']['model'],
+            'vectors': sum(group['rows'] for group in manifest['vectors']),
+            'collections': len(manifest['vectors']),
+            'documents': manifest['tables'][Document.__tablename__]['rows'],
+            'chunks': manifest['tables'][DocumentChunk.__tablename__]['rows'],
+            'text_blobs': manifest['text_store']['blobs']
+        }
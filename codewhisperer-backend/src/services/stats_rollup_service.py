@@ -0,0 +1,246 @@
+import logging
+from datetime import datetime, date, timedelta
+from typing import List, Dict, Any, Iterable, Tuple
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.dialects import sqlite, postgresql
+from src.models.document import Document, DocumentChunk, UserQuery, QueryRollup, DocumentRollup
+
+logger = logging.getLogger(__name__)
+
+ALL_BUCKET = 'all'
+
+def day_bucket(day) -> str:
+    """
+    Bucket of a UTC day, given as a datetime, a date or the 'YYYY-MM-DD' string SQL date() returns
+    """
+    if isinstance(day, datetime):
+        day = day.date()
+    return f"day:{day.isoformat() if isinstance(day, date) else day}"
+
+class StatsRollupService:
+    """
+    Incrementally maintained totals behind the stats and history endpoints.
+
+    Writers call the record_* methods in the same transaction as the rows
+    they add or remove, so the rollups commit or roll back with them and
+    dashboards read a handful of rows by primary key instead of scanning
+    user_queries and documents. rebuild() recomputes everything from the
+    source tables, for databases created before the rollups existed.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def record_queries(self, queries: Iterable[UserQuery]):
+        """
+        Count new query rows, before or after they are flushed
+        """
+        increments: Dict[str, Dict[str, float]] = {}
+        for query in queries:
+            deltas = {
+                'query_count': 1,
+                'processing_time_total': query.processing_time or 0.0,
+                'processing_time_count': 1 if query.processing_time is not None else 0,
+                'rating_total': query.feedback_rating or 0,
+                'rating_count': 1 if query.feedback_rating is not None else 0
+            }
+            for bucket in self._query_buckets(query.user_id, query.created_at):
+                self._accumulate(increments, bucket, deltas)
+        self._increment(QueryRollup, increments)
+
+    def record_feedback(self, query: UserQuery, previous_rating: int):
+        """
+        Move a query's rating contribution from previous_rating to its current rating
+        """
+        deltas = {
+            'rating_total': (query.feedback_rating or 0) - (previous_rating or 0),
+            'rating_count': (query.feedback_rating is not None) - (previous_rating is not None)
+        }
+        if any(deltas.values()):
+            self._increment(QueryRollup, {
+                bucket: deltas for bucket in self._query_buckets(query.user_id, query.created_at)
+            })
+
+    def record_documents(self, documents: Iterable[Tuple[str, datetime, int, int]]):
+        """
+        Apply (source_type, created_at, document delta, chunk delta) changes; deltas are negative for deletes
+        """
+        increments: Dict[str, Dict[str, float]] = {}
+        for source_type, created_at, document_delta, chunk_delta in documents:
+            deltas = {'document_count': document_delta, 'chunk_count': chunk_delta}
+            for bucket in (ALL_BUCKET, f"source_type:{source_type}", day_bucket(created_at or datetime.utcnow())):
+                self._accumulate(increments, bucket, deltas)
+        self._increment(DocumentRollup, increments)
+
+    def get_query_stats(self, user_id: str = None) -> Dict[str, Any]:
+        """
+        Totals and averages over all queries, or one user's
+        """
+        rollup = self.db.session.get(QueryRollup, f"user:{user_id}" if user_id else ALL_BUCKET)
+        if rollup is None:
+            return {'total_queries': 0, 'average_rating': None, 'average_processing_time': None}
+        return {
+            'total_queries': rollup.query_count,
+            'average_rating': rollup.rating_total / rollup.rating_count if rollup.rating_count else None,
+            'average_processing_time': (rollup.processing_time_total / rollup.processing_time_count
+                                        if rollup.processing_time_count else None)
+        }
+
+    def get_document_stats(self) -> Dict[str, Any]:
+        """
+        Document and chunk totals, overall and per source type
+        """
+        rollups = self.db.session.execute(
+            select(DocumentRollup).where(
+                (DocumentRollup.bucket == ALL_BUCKET) | DocumentRollup.bucket.startswith('source_type:')
+            )
+        ).scalars()
+        stats = {'total_documents': 0, 'total_chunks': 0, 'source_types': {}}
+        for rollup in rollups:
+            if rollup.bucket == ALL_BUCKET:
+                stats['total_documents'] = rollup.document_count
+                stats['total_chunks'] = rollup.chunk_count
+            elif rollup.document_count:
+                stats['source_types'][rollup.bucket.split(':', 1)[1]] = rollup.document_count
+        return stats
+
+    def count_documents(self, source_type: str = None) -> int:
+        rollup = self.db.session.get(DocumentRollup, f"source_type:{source_type}" if source_type else ALL_BUCKET)
+        return rollup.document_count if rollup else 0
+
+    def get_daily(self, model, column: str, days: int) -> Dict[str, int]:
+        """
+        Per-day values of one rollup column for the last days days, oldest first, zero-filled
+        """
+        today = datetime.utcnow().date()
+        first_day = today - timedelta(days=days - 1)
+        rows = self.db.session.execute(
+            select(model.bucket, getattr(model, column))
+            .where(model.bucket >= day_bucket(first_day), model.bucket <= day_bucket(today))
+        ).all()
+        values = {bucket.split(':', 1)[1]: value for bucket, value in rows}
+        days_covered = [(first_day + timedelta(days=i)).isoformat() for i in range(days)]
+        return {day: values.get(day, 0) for day in days_covered}
+
+    def frequent_queries(self, limit: int, recent: int = 10000) -> List[str]:
+        """
+        The most frequently asked query texts among the latest recent queries, most frequent first
+        """
+        latest = select(UserQuery.query_text).order_by(UserQuery.id.desc()).limit(recent).subquery()
+        return list(self.db.session.scalars(
+            select(latest.c.query_text).group_by(latest.c.query_text).order_by(func.count().desc()).limit(limit)
+        ))
+
+    def ensure_built(self):
+        """
+        Build the rollups of tables that have rows but no rollups yet, e.g. after upgrading
+        """
+        session = self.db.session
+        if session.get(QueryRollup, ALL_BUCKET) is None and session.scalar(select(UserQuery.id).limit(1)) is not None:
+            self.rebuild_query_rollups()
+        if session.get(DocumentRollup, ALL_BUCKET) is None and session.scalar(select(Document.id).limit(1)) is not None:
+            self.rebuild_document_rollups()
+        session.commit()
+
+    def rebuild(self) -> Dict[str, int]:
+        """
+        Recompute every rollup from the source tables and commit
+        """
+        stats = {'query_buckets': self.rebuild_query_rollups(),
+                 'document_buckets': self.rebuild_document_rollups()}
+        self.db.session.commit()
+        logger.info(f"Rebuilt stats rollups: {stats}")
+        return stats
+
+    def rebuild_query_rollups(self) -> int:
+        session = self.db.session
+        session.execute(delete(QueryRollup))  # Deleting first takes the write lock before aggregating
+
+        aggregates = (
+            func.count(UserQuery.id),
+            func.coalesce(func.sum(UserQuery.processing_time), 0.0),
+            func.count(UserQuery.processing_time),
+            func.coalesce(func.sum(UserQuery.feedback_rating), 0),
+            func.count(UserQuery.feedback_rating)
+        )
+        rows = [(ALL_BUCKET, *session.execute(select(*aggregates)).one())]
+        rows += [(day_bucket(day), *values) for day, *values in session.execute(
+            select(func.date(UserQuery.created_at), *aggregates).group_by(func.date(UserQuery.created_at))
+        ) if day is not None]
+        rows += [(f"user:{user_id}", *values) for user_id, *values in session.execute(
+            select(UserQuery.user_id, *aggregates).group_by(UserQuery.user_id)
+        )]
+
+        session.execute(insert(QueryRollup), [{
+            'bucket': bucket, 'query_count': query_count,
+            'processing_time_total': processing_time_total, 'processing_time_count': processing_time_count,
+            'rating_total': rating_total, 'rating_count': rating_count
+        } for bucket, query_count, processing_time_total, processing_time_count, rating_total, rating_count in rows])
+        return len(rows)
+
+    def rebuild_document_rollups(self) -> int:
+        session = self.db.session
+        session.execute(delete(DocumentRollup))
+
+        chunk_counts = (
+            select(DocumentChunk.document_id, func.count(DocumentChunk.id).label('chunks'))
+            .group_by(DocumentChunk.document_id)
+            .subquery()
+        )
+        aggregates = (func.count(Document.id), func.coalesce(func.sum(chunk_counts.c.chunks), 0))
+
+        def documents(*group_columns):
+            statement = select(*group_columns, *aggregates).select_from(Document).outerjoin(
+                chunk_counts, chunk_counts.c.document_id == Document.id
+            )
+            return session.execute(statement.group_by(*group_columns) if group_columns else statement)
+
+        rows = [(ALL_BUCKET, *documents().one())]
+        rows += [(f"source_type:{source_type}", *values)
+                 for source_type, *values in documents(Document.source_type)]
+        rows += [(day_bucket(day), *values)
+                 for day, *values in documents(func.date(Document.created_at)) if day is not None]
+
+        session.execute(insert(DocumentRollup), [
+            {'bucket': bucket, 'document_count': document_count, 'chunk_count': chunk_count}
+            for bucket, document_count, chunk_count in rows
+        ])
+        return len(rows)
+
+    def _query_buckets(self, user_id: str, created_at: datetime) -> List[str]:
+        return [ALL_BUCKET, day_bucket(created_at or datetime.utcnow()), f"user:{user_id}"]
+
+    def _accumulate(self, increments: Dict[str, Dict[str, float]], bucket: str, deltas: Dict[str, float]):
+        totals = increments.setdefault(bucket, {})
+        for column, delta in deltas.items():
+            totals[column] = totals.get(column, 0) + delta
+
+    def _increment(self, model, increments: Dict[str, Dict[str, float]]):
+        """
+        Add deltas to rollup rows, creating missing buckets, with one upsert per call where supported
+        """
+        if not increments:
+            return
+
+        table = model.__table__
+        columns = [column.name for column in table.c if column.name != 'bucket']
+        rows = [{'bucket': bucket, **{column: deltas.get(column, 0) for column in columns}}
+                for bucket, deltas in increments.items()]
+
+        dialect = self.db.session.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            statement = (sqlite if dialect == 'sqlite' else postgresql).insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.bucket],
+                set_={column: table.c[column] + statement.excluded[column] for column in columns}
+            )
+            self.db.session.execute(statement, rows)
+            return
+
+        for row in rows:
+            result = self.db.session.execute(
+                update(table).where(table.c.bucket == row['bucket'])
+                .values({column: table.c[column] + row[column] for column in columns})
+            )
+            if result.rowcount == 0:
+                self.db.session.execute(insert(table).values(**row))
@@ -0,0 +1,368 @@
+import os
+import zlib
+import fcntl
+import shutil
+import struct
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple, Iterable, Iterator, Set
+
+logger = logging.getLogger(__name__)
+
+# Metadata key holding a chunk's [blob id, start, end] span once its text lives in the text store
+TEXT_REF_KEY = 'text_ref'
+
+TextRef = Tuple[str, int, int]
+
+class TextStore:
+    """
+    Content-addressed, compressed store for chunk and source texts.
+
+    Each distinct text is kept once, as a zlib block appended to blobs.dat
+    and keyed by its SHA-256. blobs.idx holds one fixed-size record per block
+    (digest, offset, compressed length) and is loaded into a dict at startup.
+    Chunks are stored as (blob, start, end) character spans into their
+    source text when they are a substring of it, so overlapping chunks of a
+    file cost nothing beyond the file itself. Several processes may share
+    a store directory; appends are serialized with a lock on the index.
+
+    Blocks are never changed in place. Texts nothing refers to any more are
+    dropped by compact(), which rewrites both files without them; readers
+    in other processes notice the rewrite by the index file being replaced
+    and by a block no longer hashing to its digest, and re-read the index.
+    """
+
+    RECORD = struct.Struct('<32sQI')  # digest, offset in blobs.dat, compressed length
+
+    def __init__(self, storage_dir: str = None, cache_size: int = 256, compression_level: int = 6):
+        self.storage_dir = storage_dir or os.path.join(os.path.dirname(__file__), '..', 'database', 'text_store')
+        self.data_path = os.path.join(self.storage_dir, 'blobs.dat')
+        self.index_path = os.path.join(self.storage_dir, 'blobs.idx')
+        self.cache_size = cache_size  # Decompressed blobs kept for repeated span reads
+        self.compression_level = compression_level
+        self._index: Dict[bytes, Tuple[int, int]] = {}
+        self._index_bytes = 0  # How much of blobs.idx has been read
+        self._index_inode = None  # Identity of the blobs.idx read, which compact() replaces
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.storage_dir, exist_ok=True)
+        self._refresh_index()
+
+    def put(self, text: str) -> str:
+        """
+        Store text if it is not stored yet and return its blob id
+        """
+        return self.put_many([text])[0]
+
+    def put_many(self, texts: List[str]) -> List[str]:
+        """
+        Store several texts with one lock acquisition and return their blob ids
+        """
+        encoded = [text.encode('utf-8') for text in texts]
+        digests = [hashlib.sha256(data).digest() for data in encoded]
+
+        with self._lock:
+            self._refresh_index()  # Notices a compaction that dropped some of them
+            if all(digest in self._index for digest in digests):
+                return [digest.hex() for digest in digests]
+
+            with self._locked_index() as index_file:
+                self._refresh_index()  # Another process may have stored some of them
+
+                blocks, records = [], []
+                with open(self.data_path, 'ab') as data_file:
+                    offset = data_file.seek(0, os.SEEK_END)
+                    for digest, data in zip(digests, encoded):
+                        if digest in self._index:
+                            continue
+                        block = zlib.compress(data, self.compression_level)
+                        self._index[digest] = (offset, len(block))
+                        records.append(self.RECORD.pack(digest, offset, len(block)))
+                        blocks.append(block)
+                        offset += len(block)
+                    # Blocks are written before the index records that point at them
+                    data_file.write(b''.join(blocks))
+
+                index_file.write(b''.join(records))
+                index_file.flush()
+                self._index_bytes += len(records) * self.RECORD.size
+
+        return [digest.hex() for digest in digests]
+
+    def put_chunks(self, chunk_texts: List[str], source_text: str = None) -> List[TextRef]:
+        """
+        Store chunks as spans of source_text where they occur in it, otherwise as blobs of their own
+        """
+        refs: List[TextRef] = [None] * len(chunk_texts)
+        if source_text:
+            position = 0
+            for i, chunk in enumerate(chunk_texts):
+                # Chunks usually appear in order, so search onwards from the previous one first
+                start = source_text.find(chunk, position)
+                if start < 0:
+                    start = source_text.find(chunk)
+                if start >= 0 and chunk:
+                    refs[i] = (None, start, start + len(chunk))
+                    position = start + 1
+
+            if any(refs):
+                source_id = self.put(source_text)  # Only kept when some chunk points into it
+                refs = [(source_id, ref[1], ref[2]) if ref else None for ref in refs]
+
+        missing = [i for i, ref in enumerate(refs) if ref is None]
+        for i, blob_id in zip(missing, self.put_many([chunk_texts[i] for i in missing])):
+            refs[i] = (blob_id, 0, len(chunk_texts[i]))
+        return refs
+
+    def get(self, ref: TextRef) -> str:
+        """
+        Get the text of a (blob id, start, end) span
+        """
+        blob_id, start, end = ref
+        return self._get_blob(blob_id)[start:end]
+
+    def text_of(self, text: str, metadata: Dict[str, Any]) -> str:
+        """
+        The text of a vector entry or search hit, reading it from the store when it was moved here
+        """
+        ref = (metadata or {}).get(TEXT_REF_KEY)
+        if text or not ref:
+            return text
+        try:
+            return self.get(ref)
+        except (KeyError, OSError, zlib.error) as e:
+            logger.error(f"Error reading text {ref}: {str(e)}")
+            return ''
+
+    def resolve(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Fill in the text of search hits whose text lives in the store
+        """
+        for doc in docs:
+            doc['text'] = self.text_of(doc.get('text'), doc.get('metadata'))
+        return docs
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get store statistics
+        """
+        with self._lock:
+            self._refresh_index()
+            return {
+                'blobs': len(self._index),
+                'stored_bytes': os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0,
+                'storage_path': self.storage_dir
+            }
+
+    def copy_to(self, directory: str) -> int:
+        """
+        Copy the store's files into directory and return the number of blobs copied.
+
+        The index is copied before the data, so every copied record points at
+        a block the copied data file contains even while other processes append.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            if not os.path.exists(self.index_path):
+                return 0
+            with self._locked_index():  # Not while another process compacts the files
+                self._refresh_index()
+                shutil.copyfile(self.index_path, os.path.join(directory, 'blobs.idx'))
+                shutil.copyfile(self.data_path, os.path.join(directory, 'blobs.dat'))
+                return len(self._index)
+
+    def import_blocks(self, directory: str, batch_size: int = 10000) -> int:
+        """
+        Append the blobs of another store's files that this store lacks and return how many.
+
+        Blocks are copied still compressed; only their offsets change.
+        """
+        index_path = os.path.join(directory, 'blobs.idx')
+        if not os.path.exists(index_path):
+            return 0
+        with open(index_path, 'rb') as index_file:
+            data = index_file.read()
+        records = list(self.RECORD.iter_unpack(data[:len(data) - len(data) % self.RECORD.size]))
+
+        imported = 0
+        with self._lock, open(os.path.join(directory, 'blobs.dat'), 'rb') as source:
+            with self._locked_index() as index_file:
+                self._refresh_index()
+                with open(self.data_path, 'ab') as data_file:
+                    offset = data_file.seek(0, os.SEEK_END)
+                    for batch_start in range(0, len(records), batch_size):
+                        blocks, new_records = [], []
+                        for digest, source_offset, length in records[batch_start:batch_start + batch_size]:
+                            if digest in self._index:
+                                continue
+                            source.seek(source_offset)
+                            blocks.append(source.read(length))
+                            self._index[digest] = (offset, length)
+                            new_records.append(self.RECORD.pack(digest, offset, length))
+                            offset += length
+                        data_file.write(b''.join(blocks))
+                        data_file.flush()
+                        index_file.write(b''.join(new_records))
+                        index_file.flush()
+                        self._index_bytes += len(new_records) * self.RECORD.size
+                        imported += len(new_records)
+        return imported
+
+    def blob_ids(self) -> Set[str]:
+        """
+        Ids of every stored blob
+        """
+        with self._lock:
+            self._refresh_index()
+            return {digest.hex() for digest in self._index}
+
+    def blob_sizes(self, blob_ids: Iterable[str]) -> int:
+        """
+        Compressed bytes the given blobs take up in blobs.dat
+        """
+        with self._lock:
+            return sum(self._index.get(bytes.fromhex(blob_id), (0, 0))[1] for blob_id in blob_ids)
+
+    def compact(self, blob_ids: Iterable[str]) -> Dict[str, int]:
+        """
+        Rewrite the store without the given blobs and return how many were removed and the bytes freed.
+
+        The caller decides which blobs nothing refers to; a span still pointing
+        into a removed blob reads as missing afterwards. Blobs stored while the
+        files are rewritten wait for the lock and are appended to the new files.
+        """
+        removed = {bytes.fromhex(blob_id) for blob_id in blob_ids}
+        with self._lock:
+            if not os.path.exists(self.index_path):
+                return {'blobs_removed': 0, 'reclaimed_bytes': 0}
+            with self._locked_index():
+                self._refresh_index()
+                removed &= self._index.keys()
+                if not removed:
+                    return {'blobs_removed': 0, 'reclaimed_bytes': 0}
+
+                kept = sorted((location, digest) for digest, location in self._index.items() if digest not in removed)
+                old_size = os.path.getsize(self.data_path)
+                temporary_data, temporary_index = f"{self.data_path}.tmp", f"{self.index_path}.tmp"
+                index, offset = {}, 0
+                with open(self.data_path, 'rb') as source, open(temporary_data, 'wb') as data_file, \
+                        open(temporary_index, 'wb') as index_file:
+                    for (source_offset, length), digest in kept:
+                        source.seek(source_offset)
+                        data_file.write(source.read(length))
+                        index_file.write(self.RECORD.pack(digest, offset, length))
+                        index[digest] = (offset, length)
+                        offset += length
+
+                # Data first: a reader pairing the old index with the new data sees blocks
+                # that do not hash to their digest and waits on the lock for the new index
+                os.replace(temporary_data, self.data_path)
+                os.replace(temporary_index, self.index_path)
+                self._index = index
+                self._index_bytes = len(index) * self.RECORD.size
+                self._index_inode = os.stat(self.index_path).st_ino
+                for digest in removed:
+                    self._cache.pop(digest.hex(), None)
+
+        logger.info(f"Compacted text store: removed {len(removed)} blobs, freed {old_size - offset} bytes")
+        return {'blobs_removed': len(removed), 'reclaimed_bytes': old_size - offset}
+
+    def _get_blob(self, blob_id: str) -> str:
+        with self._lock:
+            text = self._cache.get(blob_id)
+            if text is not None:
+                self._cache.move_to_end(blob_id)
+                return text
+
+            digest = bytes.fromhex(blob_id)
+            if digest not in self._index:
+                self._refresh_index()  # Written by another process since we last looked
+            location = self._index[digest]
+
+        text = self._read_block(digest, location)
+        if text is None:
+            # Another process compacted the files since the index was read; wait for it and read again
+            with self._lock, self._locked_index():
+                self._refresh_index()
+                text = self._read_block(digest, self._index[digest])
+            if text is None:
+                raise KeyError(blob_id)
+
+        with self._lock:
+            self._cache[blob_id] = text
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return text
+
+    def _read_block(self, digest: bytes, location: Tuple[int, int]) -> str:
+        """
+        Read and decompress one block; None when the block there is not the blob, e.g. after a compaction
+        """
+        offset, length = location
+        with open(self.data_path, 'rb') as data_file:
+            data_file.seek(offset)
+            block = data_file.read(length)
+        try:
+            data = zlib.decompress(block)
+        except zlib.error:
+            return None
+        return data.decode('utf-8') if hashlib.sha256(data).digest() == digest else None
+
+    @contextmanager
+    def _locked_index(self) -> Iterator[Any]:
+        """
+        Open blobs.idx for appending with the cross-process lock held, reopening it when
+        a compaction replaced the file while we waited for the lock
+        """
+        while True:
+            index_file = open(self.index_path, 'ab')
+            fcntl.flock(index_file, fcntl.LOCK_EX)
+            if os.fstat(index_file.fileno()).st_ino == os.stat(self.index_path).st_ino:
+                break
+            index_file.close()
+        try:
+            yield index_file
+        finally:
+            index_file.close()
+
+    def _refresh_index(self):
+        """
+        Read index records appended since the last call; caller holds self._lock or is the constructor
+        """
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._index_inode or stat.st_size < self._index_bytes:
+            # Replaced by a compaction, which moved every block; read it from the start
+            self._index, self._index_bytes, self._index_inode = {}, 0, stat.st_ino
+        with open(self.index_path, 'rb') as index_file:
+            index_file.seek(self._index_bytes)
+            data = index_file.read()
+        usable = len(data) - len(data) % self.RECORD.size  # Skip a record still being written
+        for digest, offset, length in self.RECORD.iter_unpack(data[:usable]):
+            self._index[digest] = (offset, length)
+        self._index_bytes += usable
+
+
+def externalize_entries(text_store: TextStore, entries: Iterable[Tuple[str, List[float], Dict[str, Any]]],
+                        source_text: str = None) -> List[Tuple[str, List[float], Dict[str, Any]]]:
+    """
+    Move the texts of (text, embedding, metadata) entries into the text store.
+
+    Returns entries with an empty text and the span in metadata[TEXT_REF_KEY],
+    ready for a vector store that should hold only ids, vectors and metadata.
+    """
+    entries = list(entries)
+    refs = text_store.put_chunks([text for text, _, _ in entries], source_text)
+    return [('', embedding, {**(metadata or {}), TEXT_REF_KEY: list(ref)})
+            for (_, embedding, metadata), ref in zip(entries, refs)]
+
+def strip_text_ref(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Metadata without the text store span, e.g. for writing to SQL
+    """
+    return {key: value for key, value in (metadata or {}).items() if key != TEXT_REF_KEY}
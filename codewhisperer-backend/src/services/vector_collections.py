@@ -0,0 +1,71 @@
+from typing import List, Dict, Any, Tuple, Iterable
+
+# Metadata keys naming the collection of a vector entry
+MODEL_KEY = 'embedding_model'
+TENANT_KEY = 'tenant'
+
+DEFAULT_TENANT = 'default'
+UNKNOWN_MODEL = 'unknown'  # Entries stored before collections existed
+
+# (tenant, embedding model, dimension); vectors are only compared within one collection
+Collection = Tuple[str, str, int]
+
+def collection_of(embedding: List[float], metadata: Dict[str, Any]) -> Collection:
+    """
+    The collection a stored entry belongs to
+    """
+    metadata = metadata or {}
+    return (metadata.get(TENANT_KEY) or DEFAULT_TENANT, metadata.get(MODEL_KEY) or UNKNOWN_MODEL, len(embedding))
+
+def collection_name(collection: Collection) -> str:
+    tenant, model, dimension = collection
+    return f"{tenant}/{model}/{dimension}"
+
+def check_dimension(collection: Collection, dimension: int):
+    """
+    Reject query embeddings that cannot be compared with the collection's vectors
+    """
+    if collection is not None and collection[2] != dimension:
+        raise ValueError(f"Query embeddings have {dimension} dimensions but collection "
+                         f"{collection_name(collection)} has {collection[2]}")
+
+def matches(collection: Collection, candidate: Collection) -> bool:
+    """
+    Whether entries of candidate are searched for collection.
+
+    None matches every collection of the same dimension. Entries of unknown
+    model are searched by every model of their tenant and dimension, so
+    vectors stored before collections existed stay reachable.
+    """
+    if collection is None:
+        return True
+    tenant, model, dimension = collection
+    return candidate[0] == tenant and candidate[2] == dimension and candidate[1] in (model, UNKNOWN_MODEL)
+
+def matching_collections(collection: Collection, dimension: int,
+                         available: Iterable[Collection]) -> List[Collection]:
+    """
+    The available collections a query of the given dimension reads
+    """
+    check_dimension(collection, dimension)
+    return [candidate for candidate in available if candidate[2] == dimension and matches(collection, candidate)]
+
+def merge_hits(results: List[List[List[Dict[str, Any]]]], query_count: int, top_k: int) -> List[List[Dict[str, Any]]]:
+    """
+    Merge per-collection search results into the top_k hits of each query
+    """
+    if len(results) == 1:
+        return results[0]
+    merged = []
+    for query in range(query_count):
+        hits = [hit for collection_hits in results for hit in collection_hits[query]]
+        merged.append(sorted(hits, key=lambda hit: hit['similarity'], reverse=True)[:top_k])
+    return merged
+
+def assign_tenant(chunks: List[Tuple[str, Dict[str, Any]]], tenant: str):
+    """
+    Put (text, metadata) chunks in a tenant's collections; without a tenant they stay in the default one
+    """
+    if tenant:
+        for _, metadata in chunks:
+            metadata[TENANT_KEY] = tenant
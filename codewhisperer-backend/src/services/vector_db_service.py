@@ -1,10 +1,19 @@
 import numpy as np
 import pickle
 import os
-from typing import List, Dict, Any, Tuple
+import sys
+from typing import List, Dict, Any, Tuple, Iterator, Iterable
 import logging
 from dataclasses import dataclass
 import uuid
+import time
+import threading
+from src.services.metrics_service import metrics
+from src.services.vector_collections import Collection, collection_of, collection_name, matching_collections, merge_hits
+from src.services.vector_replication import (
+    OP_UPSERT, OP_DELETE, OP_CLEAR, OP_RELOAD, LogCursor, ReadOnlyReplicaError, ReplicationLog, VectorLogFollower,
+    decode_upsert, encode_upsert, log_dir_for, read_checkpoint
+)
 
 logger = logging.getLogger(__name__)
 
@@ -15,16 +24,71 @@ class VectorEntry:
     metadata: Dict[str, Any]
     text: str
 
+def top_k_rows(queries: np.ndarray, matrix: np.ndarray, k: int,
+               block_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Yield (columns, similarities) of the k best matrix rows for each normalized query, best first
+    """
+    for block_start in range(0, len(queries), block_size):
+        scores = queries[block_start:block_start + block_size] @ matrix.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for row, row_top in enumerate(top):
+            ordered = row_top[np.argsort(-scores[row, row_top])]
+            yield ordered, scores[row, ordered]
+
+def create_vector_store(storage_path: str = None, autoload: bool = True, shared: bool = True,
+                        replicated: bool = False):
+    """
+    Create the configured vector store: sharded across processes when VECTOR_SHARDS is above 1,
+    attached to a shared-memory matrix when VECTOR_SHARED_MEMORY is set and shared is true
+    (the shared store keeps the single-store file format), otherwise in-process.
+    A replicated store (the one serving queries) is a log-writing primary or a
+    log-following replica when VECTOR_ROLE says so; replication uses the in-process store.
+    """
+    shard_count = int(os.getenv('VECTOR_SHARDS', '1'))
+    role = os.getenv('VECTOR_ROLE', '').lower() if replicated else ''
+    if role:
+        if role not in ('primary', 'replica'):
+            raise ValueError(f"VECTOR_ROLE must be primary or replica, not {role}")
+        if shard_count > 1:
+            raise ValueError("Vector replication needs the in-process store; unset VECTOR_SHARDS")
+        return VectorDatabaseService(storage_path=storage_path, autoload=autoload, replication=role)
+    if shard_count > 1:
+        from src.services.sharded_vector_db_service import ShardedVectorDatabaseService
+        return ShardedVectorDatabaseService(shard_count, storage_dir=storage_path, autoload=autoload)
+    if shared and os.getenv('VECTOR_SHARED_MEMORY', 'false').lower() == 'true':
+        from src.services.shared_vector_store_service import SharedVectorDatabaseService
+        return SharedVectorDatabaseService(storage_path=storage_path, autoload=autoload)
+    return VectorDatabaseService(storage_path=storage_path, autoload=autoload)
+
 class VectorDatabaseService:
-    def __init__(self, storage_path: str = None):
+    def __init__(self, storage_path: str = None, autoload: bool = True, replication: str = None):
         self.storage_path = storage_path or os.path.join(os.path.dirname(__file__), '..', 'database', 'vectors.pkl')
         self.vectors: Dict[str, VectorEntry] = {}
-        self.load_vectors()
+        # Entry ids per collection (tenant, embedding model, dimension), kept in step with self.vectors
+        self._collections: Dict[Collection, Dict[str, None]] = {}
+        # Normalized float32 matrices per collection, rebuilt lazily after writes to that collection
+        self._matrix_cache: Dict[Collection, Tuple[List[str], np.ndarray, np.ndarray]] = {}
+        # Bumped by every invalidation, so a matrix built from entries a write has since changed is not cached
+        self._matrix_generations: Dict[Collection, int] = {}
+        self._matrix_epoch = 0  # Bumped when every collection is invalidated at once
+        # Guards vectors, collection membership and the matrix cache: a replica's follower thread
+        # writes while request threads search, and writers race matrix builds on any store
+        self._lock = threading.RLock()
+        self.query_block_size = 256  # Queries scored per matrix product in batch search
+        # A primary logs every mutation to <storage>.wal; a replica loads the primary's file and follows that log
+        self.replication = replication
+        self.replication_log = ReplicationLog(log_dir_for(self.storage_path)) if replication == 'primary' else None
+        self.follower = VectorLogFollower(self, log_dir_for(self.storage_path)) if replication == 'replica' else None
+        self.logged_sequence = 0  # Log sequence of this store's last mutation
+        if autoload:  # Callers that load in the background call load_vectors() themselves
+            self.load_vectors()
     
     def add_vector(self, text: str, embedding: List[float], metadata: Dict[str, Any] = None) -> str:
         """
         Add a vector to the database
         """
+        self._check_writable()
         try:
             vector_id = str(uuid.uuid4())
             entry = VectorEntry(
@@ -34,7 +98,10 @@ class VectorDatabaseService:
                 text=text
             )
             
-            self.vectors[vector_id] = entry
+            with self._lock:
+                self.vectors[vector_id] = entry
+                self._invalidate_matrix([self._track(entry)])
+                self._log(OP_UPSERT, *encode_upsert([vector_id], [(text, embedding, metadata)]))
             self.save_vectors()
             
             logger.info(f"Added vector {vector_id} to database")
@@ -44,26 +111,21 @@ class VectorDatabaseService:
             logger.error(f"Error adding vector: {str(e)}")
             raise
     
-    def add_vectors_batch(self, entries: List[Tuple[str, List[float], Dict[str, Any]]]) -> List[str]:
+    def add_vectors_batch(self, entries: List[Tuple[str, List[float], Dict[str, Any]]],
+                          persist: bool = True, vector_ids: List[str] = None) -> List[str]:
         """
-        Add multiple vectors in batch
+        Add multiple vectors in batch; pass persist=False to defer save_vectors() for bulk loads.
+        Existing ids can be passed in vector_ids when restoring entries from another store.
         """
+        self._check_writable()
         try:
-            vector_ids = []
-            
-            for text, embedding, metadata in entries:
-                vector_id = str(uuid.uuid4())
-                entry = VectorEntry(
-                    id=vector_id,
-                    embedding=embedding,
-                    metadata=metadata or {},
-                    text=text
-                )
-                
-                self.vectors[vector_id] = entry
-                vector_ids.append(vector_id)
-            
-            self.save_vectors()
+            entries = list(entries)
+            vector_ids = list(vector_ids) if vector_ids else [str(uuid.uuid4()) for _ in entries]
+            with self._lock:
+                self._invalidate_matrix(self._put_entries(vector_ids, entries))
+                self._log(OP_UPSERT, *encode_upsert(vector_ids, entries))
+            if persist:
+                self.save_vectors()
             logger.info(f"Added {len(vector_ids)} vectors to database")
             return vector_ids
             
@@ -72,7 +134,7 @@ class VectorDatabaseService:
             raise
     
     def search_similar(self, query_embedding: List[float], top_k: int = 5, 
-                      source_type_filter: str = None) -> List[Dict[str, Any]]:
+                      source_type_filter: str = None, collection: Collection = None) -> List[Dict[str, Any]]:
         """
         Search for similar vectors
         """
@@ -80,46 +142,109 @@ class VectorDatabaseService:
             if not self.vectors:
                 return []
             
-            similarities = []
-            query_vec = np.array(query_embedding)
-            
-            for vector_id, entry in self.vectors.items():
-                # Apply source type filter if specified
-                if source_type_filter and entry.metadata.get('source_type') != source_type_filter:
-                    continue
-                
-                # Calculate cosine similarity
-                entry_vec = np.array(entry.embedding)
-                similarity = self._cosine_similarity(query_vec, entry_vec)
-                
-                similarities.append({
-                    'id': vector_id,
-                    'similarity': similarity,
-                    'text': entry.text,
-                    'metadata': entry.metadata
-                })
-            
-            # Sort by similarity and return top_k
-            similarities.sort(key=lambda x: x['similarity'], reverse=True)
-            return similarities[:top_k]
+            return self.search_similar_batch([query_embedding], top_k, source_type_filter, collection)[0]
             
+        except ValueError:
+            raise  # Query and collection dimensions differ; a caller error, not an empty result
         except Exception as e:
             logger.error(f"Error searching similar vectors: {str(e)}")
             return []
     
+    def search_similar_batch(self, query_embeddings: List[List[float]], top_k: int = 5,
+                             source_type_filter: str = None,
+                             collection: Collection = None) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several queries at once with a single matrix-matrix product per block.
+
+        Only the matrices of collections matching collection are scored; without
+        one, every collection of the query dimension is. Raises ValueError when
+        the queries do not have the collection's dimension.
+        """
+        if not query_embeddings:
+            return []
+        
+        queries = self._normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+        with self._lock:
+            available = list(self._collections)
+        searched = matching_collections(collection, queries.shape[1], available)
+        return merge_hits([self._search_collection(searched_collection, queries, top_k, source_type_filter)
+                           for searched_collection in searched], len(query_embeddings), top_k)
+    
+    def _search_collection(self, collection: Collection, queries: np.ndarray, top_k: int,
+                           source_type_filter: str = None) -> List[List[Dict[str, Any]]]:
+        """
+        Search the matrix of one collection with normalized queries
+        """
+        ids, matrix, source_types = self._get_matrix(collection)
+        
+        candidates = np.arange(len(ids))
+        if source_type_filter:
+            candidates = np.nonzero(source_types == source_type_filter)[0]
+            matrix = matrix[candidates]
+        
+        k = min(top_k, len(candidates))
+        if k == 0:
+            return [[] for _ in queries]
+        
+        results = []
+        for columns, similarities in top_k_rows(queries, matrix, k, self.query_block_size):
+            hits = []
+            for column, similarity in zip(columns, similarities):
+                entry = self.vectors.get(ids[candidates[column]])
+                if entry is None:
+                    continue  # Deleted since the matrix was built, e.g. by a replica applying its log
+                hits.append({
+                    'id': entry.id,
+                    'similarity': float(similarity),
+                    'text': entry.text,
+                    'metadata': entry.metadata
+                })
+            results.append(hits)
+        
+        return results
+    
+    def warm_up(self) -> int:
+        """
+        Build the search matrix of every collection ahead of the first query; returns how many
+        """
+        with self._lock:
+            collections = [collection for collection, ids in self._collections.items() if ids]
+        for collection in collections:
+            self._get_matrix(collection)
+        return len(collections)
+    
     def get_vector(self, vector_id: str) -> VectorEntry:
         """
         Get a specific vector by ID
         """
         return self.vectors.get(vector_id)
     
+    def get_vector_ids(self) -> List[str]:
+        """
+        Get the ids of all stored vectors
+        """
+        with self._lock:
+            return list(self.vectors.keys())
+    
+    def iter_entries(self) -> Iterator[VectorEntry]:
+        """
+        Iterate over a snapshot of all stored entries
+        """
+        with self._lock:
+            return iter(list(self.vectors.values()))
+    
     def delete_vector(self, vector_id: str) -> bool:
         """
         Delete a vector from the database
         """
+        self._check_writable()
         try:
-            if vector_id in self.vectors:
-                del self.vectors[vector_id]
+            with self._lock:
+                entry = self.vectors.pop(vector_id, None)
+                if entry is not None:
+                    self._invalidate_matrix([self._untrack(entry)])
+                    self._log(OP_DELETE, {'ids': [vector_id]})
+            if entry is not None:
                 self.save_vectors()
                 logger.info(f"Deleted vector {vector_id}")
                 return True
@@ -129,12 +254,56 @@ class VectorDatabaseService:
             logger.error(f"Error deleting vector: {str(e)}")
             return False
     
+    def delete_vectors(self, vector_ids: List[str], persist: bool = True) -> int:
+        """
+        Delete many vectors with a single persist; returns how many existed
+        """
+        self._check_writable()
+        try:
+            deleted = []
+            changed = set()
+            with self._lock:
+                for vector_id in vector_ids:
+                    entry = self.vectors.pop(vector_id, None)
+                    if entry is not None:
+                        changed.add(self._untrack(entry))
+                        deleted.append(vector_id)
+                if deleted:
+                    self._invalidate_matrix(changed)
+                    self._log(OP_DELETE, {'ids': deleted})
+            
+            if deleted and persist:
+                self.save_vectors()
+            logger.info(f"Deleted {len(deleted)} vectors")
+            return len(deleted)
+            
+        except Exception as e:
+            logger.error(f"Error deleting vectors: {str(e)}")
+            raise
+    
+    @staticmethod
+    def estimate_entry_bytes(entry: VectorEntry) -> int:
+        """
+        Approximate memory held by one entry, including its row in the search matrix
+        """
+        size = sys.getsizeof(entry) + sys.getsizeof(entry.embedding) + sys.getsizeof(entry.text)
+        if isinstance(entry.embedding, list):
+            size += sys.getsizeof(0.0) * len(entry.embedding)  # One float object per element
+        size += sys.getsizeof(entry.metadata)
+        size += sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in entry.metadata.items())
+        return size + 4 * len(entry.embedding)  # float32 row in the cached matrix
+    
     def clear_database(self):
         """
         Clear all vectors from the database
         """
+        self._check_writable()
         try:
-            self.vectors.clear()
+            with self._lock:
+                self.vectors = {}
+                self._collections = {}
+                self._invalidate_matrix()
+                self._log(OP_CLEAR, {})
             self.save_vectors()
             logger.info("Cleared vector database")
             
@@ -148,15 +317,18 @@ class VectorDatabaseService:
         """
         try:
             source_types = {}
-            for entry in self.vectors.values():
-                source_type = entry.metadata.get('source_type', 'unknown')
-                source_types[source_type] = source_types.get(source_type, 0) + 1
-            
-            return {
-                'total_vectors': len(self.vectors),
-                'source_types': source_types,
-                'storage_path': self.storage_path
-            }
+            with self._lock:
+                for entry in self.vectors.values():
+                    source_type = entry.metadata.get('source_type', 'unknown')
+                    source_types[source_type] = source_types.get(source_type, 0) + 1
+                
+                return {
+                    'total_vectors': len(self.vectors),
+                    'source_types': source_types,
+                    'collections': {collection_name(collection): len(ids)
+                                    for collection, ids in sorted(self._collections.items()) if ids},
+                    'storage_path': self.storage_path
+                }
             
         except Exception as e:
             logger.error(f"Error getting stats: {str(e)}")
@@ -164,12 +336,18 @@ class VectorDatabaseService:
     
     def save_vectors(self):
         """
-        Save vectors to disk
+        Save vectors to disk, replacing the file atomically so replicas never read a partial one
         """
+        if self.replication == 'replica':
+            return  # The primary owns the file
         try:
             os.makedirs(os.path.dirname(self.storage_path), exist_ok=True)
-            with open(self.storage_path, 'wb') as f:
+            temporary_path = f"{self.storage_path}.tmp"
+            with open(temporary_path, 'wb') as f:
                 pickle.dump(self.vectors, f)
+            os.replace(temporary_path, self.storage_path)
+            if self.replication_log is not None:
+                self.replication_log.checkpoint(self.logged_sequence)
                 
         except Exception as e:
             logger.error(f"Error saving vectors: {str(e)}")
@@ -177,24 +355,252 @@ class VectorDatabaseService:
     
     def load_vectors(self):
         """
-        Load vectors from disk
+        Load vectors from disk; a primary then replays logged mutations the file predates
         """
+        if self.follower is not None:
+            self.follower.bootstrap()  # Also positions the replica in the primary's log
+            return
         try:
             if os.path.exists(self.storage_path):
                 with open(self.storage_path, 'rb') as f:
-                    self.vectors = pickle.load(f)
+                    vectors = pickle.load(f)
+                self._rebuild_collections(vectors)
                 logger.info(f"Loaded {len(self.vectors)} vectors from storage")
             else:
                 logger.info("No existing vector storage found, starting with empty database")
                 
         except Exception as e:
             logger.error(f"Error loading vectors: {str(e)}")
-            self.vectors = {}
+            self._rebuild_collections({})
+            self._quarantine_storage()
+        
+        if self.replication_log is not None:
+            self._replay_log()
+    
+    def load_from_primary(self):
+        """
+        Replace the entries with the primary's saved file; a replica never writes or moves that file
+        """
+        self._rebuild_collections(self._read_storage())
+        logger.info(f"Loaded {len(self.vectors)} vectors from the primary's storage")
+    
+    def apply_log_records(self, records: list) -> Tuple[List[VectorEntry], List[str], bool]:
+        """
+        Apply mutations read from the log in order and return the entries upserted, the ids
+        deleted, and whether the store was cleared, for indexes kept alongside the store
+        """
+        touched: Dict[str, None] = {}
+        changed = set()
+        reset = False
+        with self._lock:  # Searches on request threads see each batch of records whole or not at all
+            for _, _, operation, payload, vectors in records:
+                if operation == OP_UPSERT:
+                    changed |= self._put_entries(payload['ids'], decode_upsert(payload, vectors))
+                    touched.update(dict.fromkeys(payload['ids']))
+                elif operation == OP_DELETE:
+                    for vector_id in payload['ids']:
+                        entry = self.vectors.pop(vector_id, None)
+                        if entry is not None:
+                            changed.add(self._untrack(entry))
+                    touched.update(dict.fromkeys(payload['ids']))
+                elif operation == OP_CLEAR:
+                    self.vectors = {}
+                    self._collections = {}
+                    changed, touched, reset = None, {}, True
+                elif operation == OP_RELOAD:
+                    # Mutations before it were made to the replaced file; later ones apply to the new one
+                    self._rebuild_collections(self._read_storage())
+                    changed, touched, reset = None, {}, True
+            
+            self._invalidate_matrix(None if reset else changed)
+            upserted = [self.vectors[vector_id] for vector_id in touched if vector_id in self.vectors]
+            deleted = [vector_id for vector_id in touched if vector_id not in self.vectors]
+        return upserted, deleted, reset
+    
+    def get_replication_status(self) -> Dict[str, Any]:
+        """
+        Role of the store and how far it is in the mutation log
+        """
+        if self.follower is not None:
+            return self.follower.get_status()
+        if self.replication_log is not None:
+            return {'role': 'primary', 'log_dir': self.replication_log.directory,
+                    'sequence': self.replication_log.sequence,
+                    'checkpoint_sequence': self.replication_log.read_checkpoint()}
+        return {'role': 'standalone'}
+    
+    def wait_for_sequence(self, sequence: int, timeout: float) -> bool:
+        """
+        Block until a replica has applied the primary's mutation with the given sequence; other stores are current
+        """
+        if self.follower is None:
+            return True
+        return self.follower.wait_for(sequence, timeout)
+    
+    def close(self):
+        """
+        Stop following the primary's log; the in-process store holds nothing else, unlike the sharded store
+        """
+        if self.follower is not None:
+            self.follower.stop()
+    
+    def _read_storage(self) -> Dict[str, VectorEntry]:
+        """
+        Entries of the saved storage file, none if there is no file yet
+        """
+        if not os.path.exists(self.storage_path):
+            return {}
+        with open(self.storage_path, 'rb') as f:
+            return pickle.load(f)
+    
+    def _quarantine_storage(self):
+        """
+        Move an unreadable storage file aside so the next save does not overwrite it
+        """
+        try:
+            quarantined = f"{self.storage_path}.corrupt-{int(time.time())}"
+            os.replace(self.storage_path, quarantined)
+            logger.error(f"Moved unreadable vector storage to {quarantined}; "
+                         f"run 'flask --app src.main rebuild-index' to restore it from SQL")
+        except OSError as e:
+            logger.error(f"Error moving unreadable vector storage aside: {str(e)}")
+    
+    def _put_entries(self, vector_ids: List[str], entries: List[Tuple[str, List[float], Dict[str, Any]]]) -> set:
+        """
+        Store (text, embedding, metadata) entries under vector_ids and return the collections that changed;
+        caller holds self._lock
+        """
+        changed = set()
+        for vector_id, (text, embedding, metadata) in zip(vector_ids, entries):
+            entry = VectorEntry(
+                id=vector_id,
+                embedding=embedding,
+                metadata=metadata or {},
+                text=text
+            )
+            
+            previous = self.vectors.get(vector_id)
+            if previous is not None:
+                changed.add(self._untrack(previous))
+            self.vectors[vector_id] = entry
+            changed.add(self._track(entry))
+        return changed
+    
+    def _check_writable(self):
+        if self.replication == 'replica':
+            raise ReadOnlyReplicaError("This vector store is a read replica; write to the primary")
+    
+    def _log(self, operation: int, payload: Dict[str, Any], vectors: bytes = b''):
+        """
+        Record a mutation in the replication log of a primary
+        """
+        if self.replication_log is not None:
+            self.logged_sequence = self.replication_log.append(operation, payload, vectors)
+    
+    def _replay_log(self):
+        """
+        Apply logged mutations after the last checkpoint, which a crash may have kept out of the saved file
+        """
+        directory = self.replication_log.directory
+        cursor = LogCursor(directory, read_checkpoint(directory))
+        replayed = 0
+        try:
+            while True:
+                records = cursor.read()
+                if not records:
+                    break
+                self.apply_log_records(records)
+                replayed += len(records)
+        except Exception as e:
+            logger.error(f"Error replaying vector log {directory} after sequence {cursor.sequence}: {str(e)}")
+        self.logged_sequence = cursor.sequence
+        if replayed:
+            logger.info(f"Replayed {replayed} logged vector mutations after the last save")
+    
+    def _get_matrix(self, collection: Collection) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Get ids, normalized embedding matrix and source types for one collection
+        """
+        with self._lock:
+            cached = self._matrix_cache.get(collection)
+            generation = self._matrix_generation(collection)
+            if cached is None:
+                # Snapshot the entries; the matrix itself is built without holding up writers
+                entries = [self.vectors[vector_id] for vector_id in self._collections.get(collection, ())]
+        metrics.increment('vector_matrix_cache_total', result='hit' if cached is not None else 'miss')
+        if cached is None:
+            ids = [entry.id for entry in entries]
+            if entries:
+                matrix = self._normalize_rows(np.asarray([entry.embedding for entry in entries], dtype=np.float32))
+            else:
+                matrix = np.zeros((0, collection[2]), dtype=np.float32)
+            source_types = np.array([entry.metadata.get('source_type') for entry in entries], dtype=object)
+            cached = (ids, matrix, source_types)
+            with self._lock:
+                # A write while the matrix was built makes it stale; use it for this search only
+                if self._matrix_generation(collection) == generation:
+                    self._matrix_cache[collection] = cached
+        return cached
+    
+    def _matrix_generation(self, collection: Collection) -> Tuple[int, int]:
+        return self._matrix_epoch, self._matrix_generations.get(collection, 0)
+    
+    def _track(self, entry: VectorEntry) -> Collection:
+        collection = collection_of(entry.embedding, entry.metadata)
+        self._collections.setdefault(collection, {})[entry.id] = None
+        return collection
+    
+    def _untrack(self, entry: VectorEntry) -> Collection:
+        collection = collection_of(entry.embedding, entry.metadata)
+        ids = self._collections.get(collection)
+        if ids is not None:
+            ids.pop(entry.id, None)
+            if not ids:
+                del self._collections[collection]
+        return collection
+    
+    def _rebuild_collections(self, vectors: Dict[str, VectorEntry]):
+        """
+        Replace all entries with vectors and recompute collection membership
+        """
+        with self._lock:
+            self.vectors = vectors
+            self._collections = {}
+            for entry in vectors.values():
+                self._track(entry)
+            self._invalidate_matrix()
+    
+    def _invalidate_matrix(self, collections: Iterable[Collection] = None):
+        """
+        Drop the cached matrices of changed collections, or all of them, and publish the new size
+        """
+        with self._lock:
+            if collections is None:
+                self._matrix_cache = {}
+                self._matrix_epoch += 1
+            else:
+                for collection in collections:
+                    self._matrix_cache.pop(collection, None)
+                    self._matrix_generations[collection] = self._matrix_generations.get(collection, 0) + 1
+        metrics.set_gauge('vector_store_vectors', len(self.vectors))
+    
+    @staticmethod
+    def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+        """
+        Scale rows to unit length, leaving zero rows untouched
+        """
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
     
-    def _cosine_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> float:
+    @staticmethod
+    def _cosine_similarity(vec1: np.ndarray, vec2: np.ndarray) -> float:
         """
-        Calculate cosine similarity between two vectors
+        Calculate cosine similarity between two vectors; vectors of different
+        dimensions come from different collections and raise ValueError
         """
+        if np.shape(vec1) != np.shape(vec2):
+            raise ValueError(f"Cannot compare embeddings of {np.shape(vec1)} and {np.shape(vec2)} dimensions")
         try:
             dot_product = np.dot(vec1, vec2)
             norm1 = np.linalg.norm(vec1)
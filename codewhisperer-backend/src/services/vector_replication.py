@@ -0,0 +1,415 @@
+import os
+import json
+import time
+import zlib
+import fcntl
+import struct
+import logging
+import threading
+import numpy as np
+from typing import List, Dict, Any, Tuple, Callable
+from src.services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+# Mutations recorded in the log
+OP_UPSERT = 1  # {'ids', 'texts', 'metadata', 'dimensions'} plus the float32 embeddings, concatenated
+OP_DELETE = 2  # {'ids'}
+OP_CLEAR = 3   # {}
+OP_RELOAD = 4  # {}; the storage file was replaced wholesale, e.g. by rebuild-index, and is to be read again
+
+# sequence, write time, operation, JSON length, embedding bytes length, CRC-32 of both payloads
+RECORD = struct.Struct('<QdBIII')
+
+LogRecord = Tuple[int, float, int, Dict[str, Any], bytes]
+
+class LogTruncatedError(Exception):
+    """
+    Records a reader had not read yet have been pruned; it has to reload the store
+    """
+
+
+class ReadOnlyReplicaError(RuntimeError):
+    """
+    A write was attempted on a replica, which only changes by following its primary's log
+    """
+
+
+def log_dir_for(storage_path: str) -> str:
+    """
+    Where a vector storage's mutation log lives: VECTOR_LOG_DIR, else <storage path>.wal next to it
+    """
+    return os.getenv('VECTOR_LOG_DIR') or f"{os.path.normpath(storage_path)}.wal"
+
+def encode_upsert(vector_ids: List[str], entries: List[Tuple[str, List[float], Dict[str, Any]]]) -> Tuple[Dict[str, Any], bytes]:
+    """
+    Payload of an OP_UPSERT record for (text, embedding, metadata) entries stored under vector_ids
+    """
+    embeddings = [np.asarray(embedding, dtype=np.float32) for _, embedding, _ in entries]
+    return {
+        'ids': vector_ids,
+        'texts': [text for text, _, _ in entries],
+        'metadata': [metadata or {} for _, _, metadata in entries],
+        'dimensions': [len(embedding) for embedding in embeddings]
+    }, b''.join(embedding.tobytes() for embedding in embeddings)
+
+def decode_upsert(payload: Dict[str, Any], vectors: bytes) -> List[Tuple[str, List[float], Dict[str, Any]]]:
+    """
+    (text, embedding, metadata) entries of an OP_UPSERT record, in the order of payload['ids']
+    """
+    flat = np.frombuffer(vectors, dtype=np.float32)
+    ends = np.cumsum(payload['dimensions'])
+    starts = ends - np.asarray(payload['dimensions'])
+    return [(text, flat[start:end].tolist(), metadata)
+            for text, metadata, start, end in zip(payload['texts'], payload['metadata'], starts, ends)]
+
+
+class LogCursor:
+    """
+    Reads the records of a log directory in sequence order, starting after a given sequence.
+
+    The log is a series of segment files named after the sequence of their
+    first record. A record is only returned once it is complete, so a
+    reader never sees a half-written append.
+    """
+
+    def __init__(self, directory: str, sequence: int = 0, contiguous: bool = True):
+        self.directory = directory
+        self.sequence = sequence  # Last sequence returned
+        self.contiguous = contiguous  # Raise LogTruncatedError instead of skipping records pruned before they were read
+        self._segment = None  # First sequence of the segment being read
+        self._offset = 0
+
+    def read(self, max_records: int = 10000) -> List[LogRecord]:
+        records: List[LogRecord] = []
+        while len(records) < max_records:
+            if self._segment is None:
+                self._segment = self._segment_holding(self.sequence + 1)
+                self._offset = 0
+                if self._segment is None:
+                    break
+            # A writer only starts the next segment after its last append to this one
+            next_segment = self._segment_after(self._segment)
+            new = self._read_segment(max_records - len(records))
+            records.extend(new)
+            if new or next_segment is None:
+                break
+            self._segment, self._offset = next_segment, 0
+        return records
+
+    def segments(self) -> List[int]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-4]) for name in names if name.endswith('.log') and name[:-4].isdigit())
+
+    def segment_path(self, first_sequence: int) -> str:
+        return os.path.join(self.directory, f"{first_sequence:020d}.log")
+
+    def _segment_holding(self, sequence: int) -> int:
+        candidates = [first for first in self.segments() if first <= sequence]
+        if candidates:
+            return candidates[-1]
+        segments = self.segments()
+        return segments[0] if segments else None
+
+    def _segment_after(self, first_sequence: int) -> int:
+        later = [first for first in self.segments() if first > first_sequence]
+        return later[0] if later else None
+
+    def _read_segment(self, max_records: int) -> List[LogRecord]:
+        try:
+            with open(self.segment_path(self._segment), 'rb') as segment:
+                segment.seek(self._offset)
+                data = segment.read()
+        except FileNotFoundError:
+            raise LogTruncatedError(f"Log segment {self._segment} was pruned")
+
+        records, position = [], 0
+        while len(records) < max_records and position + RECORD.size <= len(data):
+            sequence, written_at, operation, json_length, vector_length, checksum = \
+                RECORD.unpack_from(data, position)
+            end = position + RECORD.size + json_length + vector_length
+            if end > len(data):
+                break  # Still being written
+            body = data[position + RECORD.size:end]
+            if zlib.crc32(body) != checksum:
+                if records:
+                    break  # Return the records before it; the next read raises
+                raise ValueError(f"Corrupt record {sequence} in log segment {self._segment}")
+            position = end
+            if self.contiguous and sequence > self.sequence + 1:
+                raise LogTruncatedError(f"Log records {self.sequence + 1} to {sequence - 1} were pruned")
+            if sequence > self.sequence:  # Records up to a checkpoint are already in the loaded store
+                records.append((sequence, written_at, operation, json.loads(body[:json_length]), body[json_length:]))
+                self.sequence = sequence
+        self._offset += position
+        return records
+
+
+class ReplicationLog:
+    """
+    Append side of the mutation log of a primary vector store.
+
+    Appends are serialized across processes with a lock file, and each gets
+    the next sequence number. A record a crashed writer left half-written at
+    the end of the log is cut off before the next append, so readers, which
+    wait for it to complete, move on to the record written in its place.
+    After the store saves, checkpoint() records
+    which sequence the saved file contains, starts a new segment once the
+    current one is large and prunes segments wholly before the checkpoint,
+    keeping the most recent ones for replicas that are behind.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = None, retained_segments: int = 2):
+        self.directory = directory
+        self.segment_bytes = segment_bytes or int(os.getenv('VECTOR_LOG_SEGMENT_BYTES', str(64 * 1024 * 1024)))
+        self.retained_segments = retained_segments
+        self.checkpoint_path = os.path.join(directory, 'checkpoint.json')
+        os.makedirs(directory, exist_ok=True)
+        self._tail = LogCursor(directory, contiguous=False)  # Only needs the last sequence
+        self._rotate = False
+        self._lock = threading.Lock()
+        with self._locked():
+            self._catch_up()
+
+    @property
+    def sequence(self) -> int:
+        """
+        Sequence of the last record appended
+        """
+        return self._tail.sequence
+
+    def append(self, operation: int, payload: Dict[str, Any], vectors: bytes = b'') -> int:
+        """
+        Append one mutation and return its sequence
+        """
+        with self._lock, self._locked():
+            return self._append(operation, payload, vectors)
+
+    def record_reload(self) -> int:
+        """
+        Record that the storage file was replaced and checkpoint at that record, so followers
+        reload the file and a restarting primary replays nothing written before it
+        """
+        with self._lock, self._locked():
+            sequence = self._append(OP_RELOAD, {})
+            self._checkpoint(sequence)
+            return sequence
+
+    def checkpoint(self, sequence: int):
+        """
+        Record that the store's saved file contains every mutation up to sequence
+        """
+        with self._lock, self._locked():
+            self._checkpoint(sequence)
+
+    def read_checkpoint(self) -> int:
+        return read_checkpoint(self.directory)
+
+    def _append(self, operation: int, payload: Dict[str, Any], vectors: bytes = b'') -> int:
+        body = json.dumps(payload).encode('utf-8')
+        self._catch_up()  # Another process may have appended since
+        sequence = self._tail.sequence + 1
+        segments = self._tail.segments()
+        if self._rotate or not segments:
+            segment = sequence
+            self._rotate = False
+        else:
+            segment = segments[-1]
+        record = RECORD.pack(sequence, time.time(), operation, len(body), len(vectors),
+                             zlib.crc32(body + vectors)) + body + vectors
+        with open(self._tail.segment_path(segment), 'ab') as f:
+            f.write(record)
+        self._catch_up()
+        return sequence
+
+    def _checkpoint(self, sequence: int):
+        temporary_path = f"{self.checkpoint_path}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump({'sequence': sequence, 'saved_at': time.time()}, f)
+        os.replace(temporary_path, self.checkpoint_path)
+
+        segments = self._tail.segments()
+        if segments and os.path.getsize(self._tail.segment_path(segments[-1])) >= self.segment_bytes:
+            self._rotate = True
+        for i in range(len(segments) - max(self.retained_segments, 1)):
+            if segments[i + 1] - 1 > sequence:
+                break  # Holds records the saved file may lack
+            os.remove(self._tail.segment_path(segments[i]))
+
+    def _catch_up(self):
+        """
+        Read to the end of the log, cutting off a torn record at its end; caller holds the locks
+        """
+        try:
+            while self._tail.read():
+                pass
+        except ValueError:
+            if self._tail._segment != self._tail.segments()[-1]:
+                raise  # Corrupt in the middle of the log, not torn by a crashed append
+        self._truncate_torn_tail()
+
+    def _truncate_torn_tail(self):
+        """
+        Truncate the last segment after its last complete record with a valid checksum; any bytes
+        after that were left by a writer that died mid-append, since appends hold the lock
+        """
+        segments = self._tail.segments()
+        if not segments:
+            return
+        path = self._tail.segment_path(segments[-1])
+        start = self._tail._offset if self._tail._segment == segments[-1] else 0
+        with open(path, 'rb') as segment:
+            segment.seek(start)
+            data = segment.read()
+
+        position = 0
+        while position + RECORD.size <= len(data):
+            json_length, vector_length, checksum = RECORD.unpack_from(data, position)[3:]
+            end = position + RECORD.size + json_length + vector_length
+            if end > len(data) or zlib.crc32(data[position + RECORD.size:end]) != checksum:
+                break
+            position = end
+        if position < len(data):
+            os.truncate(path, start + position)
+            logger.warning(f"Cut off {len(data) - position} bytes of a partly written record "
+                           f"at the end of log segment {segments[-1]}")
+
+    def _locked(self):
+        return _FileLock(os.path.join(self.directory, 'append.lock'))
+
+
+def read_checkpoint(directory: str) -> int:
+    """
+    Sequence the primary's saved store file contains, 0 before its first checkpoint
+    """
+    try:
+        with open(os.path.join(directory, 'checkpoint.json')) as f:
+            return json.load(f)['sequence']
+    except FileNotFoundError:
+        return 0
+
+
+class _FileLock:
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+
+class VectorLogFollower:
+    """
+    Keeps a replica vector store up to date with its primary's mutation log.
+
+    bootstrap() reads the primary's checkpoint and then loads its saved
+    store file, which is at least as new; a daemon thread then applies the
+    records after the checkpoint every poll_interval seconds. Replaying
+    records the file already contains is harmless, because every operation
+    sets entries to the value the log ends with. on_change is called with
+    (upserted entries, deleted ids, reset) after each applied batch; reset
+    means the whole store changed, e.g. it was cleared or reloaded.
+    """
+
+    def __init__(self, store, directory: str, poll_interval: float = None):
+        self.store = store
+        self.directory = directory
+        self.poll_interval = poll_interval if poll_interval is not None else \
+            float(os.getenv('VECTOR_REPLICA_POLL_SECONDS', '0.2'))
+        self.on_change: Callable = None
+        self.cursor = LogCursor(directory)
+        self.caught_up_at = None  # When the replica last read to the end of the log
+        self.last_written_at = None  # Write time of the last record applied
+        self._applied = threading.Condition()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def applied_sequence(self) -> int:
+        return self.cursor.sequence
+
+    def bootstrap(self):
+        """
+        Load the store from the primary's last saved file and position the cursor after its checkpoint
+        """
+        sequence = read_checkpoint(self.directory)
+        self.store.load_from_primary()
+        with self._applied:
+            self.cursor = LogCursor(self.directory, sequence)
+            self._applied.notify_all()
+        logger.info(f"Replica loaded the primary's store at log sequence {sequence}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._follow, name='vector-log-follower', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def poll(self) -> int:
+        """
+        Apply the records appended since the last poll and return how many
+        """
+        applied = 0
+        while True:
+            try:
+                records = self.cursor.read()
+            except LogTruncatedError as e:
+                logger.warning(f"{str(e)}; reloading the replica from the primary's store")
+                self.bootstrap()
+                if self.on_change:
+                    self.on_change([], [], True)
+                continue
+            if not records:
+                break
+            upserted, deleted, reset = self.store.apply_log_records(records)
+            applied += len(records)
+            self.last_written_at = records[-1][1]
+            if self.on_change:
+                self.on_change(upserted, deleted, reset)
+            with self._applied:
+                self._applied.notify_all()
+
+        self.caught_up_at = time.time()
+        metrics.set_gauge('vector_replica_applied_sequence', self.applied_sequence)
+        metrics.set_gauge('vector_replica_lag_seconds', 0.0)
+        return applied
+
+    def wait_for(self, sequence: int, timeout: float) -> bool:
+        """
+        Block until the mutation with the given sequence is applied; returns False on timeout
+        """
+        with self._applied:
+            return self._applied.wait_for(lambda: self.applied_sequence >= sequence, timeout)
+
+    def get_status(self) -> Dict[str, Any]:
+        lag = time.time() - self.caught_up_at if self.caught_up_at else None
+        return {
+            'role': 'replica',
+            'log_dir': self.directory,
+            'applied_sequence': self.applied_sequence,
+            # Every mutation written before this long ago has been applied
+            'lag_seconds': round(lag, 3) if lag is not None else None,
+            'last_applied_written_at': self.last_written_at
+        }
+
+    def _follow(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error following vector log {self.directory}: {str(e)}")
+                if self.caught_up_at:
+                    metrics.set_gauge('vector_replica_lag_seconds', time.time() - self.caught_up_at)
+            self._stop.wait(self.poll_interval)
@@ -0,0 +1,100 @@
+"""
+Shard process for ShardedVectorDatabaseService.
+
+Owns one VectorDatabaseService and answers requests from the parent over a
+Unix socket. Launched with `python -m src.services.vector_shard_server`; it
+exits when the parent closes the connection.
+"""
+
+import os
+import sys
+import logging
+import argparse
+from multiprocessing.connection import Listener
+from typing import List, Tuple, Any
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.services.vector_db_service import VectorDatabaseService
+from src.services.sharded_vector_db_service import shard_for
+
+logger = logging.getLogger(__name__)
+
+class ShardServer:
+    """
+    Dispatches requests to the shard's local store
+    """
+
+    # Store methods the parent may call directly
+    STORE_METHODS = {
+        'add_vectors_batch', 'search_similar_batch', 'get_vector', 'get_vector_ids',
+        'delete_vectors', 'clear_database', 'get_stats', 'save_vectors', 'warm_up'
+    }
+
+    def __init__(self, storage_path: str):
+        self.store = VectorDatabaseService(storage_path=storage_path)
+
+    def handle(self, method: str, args: tuple, kwargs: dict) -> Any:
+        if method in self.STORE_METHODS:
+            return getattr(self.store, method)(*args, **kwargs)
+        if method == 'get_vectors':
+            return self.get_vectors(*args, **kwargs)
+        if method == 'extract_misplaced':
+            return self.extract_misplaced(*args, **kwargs)
+        raise ValueError(f"Unknown shard method: {method}")
+
+    def get_vectors(self, vector_ids: List[str]) -> list:
+        """
+        Get several entries at once, skipping unknown ids
+        """
+        entries = (self.store.get_vector(vector_id) for vector_id in vector_ids)
+        return [entry for entry in entries if entry is not None]
+
+    def extract_misplaced(self, shard_index: int, shard_count: int, limit: int) -> List[Tuple[str, str, List[float], dict]]:
+        """
+        Remove and return up to limit entries that belong to another shard under shard_count shards
+        """
+        misplaced = []
+        for vector_id in self.store.get_vector_ids():
+            if shard_for(vector_id, shard_count) != shard_index:
+                entry = self.store.get_vector(vector_id)
+                misplaced.append((entry.id, entry.text, entry.embedding, entry.metadata))
+                if len(misplaced) >= limit:
+                    break
+        self.store.delete_vectors([entry[0] for entry in misplaced], persist=False)
+        return misplaced
+
+    def serve(self, listener: Listener):
+        connection = listener.accept()
+        while True:
+            try:
+                method, args, kwargs = connection.recv()
+            except (EOFError, OSError):
+                break  # Parent went away
+            try:
+                result = self.handle(method, args, kwargs)
+                response = ('ok', result, len(self.store.vectors))
+            except Exception as e:
+                logger.error(f"Error handling shard request {method}: {str(e)}")
+                response = ('error', str(e), len(self.store.vectors))
+            connection.send(response)
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector store shard process")
+    parser.add_argument('--socket', required=True, help="Unix socket path to listen on")
+    parser.add_argument('--storage', required=True, help="Pickle file holding this shard's vectors")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s | %(levelname)s | shard | %(message)s')
+    authkey = bytes.fromhex(os.environ['VECTOR_SHARD_AUTHKEY'])
+
+    # Listen before loading so the parent can connect while the shard loads its vectors
+    with Listener(args.socket, family='AF_UNIX', authkey=authkey) as listener:
+        ShardServer(args.storage).serve(listener)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Tests for extracting the full bodies of JavaScript, TypeScript and Java declarations.
+
+Run from codewhisperer-backend with: python -m pytest tests
+"""
+from src.services.code_lexer import CodeBlockLexer
+
+
+def extract(source: str, language: str) -> dict:
+    blocks = CodeBlockLexer().extract_blocks(source, language)
+    names = [block['name'] for block in blocks]
+    assert len(names) == len(set(names)), names
+    return {block['name']: block for block in blocks}
+
+def span(source: str, first: str, last: str) -> str:
+    """
+    The source from the start of first up to the end of the first last after it
+    """
+    start = source.index(first)
+    return source[start:source.index(last, start) + len(last)]
+
+
+JS_LITERALS = r'''
+/** Parses a route. */
+export function parse(path) {
+  const open = "{"; const close = '}';
+  const escaped = "\"}\\";
+  // a } in a comment
+  /* and { here */
+  const label = `${path.split('/').map(p => `{${p}}`).join('/')} }`;
+  const nested = `${ { key: `}` }.key }{`;
+  return label + nested + open + close + escaped;
+}
+
+function after() { return 1; }
+'''
+
+def test_js_strings_comments_and_templates_do_not_end_a_body():
+    blocks = extract(JS_LITERALS, 'javascript')
+    assert blocks['parse']['content'] == span(JS_LITERALS, '/** Parses', 'escaped;\n}')
+    assert (blocks['parse']['line_start'], blocks['parse']['line_end']) == (2, 11)
+    assert blocks['after']['content'] == 'function after() { return 1; }'
+    assert blocks['after']['line_start'] == 13
+
+
+JS_REGEX = r'''
+function scale(width, height, s) {
+  const half = width / 2; if (s) { height = height / 3; }
+  const braces = /[{}]\/+/g;
+  if (/}/.test(s)) { return half; }
+  if (!s) return /}/g;
+  return typeof s === 'string' ? s.replace(/\{(\w+)\}/g, '') : /{/;
+}
+
+function next() { return 2; }
+'''
+
+def test_js_regex_literals_and_divisions_are_told_apart():
+    blocks = extract(JS_REGEX, 'javascript')
+    assert blocks['scale']['content'] == span(JS_REGEX, 'function scale', ": /{/;\n}")
+    assert blocks['next']['content'] == 'function next() { return 2; }'
+
+
+JS_CLASS = '''
+const add = (a, b) => a + b;
+
+const handler = async (req) => {
+  return req.body.items.filter(x => x.size / 2 > 1);
+};
+
+class Router extends Base {
+  #routes = {};
+  static create(options = {}) { return new Router(options); }
+  get size() { return Object.keys(this.#routes).length; }
+  handle = (req) => { return this.#routes[req.path]; };
+  #match(path) {
+    for (const key in this.#routes) { if (key === path) { return key; } }
+    return null;
+  }
+}
+'''
+
+def test_js_classes_are_outlined_and_their_methods_extracted_whole():
+    blocks = extract(JS_CLASS, 'javascript')
+    assert blocks['add']['content'] == 'const add = (a, b) => a + b;'
+    assert blocks['handler']['content'] == span(JS_CLASS, 'const handler', '> 1);\n}')
+    assert blocks['create']['content'] == 'static create(options = {}) { return new Router(options); }'
+    assert blocks['size']['content'] == 'get size() { return Object.keys(this.#routes).length; }'
+    assert blocks['handle']['content'] == 'handle = (req) => { return this.#routes[req.path]; }'
+    assert blocks['#match']['content'] == span(JS_CLASS, '#match(path)', 'return null;\n  }')
+    assert {blocks[name]['type'] for name in ('create', 'size', 'handle', '#match')} == {'method'}
+
+    assert blocks['Router']['type'] == 'class'
+    assert blocks['Router']['content'] == (
+        'class Router extends Base {\n'
+        '  #routes = {};\n'
+        '  static create(options = {}) { ... }\n'
+        '  get size() { ... }\n'
+        '  handle = (req) => { ... };\n'
+        '  #match(path) { ... }\n'
+        '}'
+    )
+
+
+TS_SOURCE = r'''
+interface Options { retries: number; onError?: (e: Error) => void }
+
+export function identity<T>(arg: T): T {
+  return arg;
+}
+
+export const fetcher = async <T,>(url: string): Promise<T> => {
+  const res = await fetch(url);
+  return (await res.json()) as T;
+};
+
+@Component({ selector: 'app' })
+export class App implements OnInit {
+  private readonly cache: Map<string, { id: number }> = new Map();
+  async load<K extends keyof Options>(key: K): Promise<Options[K]> {
+    const total = this.cache.size / 2; const pattern = /\{(\w+)\}/g;
+    return this.http.get(`/api/${key}/${total}`).toPromise();
+  }
+}
+'''
+
+def test_ts_generics_and_decorators():
+    blocks = extract(TS_SOURCE, 'typescript')
+    assert blocks['Options']['type'] == 'interface'
+    assert blocks['identity']['content'] == span(TS_SOURCE, 'export function identity', 'return arg;\n}')
+    assert blocks['fetcher']['content'] == span(TS_SOURCE, 'export const fetcher', 'as T;\n}')
+    assert blocks['load']['content'] == span(TS_SOURCE, 'async load', 'toPromise();\n  }')
+    assert blocks['App']['content'].startswith("@Component({ selector: 'app' })\nexport class App")
+    assert 'Map<string, { id: number }> = new Map();' in blocks['App']['content']
+    assert 'Promise<Options[K]> { ... }\n}' in blocks['App']['content']
+
+
+JAVA_SOURCE = r'''package demo;
+
+/**
+ * Renders templates.
+ */
+@Service
+public class Renderer<T extends Comparable<T>> implements Supplier<Map<String, List<T>>> {
+    private static final String TEMPLATE = """
+        { "name": "%s",
+        \"""}
+        """;
+    private final Thread worker = new Thread() {
+        public void run() { poll(); }
+    };
+    private final Comparator<String> order = new Comparator<String>() {
+        @Override
+        public int compare(String a, String b) { return a.compareTo(b); }
+    };
+
+    public Renderer() { this.cache = new HashMap<>(); }
+
+    @Override
+    public Map<String, List<T>> get() {
+        Runnable task = new Runnable() {
+            public void run() { System.out.println("}"); }
+        };
+        char brace = '{';
+        return build(x -> { return x; });
+    }
+
+    static <K, V extends List<K>> Map<K, V> index(Collection<V> values) throws IOException {
+        if (values.isEmpty()) { throw new IllegalStateException("{"); }
+        return values.stream().collect(toMap(v -> v.get(0), v -> v));
+    }
+}
+'''
+
+def test_java_text_blocks_generics_and_anonymous_classes():
+    blocks = CodeBlockLexer().extract_blocks(JAVA_SOURCE, 'java')
+    # The anonymous classes' compare and run methods are not methods of Renderer, nor is Thread
+    assert [(block['type'], block['name']) for block in blocks] == [
+        ('class', 'Renderer'), ('method', 'Renderer'), ('method', 'get'), ('method', 'index')
+    ]
+
+    renderer, constructor, get, index = blocks
+    assert constructor['content'] == 'public Renderer() { this.cache = new HashMap<>(); }'
+    assert get['content'] == span(JAVA_SOURCE, '@Override\n    public Map', 'return x; });\n    }')
+    assert (get['line_start'], get['line_end']) == (22, 29)
+    assert index['content'] == span(JAVA_SOURCE, 'static <K, V', 'v -> v));\n    }')
+
+    assert renderer['content'] == (
+        span(JAVA_SOURCE, '/**\n * Renders', 'compareTo(b); }\n    };\n') + '\n'
+        '    public Renderer() { ... }\n'
+        '\n'
+        '    @Override\n'
+        '    public Map<String, List<T>> get() { ... }\n'
+        '\n'
+        '    static <K, V extends List<K>> Map<K, V> index(Collection<V> values) throws IOException { ... }\n'
+        '}'
+    )
+    assert (renderer['line_start'], renderer['line_end']) == (3, 35)
+
+
+def test_java_nested_types_keep_their_own_outline():
+    source = '''class Outer {
+    enum Mode { FAST { int cost() { return 1; } }, SLOW; }
+    record Pair<A, B>(A first, B second) {
+        Pair { Objects.requireNonNull(first); }
+    }
+    static class Inner {
+        void run() { if (ready) { go(); } }
+    }
+}
+'''
+    blocks = CodeBlockLexer().extract_blocks(source, 'java')
+    by_name = {block['name']: block for block in blocks}
+    assert by_name['Mode']['content'] == 'enum Mode { FAST { int cost() { return 1; } }, SLOW; }'
+    assert by_name['Pair']['type'] == 'record'
+    assert by_name['run']['content'] == 'void run() { if (ready) { go(); } }'
+    assert by_name['Inner']['content'] == 'static class Inner {\n        void run() { ... }\n    }'
+    # A body is elided by its nearest enclosing type, so Outer elides Inner whole
+    assert by_name['Outer']['content'] == (
+        'class Outer {\n'
+        '    enum Mode { ... }\n'
+        '    record Pair<A, B>(A first, B second) { ... }\n'
+        '    static class Inner { ... }\n'
+        '}'
+    )
+
+
+def test_truncated_source_runs_to_the_end():
+    source = 'function open(a) {\n  if (a) {\n    return `${a'
+    [block] = CodeBlockLexer().extract_blocks(source, 'javascript')
+    assert (block['name'], block['content'], block['line_end']) == ('open', source, 3)
+
+def test_unsupported_languages_and_empty_sources_yield_nothing():
+    lexer = CodeBlockLexer()
+    assert lexer.extract_blocks('def f():\n    return 1\n', 'python') == []
+    assert lexer.extract_blocks('', 'java') == []
@@ -0,0 +1,159 @@
+"""
+Tests for re-embedding into a shadow index, swapping it in and rolling back.
+
+Run from codewhisperer-backend with: python -m pytest tests
+"""
+import json
+import threading
+import numpy as np
+import pytest
+from flask import Flask
+from src.models.user import db
+from src.models.document import Document, DocumentChunk
+from src.services.document_store_service import DocumentStoreService
+from src.services.embedding_migration_service import EmbeddingMigrationService, IndexManifest, create_embedding_service
+from src.services.text_store_service import TextStore
+from src.services.vector_collections import MODEL_KEY
+from src.services.vector_db_service import VectorDatabaseService
+
+
+class ServingIndex:
+    """
+    The part of RAGService a migration uses: the active index, its manifest and the write lock
+    """
+
+    def __init__(self, directory, embedding_service, vector_db):
+        self.index_manifest = IndexManifest(str(directory / 'vector_index.json'))
+        self.text_store = TextStore(str(directory / 'text_store'))
+        self.write_lock = threading.RLock()
+        self.previous_index = None
+        self.index_version = 0
+        self._index = (embedding_service, vector_db)
+
+    @property
+    def embedding_service(self):
+        return self._index[0]
+
+    @property
+    def vector_db(self):
+        return self._index[1]
+
+    @property
+    def embedding_model(self) -> str:
+        return self.embedding_service.model
+
+    def wait_until_loaded(self, timeout: float = None) -> bool:
+        return True
+
+    def activate_index(self, embedding_service, vector_db, version: int):
+        with self.write_lock:
+            self.previous_index = self._index
+            self._index = (embedding_service, vector_db)
+            self.index_version = version
+
+
+TEXTS = [f"def handler_{i}(request): return render(request, 'page_{i}.html')" for i in range(12)]
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    for variable in ('VECTOR_ROLE', 'VECTOR_SHARDS', 'VECTOR_SHARED_MEMORY'):
+        monkeypatch.delenv(variable, raising=False)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'app.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+@pytest.fixture
+def serving(tmp_path, app):
+    """
+    A knowledge base of TEXTS embedded with local-ngram-64, in the vector store and in SQL
+    """
+    embedding_service = create_embedding_service('local-ngram-64')
+    vector_db = VectorDatabaseService(storage_path=str(tmp_path / 'vectors.pkl'), autoload=False)
+    vector_ids = vector_db.add_vectors_batch([
+        (text, embedding, {'source_type': 'code', MODEL_KEY: 'local-ngram-64'})
+        for text, embedding in zip(TEXTS, embedding_service.create_embeddings_batch(TEXTS))
+    ])
+    document = Document(source_type='code', source_url='repo', title='views.py', content='\n'.join(TEXTS))
+    db.session.add(document)
+    db.session.flush()
+    document_store = DocumentStoreService(db)
+    for index, (text, vector_id) in enumerate(zip(TEXTS, vector_ids)):
+        db.session.add(DocumentChunk(document_id=document.id, chunk_text=text, chunk_index=index,
+                                     embedding_id=vector_id,
+                                     embedding=document_store.encode_embedding(vector_db.get_vector(vector_id).embedding),
+                                     chunk_metadata=json.dumps({MODEL_KEY: 'local-ngram-64'})))
+    db.session.commit()
+    return ServingIndex(tmp_path, embedding_service, vector_db)
+
+def migrate(app, serving, model: str) -> EmbeddingMigrationService:
+    migration = EmbeddingMigrationService(serving, DocumentStoreService(db), texts_per_minute=0)
+    migration.start(app, model)
+    assert migration.wait(timeout=30)
+    assert migration.status['state'] == 'ready', migration.status
+    return migration
+
+def chunk_embedding_sizes() -> set:
+    rows = db.session.execute(db.select(DocumentChunk.embedding, DocumentChunk.chunk_metadata)).all()
+    return {(len(np.frombuffer(embedding, dtype=np.float32)), json.loads(metadata)[MODEL_KEY])
+            for embedding, metadata in rows}
+
+
+def test_swap_catches_up_writes_made_during_the_migration(app, serving):
+    old_store = serving.vector_db
+    migration = migrate(app, serving, 'local-ngram-32')
+    assert serving.embedding_model == 'local-ngram-64'  # Queries keep using the active index until the swap
+    assert migration.get_status()['embedded'] == len(TEXTS)
+
+    # Written to the active index after the shadow was filled
+    added = old_store.add_vectors_batch([('a late chunk', create_embedding_service('local-ngram-64').create_embedding(
+        'a late chunk'), {'source_type': 'docs', MODEL_KEY: 'local-ngram-64'})])
+    removed = old_store.get_vector_ids()[0]
+    old_store.delete_vector(removed)
+
+    result = migration.swap()
+    assert (result['caught_up'], result['removed'], result['chunks_updated']) == (1, 1, len(TEXTS) - 1)
+    assert result['version'] == 1 and serving.index_version == 1
+    assert serving.embedding_model == 'local-ngram-32'
+    assert serving.previous_index[1] is old_store
+
+    new_store = serving.vector_db
+    assert sorted(new_store.get_vector_ids()) == sorted(old_store.get_vector_ids())
+    assert new_store.get_vector(added[0]).metadata[MODEL_KEY] == 'local-ngram-32'
+    assert {len(entry.embedding) for entry in new_store.iter_entries()} == {32}
+    query = create_embedding_service('local-ngram-32').create_embedding(TEXTS[5])
+    assert new_store.search_similar(query, top_k=1)[0]['text'] == TEXTS[5]
+
+    manifest = serving.index_manifest.read()
+    assert manifest['active'] == {'model': 'local-ngram-32', 'storage_path': new_store.storage_path}
+    assert manifest['previous']['model'] == 'local-ngram-64'
+    assert manifest['pending'] is None
+    assert chunk_embedding_sizes() == {(32, 'local-ngram-32'), (64, 'local-ngram-64')}  # The deleted chunk's vector is gone
+
+def test_rollback_serves_the_replaced_index_again(app, serving):
+    old_store = serving.vector_db
+    migration = migrate(app, serving, 'local-ngram-32')
+    migration.swap()
+    added = serving.vector_db.add_vectors_batch([('written after the swap',
+                                                  create_embedding_service('local-ngram-32').create_embedding('x'),
+                                                  {'source_type': 'docs', MODEL_KEY: 'local-ngram-32'})])
+
+    result = migration.rollback()
+    assert result['version'] == 2 and result['caught_up'] == 1
+    assert serving.embedding_model == 'local-ngram-64'
+    assert serving.vector_db is old_store  # Still loaded, so switched back without reading it again
+    assert len(old_store.get_vector(added[0]).embedding) == 64
+    assert serving.index_manifest.read()['active']['model'] == 'local-ngram-64'
+    assert chunk_embedding_sizes() == {(64, 'local-ngram-64')}
+
+def test_swap_and_rollback_refuse_without_an_index_to_switch_to(app, serving):
+    migration = EmbeddingMigrationService(serving, DocumentStoreService(db), texts_per_minute=0)
+    with pytest.raises(ValueError):
+        migration.swap()
+    with pytest.raises(ValueError):
+        migration.rollback()
+    with pytest.raises(ValueError):
+        migration.start(app, 'local-ngram-64')  # Already serving
@@ -0,0 +1,95 @@
+"""
+Tests for the vector store partitioned across shard processes.
+
+Run from codewhisperer-backend with: python -m pytest tests
+"""
+import os
+import random
+import pytest
+from src.services.sharded_vector_db_service import ShardedVectorDatabaseService, shard_for
+from src.services.vector_db_service import VectorDatabaseService
+
+
+def random_entries(count: int, dimension: int = 8, seed: int = 7):
+    rng = random.Random(seed)
+    return [(f"text {i}", [rng.uniform(-1, 1) for _ in range(dimension)],
+             {'source_type': 'code' if i % 3 else 'docs'}) for i in range(count)]
+
+@pytest.fixture
+def open_stores():
+    stores = []
+    yield stores
+    for store in stores:
+        store.close()
+
+def open_sharded(open_stores: list, shard_count: int, storage_dir: str, **kwargs) -> ShardedVectorDatabaseService:
+    store = ShardedVectorDatabaseService(shard_count, storage_dir=storage_dir, **kwargs)
+    open_stores.append(store)
+    return store
+
+def shard_contents(store: ShardedVectorDatabaseService) -> list:
+    return [set(store._call(index, 'get_vector_ids')) for index in range(len(store._shards))]
+
+
+def test_shard_for_moves_only_ids_the_new_shard_takes():
+    vector_ids = [f"id-{i}" for i in range(4000)]
+    before = {vector_id: shard_for(vector_id, 4) for vector_id in vector_ids}
+    after = {vector_id: shard_for(vector_id, 5) for vector_id in vector_ids}
+
+    moved = [vector_id for vector_id in vector_ids if before[vector_id] != after[vector_id]]
+    assert all(after[vector_id] == 4 for vector_id in moved)
+    assert 0.15 < len(moved) / len(vector_ids) < 0.25
+    assert set(before.values()) == {0, 1, 2, 3}
+
+def test_search_matches_a_single_store(tmp_path, open_stores):
+    entries = random_entries(90)
+    vector_ids = [f"v{i}" for i in range(len(entries))]
+    single = VectorDatabaseService(storage_path=str(tmp_path / 'single.pkl'), autoload=False)
+    single.add_vectors_batch(entries, vector_ids=vector_ids)
+    sharded = open_sharded(open_stores, 3, str(tmp_path / 'shards'))
+    sharded.add_vectors_batch(entries, vector_ids=vector_ids)
+
+    assert all(shard_contents(sharded))  # Every shard holds some of them
+    queries = [embedding for _, embedding, _ in random_entries(5, seed=11)]
+    for source_type in (None, 'docs'):
+        expected = single.search_similar_batch(queries, top_k=7, source_type_filter=source_type)
+        found = sharded.search_similar_batch(queries, top_k=7, source_type_filter=source_type)
+        for expected_hits, found_hits in zip(expected, found):
+            assert [hit['id'] for hit in found_hits] == [hit['id'] for hit in expected_hits]
+            assert [hit['similarity'] for hit in found_hits] == pytest.approx(
+                [hit['similarity'] for hit in expected_hits], abs=1e-6)
+
+    assert sharded.delete_vectors(vector_ids[:10]) == 10
+    assert sorted(sharded.get_vector_ids()) == sorted(vector_ids[10:])
+    assert sharded.get_vector('v42').text == 'text 42'
+
+def test_changed_shard_count_rebalances_on_load(tmp_path, open_stores):
+    storage_dir = str(tmp_path / 'shards')
+    entries = random_entries(120)
+    vector_ids = [f"v{i}" for i in range(len(entries))]
+    store = open_sharded(open_stores, 2, storage_dir)
+    store.add_vectors_batch(entries, vector_ids=vector_ids)
+    store.close()
+
+    grown = open_sharded(open_stores, 3, storage_dir)
+    contents = shard_contents(grown)
+    assert len(contents) == 3
+    for index, shard_ids in enumerate(contents):
+        assert all(shard_for(vector_id, 3) == index for vector_id in shard_ids)
+    assert set().union(*contents) == set(vector_ids)
+    grown.close()
+
+    shrunk = open_sharded(open_stores, 2, storage_dir)
+    assert len(shard_contents(shrunk)) == 2
+    assert sorted(shrunk.get_vector_ids()) == sorted(vector_ids)
+    assert not os.path.exists(os.path.join(storage_dir, 'shard-2.pkl'))
+    assert shrunk.get_vector('v7').embedding == pytest.approx(entries[7][1])
+
+def test_unsharded_storage_is_imported_on_first_load(tmp_path, open_stores):
+    legacy_path = str(tmp_path / 'vectors.pkl')
+    legacy = VectorDatabaseService(storage_path=legacy_path, autoload=False)
+    vector_ids = legacy.add_vectors_batch(random_entries(30))
+
+    store = open_sharded(open_stores, 2, str(tmp_path / 'shards'), legacy_storage_path=legacy_path)
+    assert sorted(store.get_vector_ids()) == sorted(vector_ids)
+    assert store.get_stats()['total_vectors'] == 30
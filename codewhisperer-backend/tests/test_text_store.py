@@ -0,0 +1,125 @@
+"""
+Tests for compacting the text store and for reconciliation deciding when to compact it.
+
+Run from codewhisperer-backend with: python -m pytest tests
+"""
+import threading
+from types import SimpleNamespace
+import pytest
+from src.services.reconciliation_service import ReconciliationService
+from src.services.text_store_service import TEXT_REF_KEY, TextStore
+from src.services.vector_db_service import VectorDatabaseService
+
+
+SOURCE = "def handler(request):\n    return render(request, 'index.html')\n" * 40
+LOOSE = "a chunk stored on its own " * 30
+
+@pytest.fixture
+def store_dir(tmp_path):
+    return str(tmp_path / 'text_store')
+
+def entry_for(ref):
+    return ('', [1.0, 0.0], {'source_type': 'code', TEXT_REF_KEY: list(ref)})
+
+
+def test_compact_keeps_the_other_blobs_readable(store_dir):
+    store = TextStore(store_dir)
+    dropped = store.put('text nothing refers to any more ' * 50)
+    source_ref, loose_ref = store.put_chunks([SOURCE[10:60], LOOSE], source_text=SOURCE)
+    size = store.get_stats()['stored_bytes']
+
+    result = store.compact([dropped, 'ff' * 32])  # Unknown ids are ignored
+    assert result['blobs_removed'] == 1
+    assert result['reclaimed_bytes'] == size - store.get_stats()['stored_bytes'] > 0
+    assert store.blob_ids() == {source_ref[0], loose_ref[0]}
+    assert store.get(source_ref) == SOURCE[10:60] and store.get(loose_ref) == LOOSE
+    with pytest.raises(KeyError):
+        store.get((dropped, 0, 5))
+
+    reopened = TextStore(store_dir)
+    assert reopened.get(source_ref) == SOURCE[10:60]
+    assert store.compact([dropped]) == {'blobs_removed': 0, 'reclaimed_bytes': 0}
+
+def test_reader_with_a_stale_index_reads_again_after_another_process_compacted(store_dir):
+    writer = TextStore(store_dir)
+    dropped = writer.put('written first, so every later block moves ' * 50)
+    kept = writer.put(LOOSE)
+    reader = TextStore(store_dir, cache_size=0)  # Index read before the compaction, nothing cached
+    stale_location = reader._index[bytes.fromhex(kept)]
+
+    writer.compact([dropped])
+    assert writer._index[bytes.fromhex(kept)] != stale_location
+    # The stale offset now lands in the rewritten data: the block fails its digest and the index is re-read
+    assert reader._read_block(bytes.fromhex(kept), stale_location) is None
+    assert reader.get((kept, 0, 7)) == LOOSE[:7]
+    assert reader._index[bytes.fromhex(kept)] == writer._index[bytes.fromhex(kept)]
+
+def test_stale_writer_appends_to_the_compacted_files(store_dir):
+    writer = TextStore(store_dir)
+    stale = TextStore(store_dir)
+    dropped = writer.put('soon gone ' * 80)
+    kept = writer.put(LOOSE)
+    stale.blob_ids()  # Has read the index before the compaction
+    writer.compact([dropped])
+
+    # Re-storing the dropped text must not be skipped as already present, and lands in the new files
+    assert stale.put_many(['soon gone ' * 80, 'new text'])[0] == dropped
+    for store in (writer, TextStore(store_dir)):
+        assert store.get((dropped, 0, 9)) == 'soon gone'
+        assert store.get((kept, 0, 7)) == LOOSE[:7]
+    assert len(TextStore(store_dir).blob_ids()) == 3
+
+def test_concurrent_readers_see_every_kept_blob_during_compactions(store_dir):
+    writer = TextStore(store_dir)
+    kept = [writer.put(f"kept text {i} " * 40) for i in range(20)]
+    errors = []
+
+    def read():
+        reader = TextStore(store_dir, cache_size=0)
+        for _ in range(30):
+            for i, blob_id in enumerate(kept):
+                try:
+                    assert reader.get((blob_id, 0, 12)) == f"kept text {i} "[:12]
+                except Exception as e:
+                    errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for thread in readers:
+        thread.start()
+    for round_number in range(10):
+        writer.compact([writer.put(f"garbage {round_number} " * 60)])
+    for thread in readers:
+        thread.join()
+    assert errors == []
+
+def test_reconciliation_compacts_only_where_one_process_holds_every_vector(tmp_path, store_dir, monkeypatch):
+    for variable in ('TEXT_COMPACTION', 'VECTOR_LOG_DIR'):
+        monkeypatch.delenv(variable, raising=False)
+    text_store = TextStore(store_dir)
+    garbage = text_store.put('restored elsewhere, referenced by another worker ' * 40)
+    storage_path = str(tmp_path / 'vectors.pkl')
+
+    def reconciliation(vector_db):
+        vector_db.add_vectors_batch([entry_for(text_store.put_chunks([LOOSE])[0])])
+        rag_service = SimpleNamespace(text_store=text_store, vector_db=vector_db, previous_index=None,
+                                      write_lock=threading.RLock())
+        return ReconciliationService(rag_service, SimpleNamespace(db=None))
+
+    # Each worker loads its own store: the others' vectors are not in this one
+    worker = reconciliation(VectorDatabaseService(storage_path=storage_path, autoload=False))
+    assert worker._compact_text_store(evict_immediately=True) == (0, 0)
+    assert garbage in text_store.blob_ids()
+
+    monkeypatch.setenv('TEXT_COMPACTION', 'true')  # Declared the only worker
+    assert reconciliation(VectorDatabaseService(storage_path=storage_path, autoload=False)
+                          )._compact_text_store(evict_immediately=True)[0] == 1
+    assert garbage not in text_store.blob_ids()
+
+    monkeypatch.delenv('TEXT_COMPACTION')
+    garbage = text_store.put('dropped by the primary ' * 40)
+    primary = reconciliation(VectorDatabaseService(storage_path=storage_path, replication='primary'))
+    primary.text_compaction_ratio = 0
+    assert primary._compact_text_store(evict_immediately=False) == (0, 0)  # Suspected on the first pass only
+    assert primary._compact_text_store(evict_immediately=False)[0] == 1
+    assert text_store.blob_ids() == {entry.metadata[TEXT_REF_KEY][0]
+                                     for entry in primary.rag_service.vector_db.iter_entries()}
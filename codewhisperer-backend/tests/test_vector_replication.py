@@ -0,0 +1,197 @@
+"""
+Tests for the vector store mutation log and the primary/replica stores built on it.
+
+Run from codewhisperer-backend with: python -m pytest tests
+"""
+import os
+import pytest
+from src.services.vector_db_service import VectorDatabaseService
+from src.services.vector_replication import (
+    OP_DELETE, OP_UPSERT, RECORD, LogCursor, LogTruncatedError, ReplicationLog, decode_upsert, encode_upsert,
+    log_dir_for, read_checkpoint
+)
+
+
+def upsert(log: ReplicationLog, vector_id: str, text: str = 'text') -> int:
+    return log.append(OP_UPSERT, *encode_upsert([vector_id], [(text, [1.0, 0.5], {'source_type': 'docs'})]))
+
+def read_all(cursor: LogCursor) -> list:
+    records = []
+    while True:
+        batch = cursor.read()
+        if not batch:
+            return records
+        records.extend(batch)
+
+@pytest.fixture
+def storage_path(tmp_path, monkeypatch):
+    monkeypatch.delenv('VECTOR_LOG_DIR', raising=False)
+    monkeypatch.setenv('VECTOR_LOG_SEGMENT_BYTES', '1')  # Every checkpoint starts a new segment
+    return str(tmp_path / 'vectors.pkl')
+
+def entry(vector_id: str, x: float = 1.0):
+    return (f"text of {vector_id}", [x, 1.0 - x], {'source_type': 'docs'})
+
+
+def test_records_read_back_in_order_across_rotation(tmp_path):
+    log = ReplicationLog(str(tmp_path), segment_bytes=1)
+    for i in range(3):
+        upsert(log, f"a{i}")
+    log.checkpoint(0)  # The segment is over its size: rotate, but prune nothing
+    for i in range(3):
+        upsert(log, f"b{i}")
+    log.append(OP_DELETE, {'ids': ['a0']})
+
+    cursor = LogCursor(str(tmp_path))
+    assert cursor.segments() == [1, 4]
+    records = read_all(cursor)
+    assert [record[0] for record in records] == list(range(1, 8))
+    assert [decode_upsert(record[3], record[4])[0][0] for record in records[:6]] == ['text'] * 6
+    assert [record[3]['ids'] for record in records] == [['a0'], ['a1'], ['a2'], ['b0'], ['b1'], ['b2'], ['a0']]
+    assert records[-1][2] == OP_DELETE
+    assert cursor.sequence == 7 and log.sequence == 7
+
+def test_partially_written_record_is_read_once_complete(tmp_path):
+    log = ReplicationLog(str(tmp_path))
+    upsert(log, 'a')
+    segment_path = LogCursor(str(tmp_path)).segment_path(1)
+    upsert(log, 'b')
+    with open(segment_path, 'rb') as f:
+        data = f.read()
+    first_size = RECORD.size + sum(RECORD.unpack_from(data)[3:5])
+    second = data[first_size:]
+
+    for cut in (RECORD.size - 1, RECORD.size + 3, len(second) - 1):  # Inside the header, the JSON, the vectors
+        with open(segment_path, 'wb') as f:
+            f.write(data[:first_size] + second[:cut])
+        cursor = LogCursor(str(tmp_path))
+        assert [record[0] for record in cursor.read()] == [1]
+        assert cursor.read() == []
+
+        with open(segment_path, 'ab') as f:
+            f.write(second[cut:])
+        assert [record[3]['ids'] for record in cursor.read()] == [['b']]
+
+def test_record_torn_by_a_crashed_writer_is_cut_off_before_the_next_append(tmp_path):
+    log = ReplicationLog(str(tmp_path))
+    upsert(log, 'a')
+    upsert(log, 'b')
+    segment_path = LogCursor(str(tmp_path)).segment_path(1)
+    with open(segment_path, 'rb') as f:
+        data = f.read()
+    first_size = RECORD.size + sum(RECORD.unpack_from(data)[3:5])
+    second = data[first_size:]
+    garbled = second[:RECORD.size] + b'\0' * (len(second) - RECORD.size)  # Sized right, body never written
+
+    for torn in (second[:RECORD.size + 3], garbled):
+        with open(segment_path, 'wb') as f:
+            f.write(data[:first_size] + torn)
+        cursor = LogCursor(str(tmp_path))
+        assert [record[0] for record in cursor.read()] == [1]
+
+        restarted = ReplicationLog(str(tmp_path))  # The primary's next start, or another writer
+        assert restarted.sequence == 1
+        assert os.path.getsize(segment_path) == first_size
+        assert upsert(restarted, 'c') == 2
+        assert [(record[0], record[3]['ids']) for record in cursor.read()] == [(2, ['c'])]
+        assert [record[3]['ids'] for record in read_all(LogCursor(str(tmp_path)))] == [['a'], ['c']]
+
+def test_records_before_a_corrupt_one_are_returned(tmp_path):
+    log = ReplicationLog(str(tmp_path))
+    for vector_id in ('a', 'b', 'c'):
+        upsert(log, vector_id)
+    segment_path = LogCursor(str(tmp_path)).segment_path(1)
+    with open(segment_path, 'rb') as f:
+        data = f.read()
+    third = 2 * (RECORD.size + sum(RECORD.unpack_from(data)[3:5]))
+    with open(segment_path, 'r+b') as f:
+        f.seek(third + RECORD.size + 2)
+        f.write(b'#')
+
+    cursor = LogCursor(str(tmp_path))
+    assert [record[3]['ids'] for record in cursor.read()] == [['a'], ['b']]
+    with pytest.raises(ValueError):
+        cursor.read()
+    assert cursor.sequence == 2
+
+def test_corrupt_record_is_reported(tmp_path):
+    log = ReplicationLog(str(tmp_path))
+    upsert(log, 'a')
+    segment_path = LogCursor(str(tmp_path)).segment_path(1)
+    with open(segment_path, 'r+b') as f:
+        f.seek(RECORD.size + 2)
+        f.write(b'#')
+    with pytest.raises(ValueError):
+        LogCursor(str(tmp_path)).read()
+
+def test_pruned_records_raise_and_replica_rebootstraps(storage_path):
+    primary = VectorDatabaseService(storage_path=storage_path, replication='primary')
+    primary.add_vectors_batch([entry('a')], vector_ids=['a'])
+    replica = VectorDatabaseService(storage_path=storage_path, replication='replica')
+    assert set(replica.vectors) == {'a'}
+
+    for i in range(6):  # Each save checkpoints, rotates and prunes down to the retained segments
+        primary.add_vectors_batch([entry(f"v{i}", i / 10)], vector_ids=[f"v{i}"])
+    primary.delete_vectors(['a'])
+    assert LogCursor(log_dir_for(storage_path)).segments()[0] > 2
+
+    with pytest.raises(LogTruncatedError):
+        read_all(LogCursor(log_dir_for(storage_path), replica.follower.applied_sequence))
+
+    changes = []
+    replica.follower.on_change = lambda upserted, deleted, reset: changes.append(reset)
+    replica.follower.poll()
+    assert set(replica.vectors) == set(primary.vectors) == {f"v{i}" for i in range(6)}
+    assert replica.follower.applied_sequence == primary.logged_sequence
+    assert changes[0] is True  # Indexes kept alongside the store are rebuilt after the reload
+    assert replica.search_similar([0.5, 0.5], top_k=1)[0]['id'] == 'v5'
+
+def test_restarted_primary_replays_records_after_checkpoint(storage_path):
+    primary = VectorDatabaseService(storage_path=storage_path, replication='primary')
+    primary.add_vectors_batch([entry('a'), entry('b')], vector_ids=['a', 'b'])
+    checkpoint = read_checkpoint(log_dir_for(storage_path))
+    # Logged but never saved, as if the process died before its next save
+    primary.add_vectors_batch([entry('c', 0.2)], vector_ids=['c'], persist=False)
+    primary.delete_vectors(['a'], persist=False)
+    primary.add_vectors_batch([entry('b', 0.7)], vector_ids=['b'], persist=False)
+    assert read_checkpoint(log_dir_for(storage_path)) == checkpoint
+
+    restarted = VectorDatabaseService(storage_path=storage_path, replication='primary')
+    assert set(restarted.vectors) == {'b', 'c'}
+    assert restarted.vectors['b'].embedding == pytest.approx([0.7, 0.3])
+    assert restarted.logged_sequence == primary.logged_sequence
+
+    restarted.add_vectors_batch([entry('d')], vector_ids=['d'])
+    assert restarted.logged_sequence == primary.logged_sequence + 1
+
+def test_replaced_storage_is_reloaded_by_replicas_and_primaries(storage_path):
+    primary = VectorDatabaseService(storage_path=storage_path, replication='primary')
+    primary.add_vectors_batch([entry('old')], vector_ids=['old'])
+    replica = VectorDatabaseService(storage_path=storage_path, replication='replica')
+    primary.add_vectors_batch([entry('unsaved')], vector_ids=['unsaved'], persist=False)
+
+    rebuilt = VectorDatabaseService(storage_path=f"{storage_path}.rebuild", autoload=False)
+    rebuilt.add_vectors_batch([entry('new')], vector_ids=['new'])
+    os.replace(f"{storage_path}.rebuild", storage_path)
+    sequence = ReplicationLog(log_dir_for(storage_path)).record_reload()
+    assert read_checkpoint(log_dir_for(storage_path)) == sequence
+
+    replica.follower.poll()
+    assert set(replica.vectors) == {'new'}
+    assert set(VectorDatabaseService(storage_path=storage_path, replication='primary').vectors) == {'new'}
+
+def test_wait_for_sequence_returns_once_the_replica_applied_it(storage_path):
+    primary = VectorDatabaseService(storage_path=storage_path, replication='primary')
+    replica = VectorDatabaseService(storage_path=storage_path, replication='replica')
+    primary.add_vectors_batch([entry('a')], vector_ids=['a'])
+
+    assert replica.wait_for_sequence(primary.logged_sequence, timeout=0.05) is False
+    replica.follower.poll()
+    assert replica.wait_for_sequence(primary.logged_sequence, timeout=0.05) is True
+    assert replica.get_vector('a').text == 'text of a'
+
+def test_replica_rejects_writes(storage_path):
+    VectorDatabaseService(storage_path=storage_path, replication='primary')
+    replica = VectorDatabaseService(storage_path=storage_path, replication='replica')
+    with pytest.raises(RuntimeError):
+        replica.add_vectors_batch([entry('a')])